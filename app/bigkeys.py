@@ -0,0 +1,112 @@
+"""
+Find the biggest keys of a running server, like redis-cli --bigkeys / --memkeys.
+
+The keyspace is walked with SCAN, a few keys at a time, and every batch of
+keys is measured with pipelined TYPE and MEMORY USAGE. The server is never
+blocked for more than one SCAN step, so this is safe to run against a busy server.
+
+    python -m app.bigkeys --port 6379 [--count 100] [--samples 5] [--sleep 0.01]
+"""
+
+import argparse
+import asyncio
+
+from app.client import RedisClient
+
+
+class BigKeysReport:
+    """
+    Biggest key, key count and total size of every type
+    """
+
+    def __init__(self):
+        # Type -> (key, size in bytes)
+        self.biggest = {}
+        self.counts = {}
+        self.sizes = {}
+        self.scanned = 0
+
+    def add(self, key: str, value_type: str, size: int):
+        self.scanned += 1
+        self.counts[value_type] = self.counts.get(value_type, 0) + 1
+        self.sizes[value_type] = self.sizes.get(value_type, 0) + size
+
+        biggest = self.biggest.get(value_type)
+        if biggest is None or size > biggest[1]:
+            self.biggest[value_type] = (key, size)
+
+    def format(self) -> str:
+        lines = [f"Sampled {self.scanned} keys in the keyspace!"]
+
+        for value_type, (key, size) in sorted(self.biggest.items()):
+            lines.append(f"Biggest {value_type:>6} found '{key}' has {size} bytes")
+
+        for value_type, count in sorted(self.counts.items()):
+            average = self.sizes[value_type] / count
+            lines.append(
+                f"{count} {value_type}s with {self.sizes[value_type]} bytes "
+                f"(avg size {average:.2f} bytes)"
+            )
+
+        return "\n".join(lines)
+
+
+async def find_big_keys(client: RedisClient, count: int = 100, samples: int = 5, sleep: float = 0):
+    """
+    Scan the whole keyspace of the server and report the biggest keys of every type
+
+    Args:
+        count: COUNT of every SCAN call
+        samples: SAMPLES of MEMORY USAGE, entries of a stream its size is estimated from
+        sleep: Seconds to wait between SCAN calls, to go easier on the server
+    """
+
+    report = BigKeysReport()
+    cursor = "0"
+
+    while True:
+        cursor, keys = await client.execute("SCAN", cursor, "COUNT", str(count))
+
+        commands = []
+        for key in keys:
+            commands.append(["TYPE", key])
+            commands.append(["MEMORY", "USAGE", key, "SAMPLES", str(samples)])
+
+        replies = await asyncio.gather(*(client.send(command) for command in commands))
+
+        for idx, key in enumerate(keys):
+            (value_type, _), (size, _) = replies[2 * idx], replies[2 * idx + 1]
+            # Key was deleted in between
+            if value_type == "none" or not isinstance(size, int):
+                continue
+            report.add(key, value_type, size)
+
+        if cursor == "0":
+            return report
+
+        if sleep:
+            await asyncio.sleep(sleep)
+
+
+async def main(args):
+    client = RedisClient(args.host, args.port)
+    try:
+        report = await find_big_keys(client, args.count, args.samples, args.sleep)
+    finally:
+        client.close()
+
+    print(report.format())
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Find the biggest keys of a server")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--count", type=int, default=100, help="Keys per SCAN call. Default is 100")
+    parser.add_argument(
+        "--samples", type=int, default=5,
+        help="Entries of a stream its size is estimated from, 0 for all. Default is 5")
+    parser.add_argument("--sleep", type=float, default=0, help="Seconds to sleep between SCAN calls")
+
+    asyncio.run(main(parser.parse_args()))
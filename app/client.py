@@ -0,0 +1,132 @@
+import asyncio
+from collections import deque
+
+from app.exceptions import RedisException
+from app.serialiser import RedisEncoder, RedisStreamDecoder
+
+READ_SIZE = 64 * 1024
+
+# Connections to other nodes, shared by all clients of this server
+_pool = {}
+
+
+def get_pooled_client(host: str, port: int) -> "RedisClient":
+    """
+    Return the pooled connection to host:port, created on first use
+    """
+    client = _pool.get((host, port))
+    if client is None:
+        client = _pool[(host, port)] = RedisClient(host, port)
+    return client
+
+
+def discard_pooled_client(host: str, port: int):
+    client = _pool.pop((host, port), None)
+    if client is not None:
+        client.close()
+
+
+class RedisClient:
+    """
+    Pipelined client for server to server traffic (forwarding commands to other shards,
+    migrating keys to other nodes).
+
+    Any number of requests can be in flight on the single connection. Replies come back
+    in the order requests were sent, so a FIFO of futures is enough to match them.
+    """
+
+    def __init__(self, host=None, port=None, path=None):
+        self.host = host
+        self.port = port
+        self.path = path
+
+        self.encoder = RedisEncoder()
+        self.decoder = RedisStreamDecoder()
+
+        self.reader = None
+        self.writer = None
+        self.read_task = None
+        self.waiters = deque()
+        self._connect_lock = asyncio.Lock()
+
+    def is_connected(self):
+        return self.writer is not None and not self.writer.is_closing()
+
+    async def connect(self):
+        async with self._connect_lock:
+            if self.is_connected():
+                return
+
+            try:
+                if self.path:
+                    self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+                else:
+                    self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            except OSError as e:
+                raise RedisException(f"Connection failed: {e}") from e
+
+            self.decoder = RedisStreamDecoder()
+            self.read_task = asyncio.create_task(self.read_replies())
+
+    async def read_replies(self):
+        try:
+            while True:
+                data = await self.reader.read(READ_SIZE)
+                if not data:
+                    break
+
+                self.decoder.feed(data)
+                values, raw_data = self.decoder.get_stream()
+
+                start = 0
+                for value, length in values:
+                    future = self.waiters.popleft()
+                    if not future.done():
+                        future.set_result((value, raw_data[start:start + length]))
+                    start += length
+        finally:
+            self.close()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+        # Requests in flight will never get their reply
+        while self.waiters:
+            future = self.waiters.popleft()
+            if not future.done():
+                future.set_exception(RedisException("Connection lost"))
+
+    async def send(self, command):
+        """
+        Send a command and wait for its reply.
+
+        Returns:
+            tuple: Decoded reply and the reply as raw bytes
+        """
+        if not self.is_connected():
+            await self.connect()
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        self.writer.write(self.encoder.encode_array(command).encode("utf-8", "surrogateescape"))
+
+        return await future
+
+    async def execute(self, *command):
+        """
+        Send a command, and return its decoded reply.
+        Error replies are raised as RedisException.
+        """
+        value, _ = await self.send([str(item) for item in command])
+        if isinstance(value, RedisException):
+            raise value
+        return value
+
+    async def execute_raw(self, command):
+        """
+        Send a command, and return its reply as raw bytes, to be relayed as it is
+        """
+        _, raw_data = await self.send(command)
+        return raw_data
@@ -0,0 +1,247 @@
+"""
+Limits of client connections, and CLIENT LIST lines.
+
+Connections of clients are RedisProtocol instances, kept in ConnectionRegistry.clients
+(app.client is our own connections to other servers, this is about clients of ours).
+
+    maxclients                  connections accepted at once, more are refused
+    timeout                     seconds a client may be idle before it is closed, 0 never
+    client-output-buffer-limit  <class> <hard> <soft> <soft seconds>, for normal, replica and pubsub
+
+A client whose replies waiting to be sent reach the hard limit, or stay above
+the soft limit for soft seconds, is disconnected. That is the only bound on the
+memory a client which does not read its replies can take.
+
+Idle clients are found with the timer wheel of ConnectionRegistry, rather than
+a timer per client: reading from a client only stores the time.
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+
+from app.config import get_config, get_int_config
+from app.eviction import parse_memory
+
+logger = logging.getLogger(__name__)
+
+# Config keys which are read into ClientSettings
+CLIENT_CONFIG = {"maxclients", "timeout", "client-output-buffer-limit"}
+
+NORMAL = "normal"
+REPLICA = "replica"
+PUBSUB = "pubsub"
+
+# Names CLIENT LIST TYPE and client-output-buffer-limit take, slave is the older name of replica
+CLIENT_TYPES = {NORMAL: NORMAL, REPLICA: REPLICA, "slave": REPLICA, PUBSUB: PUBSUB}
+
+# (hard limit, soft limit, soft seconds) of every class, 0 for no limit
+DEFAULT_OUTPUT_BUFFER_LIMITS = {
+    NORMAL: (0, 0, 0),
+    REPLICA: (256 * 1024 ** 2, 64 * 1024 ** 2, 60),
+    PUBSUB: (32 * 1024 ** 2, 8 * 1024 ** 2, 60),
+}
+
+# Seconds between checks of idle clients
+TIMEOUT_CHECK_INTERVAL = 1
+
+# Idle clients are checked once per turn of the wheel when there is no timeout,
+# so that they are found once one is set
+NO_TIMEOUT_RECHECK = 60
+
+_client_ids = itertools.count(1)
+
+
+def next_client_id() -> int:
+    return next(_client_ids)
+
+
+def parse_output_buffer_limits(value: str) -> dict:
+    """
+    client-output-buffer-limit, classes which are not listed keep their defaults
+
+    Returns:
+        dict: Client type -> (hard limit, soft limit, soft seconds)
+
+    Raises:
+        ValueError: Not groups of a class and three limits
+    """
+
+    parts = value.split()
+    if len(parts) % 4:
+        raise ValueError("client-output-buffer-limit takes groups of <class> <hard> <soft> <soft seconds>")
+
+    limits = dict(DEFAULT_OUTPUT_BUFFER_LIMITS)
+    for index in range(0, len(parts), 4):
+        client_type = CLIENT_TYPES.get(parts[index].lower())
+        if client_type is None:
+            raise ValueError(f"Invalid client class: {parts[index]}")
+
+        hard, soft, seconds = (
+            parse_memory(parts[index + 1]), parse_memory(parts[index + 2]), int(parts[index + 3])
+        )
+        if min(hard, soft, seconds) < 0:
+            raise ValueError("client-output-buffer-limit can not be negative")
+        limits[client_type] = (hard, soft, seconds)
+
+    return limits
+
+
+class ClientSettings:
+    """
+    Config used on every write to a client, read once instead of from the environment every time
+    """
+
+    def __init__(self):
+        self.maxclients = get_int_config("maxclients")
+        self.timeout = get_int_config("timeout")
+        if self.maxclients < 1 or self.timeout < 0:
+            raise ValueError("maxclients must be at least 1, and timeout can not be negative")
+
+        self.output_buffer_limits = parse_output_buffer_limits(get_config("client-output-buffer-limit"))
+
+
+_settings = None
+
+
+def get_client_settings() -> ClientSettings:
+    global _settings
+    if _settings is None:
+        _settings = ClientSettings()
+    return _settings
+
+
+def reload_client_settings():
+    """
+    Read the config again, after it was changed
+
+    Raises:
+        ValueError: Config is not valid, previous settings are kept
+    """
+    global _settings
+    _settings = ClientSettings()
+
+
+def is_over_output_buffer_limit(client, size: int, now: float) -> bool:
+    """
+    Did the output buffer of client, size bytes now, go over the limits of its class
+    """
+
+    hard, soft, seconds = get_client_settings().output_buffer_limits[client.client_type]
+
+    if hard and size >= hard:
+        return True
+
+    if not soft or size < soft:
+        client.soft_limit_reached_at = None
+        return False
+
+    if client.soft_limit_reached_at is None:
+        client.soft_limit_reached_at = now
+        return False
+
+    return now - client.soft_limit_reached_at > seconds
+
+
+def get_idle_deadline(client, now: float) -> float:
+    """
+    When client is next checked for being idle
+    """
+    timeout = get_client_settings().timeout
+    if not timeout:
+        return now + NO_TIMEOUT_RECHECK
+
+    return max(client.last_interaction + timeout, now + TIMEOUT_CHECK_INTERVAL)
+
+
+def is_timeout_exempt(client) -> bool:
+    """
+    Replicas, connections of other shards, and clients busy with a command
+    (blocked in WAIT or XREAD BLOCK) are never idle
+    """
+    return client.client_type == REPLICA or client.forwarded or client.task is not None
+
+
+def close_idle_clients(registry, now: float = None) -> int:
+    """
+    Close the clients idle for longer than timeout, of those due in the wheel
+
+    Returns:
+        int: Clients closed
+    """
+
+    if now is None:
+        now = time.monotonic()
+
+    timeout = get_client_settings().timeout
+    closed = 0
+    for client in registry.idle_clients.advance(now):
+        if client not in registry.clients:
+            continue
+
+        if timeout and now - client.last_interaction >= timeout and not is_timeout_exempt(client):
+            logger.debug("Closing idle client %s", client.get_address())
+            client.transport.close()
+            closed += 1
+            continue
+
+        if is_timeout_exempt(client):
+            registry.idle_clients.add(client, now + (timeout or NO_TIMEOUT_RECHECK))
+        else:
+            registry.idle_clients.add(client, get_idle_deadline(client, now))
+
+    return closed
+
+
+async def check_idle_clients(registry, interval: float = TIMEOUT_CHECK_INTERVAL):
+    """
+    Close idle clients every interval, for as long as the server runs
+    """
+    while True:
+        await asyncio.sleep(interval)
+        close_idle_clients(registry)
+
+
+def format_client(client, now: float) -> str:
+    """
+    Line of CLIENT LIST and CLIENT INFO, the fields Redis has which make sense here
+    """
+
+    handler = client.handler
+    query, output = client.get_buffer_sizes()
+
+    flags = ""
+    if client.client_type == REPLICA:
+        flags += "S"
+    if handler.transaction_queue is not None:
+        flags += "x"
+    if client.close_after_reply:
+        flags += "c"
+
+    multi = len(handler.transaction_queue) if handler.transaction_queue is not None else -1
+
+    fields = [
+        ("id", client.id),
+        ("addr", client.get_address()),
+        ("laddr", client.get_address("sockname")),
+        ("fd", client.get_fd()),
+        ("name", client.name),
+        ("age", int(now - client.created_at)),
+        ("idle", int(now - client.last_interaction)),
+        ("flags", flags or "N"),
+        ("db", handler.db_index),
+        ("sub", 0),
+        ("psub", 0),
+        ("ssub", 0),
+        ("multi", multi),
+        ("qbuf", query),
+        ("omem", output),
+        ("tot-mem", query + output),
+        ("events", "rw" if output else "r"),
+        ("cmd", handler.last_command or "NULL"),
+        ("user", "default"),
+        ("redir", -1),
+        ("resp", 2),
+    ]
+    return " ".join(f"{key}={value}" for key, value in fields)
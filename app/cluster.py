@@ -0,0 +1,247 @@
+"""
+Cluster mode with a static configuration.
+
+Every node reads the same cluster config file, which lists the nodes and the
+hash slots each of them serves, one node per line:
+
+    <node id> <host>:<port> <slot or first-last> [<slot or first-last> ...]
+
+Lines starting with # are ignored. A node finds itself in the file by its port.
+There is no gossip or failover, slot ownership changes only with the file
+or with CLUSTER SETSLOT, which moves a slot between nodes:
+
+    1. CLUSTER SETSLOT <slot> IMPORTING <source id> on the target
+    2. CLUSTER SETSLOT <slot> MIGRATING <target id> on the source
+    3. CLUSTER GETKEYSINSLOT and MIGRATE ... KEYS on the source, till the slot is empty
+    4. CLUSTER SETSLOT <slot> NODE <target id> on both (and any other node)
+
+While the slot migrates, the source serves keys it still has, and redirects
+clients with ASK for the rest. Target serves them only after ASKING.
+"""
+
+from app.exceptions import (
+    AskException, CrossSlotException, MovedException, RedisException, TryAgainException
+)
+from app.slots import SLOT_COUNT, get_command_keys, key_hash_slot
+
+# Cluster state of this node, only set when cluster mode is enabled
+_cluster = None
+
+
+def get_cluster():
+    return _cluster
+
+
+def set_cluster(cluster):
+    global _cluster
+    _cluster = cluster
+
+
+class ClusterNode:
+
+    def __init__(self, node_id: str, host: str, port: int, slots=None):
+        self.node_id = node_id
+        self.host = host
+        self.port = port
+        # List of (first, last) inclusive slot ranges
+        self.slots = slots or []
+
+    @property
+    def address(self):
+        return f"{self.host}:{self.port}"
+
+
+def parse_slot_range(value: str):
+    first, _, last = value.partition("-")
+    first = int(first)
+    last = int(last) if last else first
+
+    if not 0 <= first <= last < SLOT_COUNT:
+        raise ValueError(f"Invalid slot range: {value}")
+
+    return first, last
+
+
+def get_slot_ranges(slots) -> list:
+    """
+    Collapse sorted slot numbers into (first, last) ranges
+    """
+    ranges = []
+    for slot in slots:
+        if ranges and ranges[-1][1] == slot - 1:
+            ranges[-1][1] = slot
+        else:
+            ranges.append([slot, slot])
+    return [tuple(item) for item in ranges]
+
+
+class ClusterState:
+
+    def __init__(self, nodes: list, myself: ClusterNode):
+        self.nodes = {node.node_id: node for node in nodes}
+        self.myself = myself
+
+        # Owner node of every slot, None for slots nobody serves
+        self.slot_owner = [None] * SLOT_COUNT
+        for node in nodes:
+            for first, last in node.slots:
+                for slot in range(first, last + 1):
+                    self.slot_owner[slot] = node
+
+        # Slot -> node, for slots moving from us to that node, and from that node to us
+        self.migrating = {}
+        self.importing = {}
+
+    @classmethod
+    def from_file(cls, path: str, port: int):
+        nodes = []
+        with open(path, encoding="utf-8") as fd:
+            for line in fd:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+
+                node_id, address, *slots = line.split()
+                host, _, node_port = address.rpartition(":")
+                nodes.append(ClusterNode(
+                    node_id, host, int(node_port), [parse_slot_range(item) for item in slots]
+                ))
+
+        myself = next((node for node in nodes if node.port == int(port)), None)
+        if myself is None:
+            raise ValueError(f"No node with port {port} in cluster config {path}")
+
+        return cls(nodes, myself)
+
+    def get_node_slots(self, node: ClusterNode) -> list:
+        return get_slot_ranges(
+            slot for slot, owner in enumerate(self.slot_owner) if owner is node
+        )
+
+    def get_node(self, node_id: str) -> ClusterNode:
+        node = self.nodes.get(node_id)
+        if node is None:
+            raise RedisException(f"I don't know about node {node_id}")
+        return node
+
+    def set_slot(self, slot: int, state: str, node_id: str = None):
+        """
+        CLUSTER SETSLOT <slot> IMPORTING|MIGRATING|NODE <node id>, or STABLE
+        """
+
+        if state == "stable":
+            self.migrating.pop(slot, None)
+            self.importing.pop(slot, None)
+            return
+
+        if node_id is None:
+            raise RedisException("wrong number of arguments for 'cluster|setslot' command")
+
+        node = self.get_node(node_id)
+
+        if state == "migrating":
+            if self.slot_owner[slot] is not self.myself:
+                raise RedisException(f"I'm not the owner of hash slot {slot}")
+            self.migrating[slot] = node
+        elif state == "importing":
+            if self.slot_owner[slot] is self.myself:
+                raise RedisException(f"I'm already the owner of hash slot {slot}")
+            self.importing[slot] = node
+        elif state == "node":
+            self.slot_owner[slot] = node
+            self.migrating.pop(slot, None)
+            self.importing.pop(slot, None)
+        else:
+            raise RedisException(f"Invalid CLUSTER SETSLOT action: {state}")
+
+    def get_slot(self, keys: list) -> int:
+        """
+        Return the hash slot all keys are in
+
+        Raises:
+            CrossSlotException: Keys are in different slots
+        """
+
+        slot = key_hash_slot(keys[0])
+        for key in keys[1:]:
+            if key_hash_slot(key) != slot:
+                raise CrossSlotException("Keys in request don't hash to the same slot")
+
+        return slot
+
+    def check_command(self, command: str, args: list, db, asking: bool = False):
+        """
+        Ensure this node serves the keys of the command
+
+        Args:
+            db: Database, to tell which keys of a migrating slot are still here
+            asking: Client sent ASKING, keys of importing slots are served
+
+        Raises:
+            MovedException: Keys are served by another node
+            AskException: Keys were migrated (or are created) on the target of their slot
+        """
+
+        keys = get_command_keys(command, args)
+        if not keys:
+            return
+
+        slot = self.get_slot(keys)
+        owner = self.slot_owner[slot]
+
+        if owner is self.myself:
+            target = self.migrating.get(slot)
+            if target is None:
+                return
+
+            missing = sum(1 for key in keys if db.get(key, update_access=False) is None)
+            if missing == 0:
+                return
+            if missing < len(keys):
+                raise TryAgainException("Multiple keys request during rehashing of slot")
+            raise AskException(f"{slot} {target.address}")
+
+        if asking and slot in self.importing:
+            return
+
+        if owner is None:
+            raise RedisException(f"Hash slot {slot} is not served")
+
+        raise MovedException(f"{slot} {owner.address}")
+
+    def get_slots_reply(self) -> list:
+        """
+        Reply of CLUSTER SLOTS, one entry per slot range
+        """
+        reply = []
+        for node in self.nodes.values():
+            for first, last in self.get_node_slots(node):
+                reply.append([first, last, [node.host, node.port, node.node_id]])
+
+        reply.sort(key=lambda item: item[0])
+        return reply
+
+    def get_shards_reply(self) -> list:
+        """
+        Reply of CLUSTER SHARDS, every node is a shard of its own (no replicas)
+        """
+        reply = []
+        for node in self.nodes.values():
+            slots = []
+            for first, last in self.get_node_slots(node):
+                slots.extend([first, last])
+
+            reply.append([
+                "slots", slots,
+                "nodes", [[
+                    "id", node.node_id,
+                    "port", node.port,
+                    "ip", node.host,
+                    "endpoint", node.host,
+                    "role", "master",
+                    "replication-offset", 0,
+                    "health", "online",
+                ]],
+            ])
+
+        return reply
@@ -0,0 +1,3 @@
+"""
+Commands of the handler, by group. Every module has a mixin of RedisCommandHandler.
+"""
@@ -0,0 +1,159 @@
+"""
+CLIENT subcommands, on the connections of the server (ConnectionRegistry.clients).
+"""
+
+from time import monotonic
+
+from app.clients import CLIENT_TYPES, format_client
+from app.exceptions import RedisException
+from app.serialiser import RedisType
+
+
+class ClientCommandsMixin:
+
+    def get_own_client(self):
+        if self.client is None:
+            raise RedisException("this connection is not a client connection")
+        return self.client
+
+    def filter_clients(self, filters: list) -> list:
+        """
+        Clients matching all the filters of CLIENT KILL, as [name, value, ...].
+        SKIPME yes, the default, leaves out our own connection.
+        """
+
+        clients = list(self.connection_registry.clients)
+        skip_me = True
+        now = monotonic()
+
+        if len(filters) % 2:
+            raise RedisException("syntax error")
+
+        for index in range(0, len(filters), 2):
+            name, value = filters[index].lower(), filters[index + 1]
+
+            if name == "id":
+                try:
+                    client_id = int(value)
+                except ValueError:
+                    raise RedisException("client-id should be greater than 0")
+                clients = [client for client in clients if client.id == client_id]
+            elif name == "addr":
+                clients = [client for client in clients if client.get_address() == value]
+            elif name == "laddr":
+                clients = [client for client in clients if client.get_address("sockname") == value]
+            elif name == "type":
+                client_type = CLIENT_TYPES.get(value.lower())
+                if client_type is None:
+                    raise RedisException(f"Unknown client type '{value}'")
+                clients = [client for client in clients if client.client_type == client_type]
+            elif name == "maxage":
+                try:
+                    max_age = int(value)
+                except ValueError:
+                    raise RedisException("value is not an integer or out of range")
+                clients = [client for client in clients if now - client.created_at >= max_age]
+            elif name == "skipme":
+                if value.lower() not in ("yes", "no"):
+                    raise RedisException("syntax error")
+                skip_me = value.lower() == "yes"
+            else:
+                raise RedisException("syntax error")
+
+        if skip_me:
+            clients = [client for client in clients if client is not self.client]
+        return clients
+
+    def kill_client(self, client):
+        if client is self.client:
+            # Reply of CLIENT KILL is sent first
+            client.close_after_reply = True
+        else:
+            client.transport.close()
+
+    async def client_list(self, args):
+        """
+        CLIENT LIST [TYPE normal|replica|pubsub] [ID client-id ...]
+        """
+
+        clients = sorted(self.connection_registry.clients, key=lambda client: client.id)
+
+        if args:
+            option = args[0].lower()
+            if option == "type" and len(args) == 2:
+                client_type = CLIENT_TYPES.get(args[1].lower())
+                if client_type is None:
+                    raise RedisException(f"Unknown client type '{args[1]}'")
+                clients = [client for client in clients if client.client_type == client_type]
+            elif option == "id" and len(args) > 1:
+                try:
+                    client_ids = {int(client_id) for client_id in args[1:]}
+                except ValueError:
+                    raise RedisException("Invalid client ID")
+                clients = [client for client in clients if client.id in client_ids]
+            else:
+                raise RedisException("syntax error")
+
+        now = monotonic()
+        return "".join(format_client(client, now) + "\n" for client in clients), RedisType.BULK_STRING
+
+    async def client_kill(self, args):
+        """
+        CLIENT KILL ip:port, or CLIENT KILL <filter> <value> ... which replies with the number of clients killed
+        """
+
+        if not args:
+            raise RedisException("wrong number of arguments for 'client|kill' command")
+
+        if len(args) == 1:
+            for client in self.connection_registry.clients:
+                if client.get_address() == args[0]:
+                    self.kill_client(client)
+                    return "OK", RedisType.SIMPLE_STRING
+            raise RedisException("No such client")
+
+        clients = self.filter_clients(args)
+        for client in clients:
+            self.kill_client(client)
+        return len(clients), RedisType.INTEGER
+
+    async def client_setname(self, args):
+        if len(args) != 1:
+            raise RedisException("wrong number of arguments for 'client|setname' command")
+
+        name = args[0]
+        if any(not "!" <= char <= "~" for char in name):
+            raise RedisException("Client names cannot contain spaces, newlines or special characters.")
+
+        self.get_own_client().name = name
+        return "OK", RedisType.SIMPLE_STRING
+
+    async def client_command(self, args):
+        """
+        CLIENT LIST | KILL | SETNAME | GETNAME | ID | INFO
+        """
+
+        if not args:
+            raise RedisException("wrong number of arguments for 'client' command")
+
+        subcommand = args[0].lower()
+
+        if subcommand == "id":
+            return self.get_own_client().id, RedisType.INTEGER
+
+        if subcommand == "getname":
+            return self.get_own_client().name or None, RedisType.BULK_STRING
+
+        if subcommand == "info":
+            return format_client(self.get_own_client(), monotonic()) + "\n", RedisType.BULK_STRING
+
+        client_map = {
+            "list": self.client_list,
+            "kill": self.client_kill,
+            "setname": self.client_setname,
+        }
+
+        if subcommand not in client_map:
+            raise RedisException(f"Invalid client subcommand: {subcommand}")
+
+        return await client_map[subcommand](args[1:])
@@ -0,0 +1,282 @@
+"""
+Commands of cluster mode and of moving keys between servers: CLUSTER, ASKING, DUMP,
+RESTORE and MIGRATE.
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+from app.client import discard_pooled_client, get_pooled_client
+from app.commands.names import DEL, RESTORE_ASKING, SELECT
+from app.exceptions import BusyKeyException, RedisException, TargetIOException, TryAgainException
+from app.rdb.dump import DumpPayloadException, dump_value, restore_value
+from app.serialiser import RedisType
+from app.slots import SLOT_COUNT, get_command_keys, key_hash_slot
+
+# Keys sent to the target of MIGRATE per round of pipelined RESTOREs
+MIGRATE_BATCH_SIZE = 100
+
+
+class ClusterCommandsMixin:
+
+    async def dump(self, args):
+        """
+        Serialize the value of a key, to be recreated with RESTORE
+        """
+        value = self.lookup_key_read(args[0])
+        if value is None:
+            return None, RedisType.BULK_STRING
+
+        return dump_value(value).decode("utf-8", "surrogateescape"), RedisType.BULK_STRING
+
+    async def restore(self, args):
+        """
+        RESTORE key ttl serialized-value [REPLACE] [ABSTTL]
+
+        TTL is in milliseconds, 0 for no expiry. With ABSTTL it is a unix timestamp in milliseconds.
+        """
+
+        key, ttl, payload = args[0], int(args[1]), args[2]
+        options = {arg.lower() for arg in args[3:]}
+
+        if ttl < 0:
+            raise RedisException("Invalid TTL value, must be >= 0")
+
+        if "replace" not in options and self.db.get(key) is not None:
+            raise BusyKeyException("Target key name already exists.")
+
+        try:
+            value = restore_value(payload.encode("utf-8", "surrogateescape"))
+        except DumpPayloadException:
+            raise RedisException("DUMP payload version or checksum are wrong")
+
+        expires_at = None
+        if ttl and "absttl" in options:
+            expires_at = datetime.fromtimestamp(ttl / 1000)
+        elif ttl:
+            expires_at = datetime.now() + timedelta(milliseconds=ttl)
+
+        self.db.restore(key, value, expires_at)
+
+        return "OK", RedisType.SIMPLE_STRING
+
+    async def asking_command(self, args):
+        self.get_cluster_state()
+        self.asking = True
+        return "OK", RedisType.SIMPLE_STRING
+
+    def get_restore_command(self, key, replace):
+        """
+        RESTORE-ASKING command which recreates the key on another node, None if key does not exist
+        """
+
+        value = self.db.get(key)
+        if value is None:
+            return None
+
+        ttl = 0
+        expires_at = self.db.get_expiry(key)
+        if expires_at is not None:
+            ttl = max(1, int((expires_at - datetime.now()).total_seconds() * 1000))
+
+        command = [RESTORE_ASKING, key, str(ttl), dump_value(value).decode("utf-8", "surrogateescape")]
+        if replace:
+            command.append("REPLACE")
+        return command
+
+    async def migrate(self, args):
+        """
+        MIGRATE host port key|"" destination-db timeout [COPY] [REPLACE] [KEYS key [key ...]]
+
+        Keys are sent as pipelined RESTORE-ASKING commands, in batches, over a
+        connection to the target which is kept for later MIGRATEs.
+        Keys are deleted here once the target restored them, unless COPY is given.
+
+        Other clients run while we wait for the target. Writes to the keys are refused
+        with TRYAGAIN meanwhile, and a key is only deleted if it still holds the value sent.
+        """
+
+        host, port, key, db_index, timeout = args[0], int(args[1]), args[2], args[3], int(args[4])
+
+        copy = replace = False
+        keys = [key] if key else []
+
+        for idx, arg in enumerate(args[5:], start=5):
+            option = arg.lower()
+            if option == "copy":
+                copy = True
+            elif option == "replace":
+                replace = True
+            elif option == "keys":
+                if key:
+                    raise RedisException("When using MIGRATE KEYS option, the key argument must be set to the empty string")
+                keys = args[idx + 1:]
+                break
+            else:
+                raise RedisException("syntax error")
+
+        if not copy and self.is_replica and not self.is_master_link:
+            self.check_replica_writable()
+
+        db_index = self.get_db_index_arg(db_index)
+
+        # Database the keys are sent from, even if SWAPDB changes the one behind our index meanwhile
+        db = self.db
+        if not copy and any(key in db.keys_in_flight for key in keys):
+            raise TryAgainException("Key is being migrated, try again later")
+
+        commands = []
+        # Key -> entry its payload was dumped from
+        entries = {}
+        for key in keys:
+            command = self.get_restore_command(key, replace)
+            if command is not None:
+                commands.append(command)
+                entries[key] = db.data.get(key)
+
+        if not commands:
+            return "NOKEY", RedisType.SIMPLE_STRING
+
+        if not copy:
+            db.keys_in_flight.update(entries)
+
+        client = get_pooled_client(host, port)
+        migrated = []
+        error = io_error = None
+
+        # Pooled connection may have another database selected, from an earlier MIGRATE
+        select_command = [SELECT, str(db_index)]
+
+        try:
+            for start in range(0, len(commands), MIGRATE_BATCH_SIZE):
+                batch = commands[start:start + MIGRATE_BATCH_SIZE]
+                if start == 0:
+                    batch = [select_command, *batch]
+
+                replies = await asyncio.wait_for(
+                    asyncio.gather(*(client.send(command) for command in batch)),
+                    timeout / 1000 if timeout > 0 else None,
+                )
+
+                for command, (reply, _) in zip(batch, replies):
+                    if command is select_command:
+                        if isinstance(reply, RedisException):
+                            error = reply
+                        continue
+
+                    if isinstance(reply, RedisException):
+                        error = error or reply
+                    else:
+                        migrated.append(command[1])
+
+                if error is not None:
+                    break
+        except (asyncio.TimeoutError, RedisException, OSError):
+            # Replies in flight are lost, the connection can not be used anymore
+            discard_pooled_client(host, port)
+            io_error = TargetIOException("error or timeout reading to target instance")
+        finally:
+            if not copy:
+                db.keys_in_flight.difference_update(entries)
+
+        # A key written meanwhile without TRYAGAIN (FLUSHDB, MOVE into this database) is kept
+        migrated = [key for key in migrated if db.data.get(key) is entries[key]]
+
+        if not copy and migrated:
+            for key in migrated:
+                db.del_key(key)
+
+            # Replicas drop the keys as well
+            if not self.is_replica:
+                await self.write_to_replicas(self.encoder.encode_array([DEL, *migrated]))
+
+        if io_error is not None:
+            raise io_error
+
+        if error is not None:
+            raise RedisException(f"Target instance replied with error: {error}")
+
+        return "OK", RedisType.SIMPLE_STRING
+
+    def check_keys_in_flight(self, command, command_arg):
+        """
+        Writes to keys MIGRATE waits on the target for would be lost once it deletes them
+        """
+        keys_in_flight = self.db.keys_in_flight
+        if any(key in keys_in_flight for key in get_command_keys(command, command_arg)):
+            raise TryAgainException("Key is being migrated, try again later")
+
+    def get_cluster_state(self):
+        if self.cluster is None:
+            raise RedisException("This instance has cluster support disabled")
+        return self.cluster
+
+    async def cluster_slots(self, args):
+        return self.get_cluster_state().get_slots_reply(), RedisType.ARRAY
+
+    async def cluster_shards(self, args):
+        return self.get_cluster_state().get_shards_reply(), RedisType.ARRAY
+
+    async def cluster_myid(self, args):
+        return self.get_cluster_state().myself.node_id, RedisType.BULK_STRING
+
+    async def cluster_keyslot(self, args):
+        return key_hash_slot(args[0]), RedisType.INTEGER
+
+    def get_slot_arg(self, value):
+        try:
+            slot = int(value)
+        except ValueError:
+            raise RedisException("Invalid slot")
+
+        if not 0 <= slot < SLOT_COUNT:
+            raise RedisException("Invalid slot")
+        return slot
+
+    async def cluster_countkeysinslot(self, args):
+        self.get_cluster_state()
+        slot = self.get_slot_arg(args[0])
+        return self.db.count_keys_in_slot(slot), RedisType.INTEGER
+
+    async def cluster_getkeysinslot(self, args):
+        self.get_cluster_state()
+        slot = self.get_slot_arg(args[0])
+
+        try:
+            count = int(args[1])
+        except ValueError:
+            count = -1
+        if count < 0:
+            raise RedisException("Invalid number of keys")
+
+        return self.db.get_keys_in_slot(slot, count), RedisType.ARRAY
+
+    async def cluster_setslot(self, args):
+        cluster = self.get_cluster_state()
+        slot = self.get_slot_arg(args[0])
+        node_id = args[2] if len(args) > 2 else None
+
+        cluster.set_slot(slot, args[1].lower(), node_id)
+        return "OK", RedisType.SIMPLE_STRING
+
+    async def cluster_command(self, args):
+
+        if not args:
+            raise RedisException("wrong number of arguments for 'cluster' command")
+
+        subcommand = args[0].lower()
+
+        cluster_map = {
+            "slots": self.cluster_slots,
+            "shards": self.cluster_shards,
+            "myid": self.cluster_myid,
+            "keyslot": self.cluster_keyslot,
+            "countkeysinslot": self.cluster_countkeysinslot,
+            "getkeysinslot": self.cluster_getkeysinslot,
+            "setslot": self.cluster_setslot,
+        }
+
+        if subcommand not in cluster_map:
+            raise RedisException(f"Invalid cluster subcommand: {subcommand}")
+
+        return await cluster_map[subcommand](args[1:])
@@ -0,0 +1,111 @@
+"""
+Commands on the logical databases: SELECT, MOVE, SWAPDB, DBSIZE, FLUSHDB and FLUSHALL.
+"""
+
+from app.commands.names import DBSIZE, FLUSHALL, FLUSHDB, MOVE, SELECT, SWAPDB
+from app.database import get_database, get_databases, swap_databases
+from app.exceptions import RedisException
+from app.lazyfree import get_lazyfree_settings
+from app.serialiser import RedisType
+
+
+class DatabaseCommandsMixin:
+
+    def get_db_index_arg(self, value, error="DB index is out of range"):
+        try:
+            index = int(value)
+        except ValueError:
+            raise RedisException("value is not an integer or out of range")
+
+        if not 0 <= index < len(get_databases()):
+            raise RedisException(error)
+        return index
+
+    def check_multiple_databases(self, command):
+        """
+        Keys are routed (or redirected) to their owner by key only, so with
+        shards or cluster only database 0 is served, like Redis Cluster
+        """
+        if self.cluster is not None:
+            raise RedisException(f"{command.upper()} is not allowed in cluster mode")
+        if self.shard_router is not None:
+            raise RedisException(f"{command.upper()} is not allowed in sharded mode")
+
+    async def select(self, args):
+        index = self.get_db_index_arg(args[0])
+        if index != 0:
+            self.check_multiple_databases(SELECT)
+
+        self.db_index = index
+        return "OK", RedisType.SIMPLE_STRING
+
+    async def move(self, args):
+        """
+        MOVE key db, moves the key to another database, unless it exists there already
+        """
+
+        self.check_multiple_databases(MOVE)
+
+        key = args[0]
+        index = self.get_db_index_arg(args[1], "index out of range")
+        if index == self.db_index:
+            raise RedisException("source and destination objects are the same")
+
+        value = self.db.get(key)
+        target = get_database(index)
+        if value is None or target.get(key) is not None:
+            return 0, RedisType.INTEGER
+
+        target.restore(key, value, self.db.get_expiry(key))
+        self.db.del_key(key)
+
+        return 1, RedisType.INTEGER
+
+    async def swapdb(self, args):
+        self.check_multiple_databases(SWAPDB)
+
+        first = self.get_db_index_arg(args[0])
+        second = self.get_db_index_arg(args[1])
+        swap_databases(first, second)
+
+        return "OK", RedisType.SIMPLE_STRING
+
+    async def dbsize(self, args):
+        size = len(self.db)
+
+        # Other shards hold the rest of the keyspace
+        if self.shard_router is not None:
+            size += sum(await self.shard_router.broadcast(DBSIZE, args))
+
+        return size, RedisType.INTEGER
+
+    def is_async_flush(self, args) -> bool:
+        """
+        FLUSHDB / FLUSHALL [ASYNC | SYNC], lazyfree-lazy-user-flush applies without either
+        """
+
+        if not args:
+            return get_lazyfree_settings().lazy_user_flush
+
+        mode = args[0].lower()
+        if len(args) > 1 or mode not in ("async", "sync"):
+            raise RedisException("syntax error")
+        return mode == "async"
+
+    async def flushdb(self, args):
+        self.db.flush(self.is_async_flush(args))
+
+        if self.shard_router is not None:
+            await self.shard_router.broadcast(FLUSHDB, args)
+
+        return "OK", RedisType.SIMPLE_STRING
+
+    async def flushall(self, args):
+        asynchronous = self.is_async_flush(args)
+        for db in get_databases():
+            db.flush(asynchronous)
+
+        if self.shard_router is not None:
+            await self.shard_router.broadcast(FLUSHALL, args)
+
+        return "OK", RedisType.SIMPLE_STRING
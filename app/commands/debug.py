@@ -0,0 +1,75 @@
+"""
+DEBUG subcommands, for testing and profiling the server.
+"""
+
+from time import sleep
+
+from app.exceptions import RedisException
+from app.profiler import DEFAULT_PROFILE_HZ, MAX_PROFILE_HZ, ProfilerException, get_profiler
+from app.serialiser import RedisType
+
+
+class DebugCommandsMixin:
+
+    async def debug_profile(self, args):
+        """
+        DEBUG PROFILE START [hz] | STOP | DUMP, sampling profiler of the event loop thread
+        """
+
+        if not args:
+            raise RedisException("wrong number of arguments for 'debug|profile' command")
+
+        action = args[0].lower()
+        profiler = get_profiler()
+
+        if action == "start":
+            try:
+                hz = int(args[1]) if len(args) > 1 else DEFAULT_PROFILE_HZ
+            except ValueError:
+                raise RedisException("value is not an integer or out of range")
+            if not 1 <= hz <= MAX_PROFILE_HZ:
+                raise RedisException(f"hz must be between 1 and {MAX_PROFILE_HZ}")
+
+            try:
+                profiler.start(hz)
+            except ProfilerException as exc:
+                raise RedisException(str(exc))
+            return "OK", RedisType.SIMPLE_STRING
+
+        if action == "stop":
+            profiler.stop()
+            return "OK", RedisType.SIMPLE_STRING
+
+        if action == "dump":
+            return profiler.dump(), RedisType.BULK_STRING
+
+        raise RedisException(f"Invalid debug profile action: {action}")
+
+    async def debug_sleep(self, args):
+        """
+        DEBUG SLEEP seconds, blocks the whole server, to try out latency tooling
+        """
+        try:
+            seconds = float(args[0])
+        except (IndexError, ValueError):
+            raise RedisException("value is not a valid float")
+
+        sleep(seconds)
+        return "OK", RedisType.SIMPLE_STRING
+
+    async def debug_command(self, args):
+
+        if not args:
+            raise RedisException("wrong number of arguments for 'debug' command")
+
+        subcommand = args[0].lower()
+
+        debug_map = {
+            "profile": self.debug_profile,
+            "sleep": self.debug_sleep,
+        }
+
+        if subcommand not in debug_map:
+            raise RedisException(f"Invalid debug subcommand: {subcommand}")
+
+        return await debug_map[subcommand](args[1:])
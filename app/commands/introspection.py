@@ -0,0 +1,397 @@
+"""
+Commands reporting on the server: INFO, MEMORY, SLOWLOG and LATENCY.
+"""
+
+import asyncio
+import os
+import platform
+import sys
+from time import time_ns
+
+from app.clients import get_client_settings
+from app.config import get_config
+from app.database import get_databases
+from app.eviction import get_settings, get_used_memory
+from app.exceptions import RedisException
+from app.latency import get_latency_monitor
+from app.lazyfree import pending_objects
+from app.memory import DEFAULT_SAMPLES, KEY_OVERHEAD, VOLATILE_KEY_OVERHEAD, bytes_to_human, get_process_memory
+from app.serialiser import RedisType
+from app.slowlog import get_slowlog
+from app.stats import RUN_ID, get_cpu_usage, get_info_percentiles
+
+# Sections of INFO without any arguments
+DEFAULT_INFO_SECTIONS = {"server", "clients", "memory", "stats", "replication", "cpu", "keyspace"}
+
+# Redis version the commands and replies follow, clients look at it
+REDIS_VERSION = "7.2.0"
+
+
+class IntrospectionCommandsMixin:
+
+    async def memory_usage(self, args):
+        """
+        MEMORY USAGE key [SAMPLES count]
+        """
+
+        samples = DEFAULT_SAMPLES
+        if len(args) == 3 and args[1].lower() == "samples":
+            try:
+                samples = int(args[2])
+            except ValueError:
+                raise RedisException("value is not an integer or out of range")
+            if samples < 0:
+                raise RedisException("value is not an integer or out of range")
+        elif len(args) != 1:
+            raise RedisException("syntax error")
+
+        # Expired keys are deleted, and not measured
+        if self.db.get(args[0], update_access=False) is None:
+            return None, RedisType.BULK_STRING
+
+        return self.db.get_memory_usage(args[0], samples), RedisType.INTEGER
+
+    def get_client_buffers(self):
+        """
+        Bytes buffered for clients, as (normal clients, replicas)
+        """
+
+        replica_writers = {replica["writer"] for replica in self.connection_registry.get_replicas()}
+        normal = replicas = 0
+
+        for client in self.connection_registry.clients:
+            query, output = client.get_buffer_sizes()
+            if client.writer in replica_writers:
+                replicas += query + output
+            else:
+                normal += query + output
+
+        return normal, replicas
+
+    async def memory_stats(self, args):
+        """
+        MEMORY STATS, as name value pairs. Dataset figures are the estimates
+        maxmemory works with, process figures are resident memory.
+        """
+
+        current, peak = get_process_memory()
+        backlog = self.connection_registry.backlog
+        backlog_size = len(backlog) if backlog is not None else 0
+        clients_normal, clients_replicas = self.get_client_buffers()
+
+        stats = [
+            "peak.allocated", peak,
+            "total.allocated", current,
+            "replication.backlog", backlog_size,
+            "clients.slaves", clients_replicas,
+            "clients.normal", clients_normal,
+        ]
+
+        used_memory = keys = overhead = stream_memory = stream_count = 0
+
+        for index, db in enumerate(get_databases()):
+            if not len(db):
+                continue
+
+            main, expires = len(db) * KEY_OVERHEAD, len(db.volatile) * VOLATILE_KEY_OVERHEAD
+            stats.extend([
+                f"db.{index}", ["overhead.hashtable.main", main, "overhead.hashtable.expires", expires],
+            ])
+
+            used_memory += db.used_memory
+            keys += len(db)
+            overhead += main + expires
+            stream_memory += db.stream_memory
+            stream_count += db.stream_count
+
+        overhead_total = overhead + backlog_size + clients_normal + clients_replicas
+        dataset = used_memory - overhead
+
+        stats.extend([
+            "overhead.total", overhead_total,
+            "keys.count", keys,
+            "keys.bytes-per-key", used_memory // keys if keys else 0,
+            "dataset.bytes", dataset,
+            "dataset.percentage", f"{100 * dataset / (dataset + overhead_total) if dataset else 0:.2f}",
+            "keys.string.count", keys - stream_count,
+            "keys.string.bytes", used_memory - stream_memory,
+            "keys.stream.count", stream_count,
+            "keys.stream.bytes", stream_memory,
+            "lazyfree.pending.objects", pending_objects(),
+        ])
+
+        return stats, RedisType.ARRAY
+
+    async def memory_command(self, args):
+
+        if not args:
+            raise RedisException("wrong number of arguments for 'memory' command")
+
+        subcommand = args[0].lower()
+
+        memory_map = {
+            "usage": self.memory_usage,
+            "stats": self.memory_stats,
+        }
+
+        if subcommand not in memory_map:
+            raise RedisException(f"Invalid memory subcommand: {subcommand}")
+
+        return await memory_map[subcommand](args[1:])
+
+    async def slowlog_command(self, args):
+        """
+        SLOWLOG GET [count] | LEN | RESET
+        """
+
+        if not args:
+            raise RedisException("wrong number of arguments for 'slowlog' command")
+
+        subcommand = args[0].lower()
+        slowlog = get_slowlog()
+
+        if subcommand == "get":
+            try:
+                count = int(args[1]) if len(args) > 1 else 10
+            except ValueError:
+                raise RedisException("value is not an integer or out of range")
+            return slowlog.get(count), RedisType.ARRAY
+
+        if subcommand == "len":
+            return len(slowlog), RedisType.INTEGER
+
+        if subcommand == "reset":
+            slowlog.reset()
+            return "OK", RedisType.SIMPLE_STRING
+
+        raise RedisException(f"Invalid slowlog subcommand: {subcommand}")
+
+    async def latency_histogram(self, commands):
+        """
+        LATENCY HISTOGRAM [command ...], calls of the commands (all of them by default)
+        faster than every power of two microseconds
+        """
+
+        requested = {command.lower() for command in commands}
+        result = []
+        for command, stats in self.stats.commands.items():
+            if stats.histogram is None or (requested and command not in requested):
+                continue
+            result.extend([
+                command,
+                ["calls", stats.histogram.total, "histogram_usec", stats.histogram.get_cumulative_buckets()],
+            ])
+
+        return result, RedisType.ARRAY
+
+    async def latency_command(self, args):
+        """
+        LATENCY LATEST | HISTORY event | RESET [event ...] | HISTOGRAM [command ...]
+        """
+
+        if not args:
+            raise RedisException("wrong number of arguments for 'latency' command")
+
+        subcommand = args[0].lower()
+        monitor = get_latency_monitor()
+
+        if subcommand == "latest":
+            return monitor.latest(), RedisType.ARRAY
+
+        if subcommand == "history":
+            if len(args) != 2:
+                raise RedisException("wrong number of arguments for 'latency|history' command")
+            return monitor.history(args[1]), RedisType.ARRAY
+
+        if subcommand == "reset":
+            return monitor.reset(args[1:]), RedisType.INTEGER
+
+        if subcommand == "histogram":
+            return await self.latency_histogram(args[1:])
+
+        raise RedisException(f"Invalid latency subcommand: {subcommand}")
+
+    async def info_server(self):
+        return {
+            "redis_version": REDIS_VERSION,
+            "redis_mode": "cluster" if self.cluster is not None else "standalone",
+            "os": f"{platform.system()} {platform.release()} {platform.machine()}",
+            "arch_bits": 64 if sys.maxsize > 2 ** 32 else 32,
+            "multiplexing_api": type(asyncio.get_running_loop()).__module__.split(".")[0],
+            "python_version": platform.python_version(),
+            "process_id": os.getpid(),
+            "run_id": RUN_ID,
+            "tcp_port": get_config("port"),
+            "server_time_usec": time_ns() // 1000,
+            "uptime_in_seconds": self.stats.get_uptime(),
+            "uptime_in_days": self.stats.get_uptime() // 86400,
+        }
+
+    async def info_clients(self):
+        registry = self.connection_registry
+        max_input = max_output = 0
+        for client in registry.clients:
+            query, output = client.get_buffer_sizes()
+            max_input = max(max_input, query)
+            max_output = max(max_output, output)
+
+        return {
+            # Replicas connect as clients as well, Redis does not count them
+            "connected_clients": max(0, len(registry.clients) - len(registry.get_replicas())),
+            "client_recent_max_input_buffer": max_input,
+            "client_recent_max_output_buffer": max_output,
+            "maxclients": get_client_settings().maxclients,
+        }
+
+    async def info_memory(self):
+        databases = get_databases()
+        used_memory = get_used_memory(databases)
+        overhead = sum(
+            len(db) * KEY_OVERHEAD + len(db.volatile) * VOLATILE_KEY_OVERHEAD for db in databases
+        )
+        rss, peak = get_process_memory()
+        backlog = self.connection_registry.backlog
+        clients_normal, clients_replicas = self.get_client_buffers()
+        settings = get_settings()
+
+        return {
+            # Estimate of the dataset, which maxmemory is checked against
+            "used_memory": used_memory,
+            "used_memory_human": bytes_to_human(used_memory),
+            "used_memory_rss": rss,
+            "used_memory_rss_human": bytes_to_human(rss),
+            "used_memory_peak_rss": peak,
+            "used_memory_overhead": overhead,
+            "used_memory_dataset": used_memory - overhead,
+            "maxmemory": settings.maxmemory,
+            "maxmemory_human": bytes_to_human(settings.maxmemory),
+            "maxmemory_policy": settings.policy,
+            "mem_fragmentation_ratio": f"{rss / used_memory if used_memory else 0:.2f}",
+            "mem_replication_backlog": len(backlog) if backlog is not None else 0,
+            "mem_clients_slaves": clients_replicas,
+            "mem_clients_normal": clients_normal,
+            "lazyfree_pending_objects": pending_objects(),
+        }
+
+    async def info_stats(self):
+        stats = self.stats
+        return {
+            "total_connections_received": stats.total_connections_received,
+            "rejected_connections": stats.rejected_connections,
+            "client_output_buffer_limit_disconnections": stats.client_output_buffer_limit_disconnections,
+            "total_commands_processed": stats.total_commands_processed,
+            "instantaneous_ops_per_sec": round(stats.ops_per_sec.get()),
+            "total_net_input_bytes": stats.total_net_input_bytes,
+            "total_net_output_bytes": stats.total_net_output_bytes,
+            "instantaneous_input_kbps": f"{stats.input_bytes_per_sec.get() / 1024:.2f}",
+            "instantaneous_output_kbps": f"{stats.output_bytes_per_sec.get() / 1024:.2f}",
+            "expired_keys": stats.expired_keys,
+            "evicted_keys": stats.evicted_keys,
+            "keyspace_hits": stats.keyspace_hits,
+            "keyspace_misses": stats.keyspace_misses,
+            "total_error_replies": stats.total_error_replies,
+            # Timer of the event loop monitor, how much later than scheduled it ran
+            "eventloop_lag_usec": stats.eventloop_lag_last,
+            "eventloop_lag_p99_usec": stats.eventloop_lag.get_percentile(99),
+            "eventloop_lag_max_usec": stats.eventloop_lag.max,
+        }
+
+    async def info_replication(self):
+        is_replica = os.getenv("replicaof")
+        role = "slave" if is_replica else "master"
+
+        # Initialize the response dictionary with the role
+        response_parts = {"role": role}
+
+        # Add additional master-specific information if the node is a master
+        if role == "master":
+            response_parts["master_repl_offset"] = self.replication_offset
+            response_parts["master_replid"] = self.replication_id
+
+        # State of the link with our master, if replication is running
+        master_link = self.connection_registry.master_link
+        if role == "slave" and master_link is not None:
+            response_parts.update(master_link.get_info())
+
+        replicas = self.connection_registry.get_replicas()
+        response_parts["connected_slaves"] = len(replicas)
+
+        for idx, replica in enumerate(replicas):
+            lag, _ = self.connection_registry.get_replica_lag(replica)
+            response_parts[f"slave{idx}"] = (
+                f"ip={replica['ip']},port={replica['port']},state=online,"
+                f"offset={replica['offset']},lag={lag}"
+            )
+
+        return response_parts
+
+    async def info_cpu(self):
+        used_cpu_sys, used_cpu_user = get_cpu_usage()
+        return {
+            "used_cpu_sys": f"{used_cpu_sys:.6f}",
+            "used_cpu_user": f"{used_cpu_user:.6f}",
+        }
+
+    async def info_commandstats(self):
+        return {
+            f"cmdstat_{command}": stats.format()
+            for command, stats in self.stats.commands.items()
+        }
+
+    async def info_latencystats(self):
+        percentiles = get_info_percentiles()
+        fields = {}
+        for command, stats in self.stats.commands.items():
+            if stats.histogram is None:
+                continue
+            fields[f"latency_percentiles_usec_{command}"] = ",".join(
+                f"p{percentile:g}={stats.histogram.get_percentile(percentile):.3f}"
+                for percentile in percentiles
+            )
+        return fields
+
+    async def info_keyspace(self):
+        # There is no active expire cycle to sample TTLs from, so avg_ttl is not known
+        return {
+            f"db{index}": f"keys={len(db)},expires={len(db.volatile)},avg_ttl=0"
+            for index, db in enumerate(get_databases()) if len(db)
+        }
+
+    async def info(self, args=None):
+        """
+        INFO [section ...], sections of the default set without any, all of them with all
+        """
+
+        info_map = {
+            "server": ("Server", self.info_server),
+            "clients": ("Clients", self.info_clients),
+            "memory": ("Memory", self.info_memory),
+            "stats": ("Stats", self.info_stats),
+            "replication": ("Replication", self.info_replication),
+            "cpu": ("CPU", self.info_cpu),
+            "commandstats": ("Commandstats", self.info_commandstats),
+            "latencystats": ("Latencystats", self.info_latencystats),
+            "keyspace": ("Keyspace", self.info_keyspace),
+        }
+
+        requested = set()
+        for section in args or ["default"]:
+            section = section.lower()
+            if section in ("all", "everything"):
+                requested.update(info_map)
+            elif section == "default":
+                requested.update(DEFAULT_INFO_SECTIONS)
+            else:
+                # Like Redis, unknown sections are left out rather than an error
+                requested.add(section)
+
+        parts = []
+        for section, (title, kls) in info_map.items():
+            if section not in requested:
+                continue
+
+            fields = await kls()
+            lines = [f"# {title}", *(f"{key}:{value}" for key, value in fields.items())]
+            parts.append("\r\n".join(lines) + "\r\n")
+
+        return "\r\n".join(parts), RedisType.BULK_STRING
@@ -0,0 +1,42 @@
+"""
+Names of the commands, as they are looked up (lower case).
+"""
+
+PING = "ping"
+ECHO = "echo"
+SET = "set"
+GET = "get"
+INCR = "incr"
+XADD = "xadd"
+XRANGE = "xrange"
+XREAD = "xread"
+MULTI = "multi"
+EXEC = "exec"
+DISCARD = "discard"
+CONFIG = "config"
+KEYS = "keys"
+INFO = "info"
+REPLCONF = "replconf"
+PSYNC = "psync"
+WAIT = "wait"
+TYPE = "type"
+SCAN = "scan"
+CLUSTER = "cluster"
+DEL = "del"
+UNLINK = "unlink"
+DUMP = "dump"
+RESTORE = "restore"
+RESTORE_ASKING = "restore-asking"
+ASKING = "asking"
+MIGRATE = "migrate"
+SELECT = "select"
+MOVE = "move"
+SWAPDB = "swapdb"
+DBSIZE = "dbsize"
+FLUSHDB = "flushdb"
+FLUSHALL = "flushall"
+MEMORY = "memory"
+SLOWLOG = "slowlog"
+LATENCY = "latency"
+DEBUG = "debug"
+CLIENT = "client"
@@ -0,0 +1,196 @@
+"""
+Replication on the side of the master: PSYNC, REPLCONF, WAIT, and the writes
+propagated to replicas. The side of the replica is app.replica.
+"""
+
+from app.clients import REPLICA
+from app.commands.names import SELECT, SET, XADD
+from app.connection_registry import get_replication_settings
+from app.database import get_databases
+from app.exceptions import NoReplicasException, RedisException, ReadOnlyException
+from app.rdb.snapshot import build_snapshot
+from app.serialiser import RedisType
+
+
+class ReplicationCommandsMixin:
+
+    async def wait(self, args):
+        """
+        Sends response back to wait command once enough replicas acknowledge the writes
+        of this client. Replica ACKs resolve the wait directly, without polling.
+        Exits when either the required number of replicas are synced or timeout is reached.
+
+        Args:
+            args[0]: Required minimum number of synced replicas
+            args[1]: Timeout in milliseconds, 0 blocks forever
+        """
+        required_min_sync = int(args[0])
+        timeout_ms = int(args[1])
+        timeout_seconds = timeout_ms / 1000.0 if timeout_ms > 0 else None
+
+        # We need to wait for all writes this client did before the WAIT command
+        target_offset = self.last_write_offset
+
+        replicas_synced = await self.connection_registry.wait_for_replicas(
+            target_offset, required_min_sync, timeout_seconds
+        )
+        return replicas_synced, RedisType.INTEGER
+
+    async def replconf_getack(self, args):
+        """
+        Sends response back to replconf getack command.
+        """
+
+        return ["REPLCONF", "ACK", str(self.bytes_processed)], RedisType.ARRAY
+
+    async def replconf_ack(self, args, writer):
+        """
+        Once master recives an acknowledgement,
+        it updates the correct offset
+        """
+
+        await self.connection_registry.update_replica_offset(writer, int(args[0]))
+
+    async def replconf(self, args, writer=None):
+        """
+        Sends response back to replconf command.
+        """
+
+        args = args or []
+
+        if not args:
+            raise RedisException("Currently, REPLCONF command expects subcommand")
+
+        subcommand = args[0].lower()
+
+        if subcommand == "getack":
+            return await self.replconf_getack(args[1:])
+
+        if subcommand == "ack":
+            return await self.replconf_ack(args[1:], writer)
+
+        if subcommand == "listening-port":
+            self.replica_listening_port = int(args[1])
+
+        # If it doesn't match, send OK. We will add error handling later
+        return "OK", RedisType.SIMPLE_STRING
+
+    async def psync(self, args, writer):
+        """
+        Reply to psync command.
+
+        If replica asks for our replication ID, and the offset it needs is still
+        in the backlog, we continue from there (CONTINUE). Otherwise we do a FULLRESYNC.
+
+        Args:
+            args[0]: Replication ID replica synced with, or ? for first sync
+            args[1]: Offset of the first byte replica needs (its offset + 1)
+        """
+
+        # Asynchronously add replica to registry
+        # Registering first means nothing propagated in between can be missed
+        replica = await self.connection_registry.add_replica(
+            writer,
+            replication_id=self.replication_id,
+            offset=self.replication_offset,
+            listening_port=self.replica_listening_port,
+        )
+        if self.client is not None:
+            self.client.client_type = REPLICA
+
+        try:
+            requested_offset = int(args[1]) - 1
+        except (IndexError, ValueError):
+            requested_offset = None
+
+        if args and args[0] == self.replication_id and requested_offset is not None:
+            backlog = self.connection_registry.get_backlog(requested_offset)
+            if backlog is not None:
+                replica['offset'] = requested_offset
+                continue_command = self.encoder.encode_simple_string(f"CONTINUE {self.replication_id}")
+                return continue_command.encode('utf-8') + backlog, None
+
+        # Snapshot and offset are taken together, with nothing run in between,
+        # so the snapshot holds exactly the writes up to the offset
+        snapshot = build_snapshot(get_databases())
+        full_resync_command = self.encoder.encode_simple_string(
+            f"FULLRESYNC {self.replication_id} {self.replication_offset}"
+        ).encode('utf-8')
+
+        return full_resync_command + self.encoder.encode_file(snapshot), None
+
+    def check_replica_writable(self):
+        """
+        Clients can not write to a replica, unless replica-read-only is disabled
+        """
+        if get_replication_settings().replica_read_only:
+            raise ReadOnlyException("You can't write against a read only replica.")
+
+    def check_enough_replicas(self):
+        """
+        With min-replicas-to-write set, master accepts writes only while enough
+        replicas acknowledged within min-replicas-max-lag seconds
+        """
+        settings = get_replication_settings()
+        if settings.min_replicas_to_write <= 0:
+            return
+
+        good_replicas = self.connection_registry.count_good_replicas(settings.min_replicas_max_lag)
+        if good_replicas < settings.min_replicas_to_write:
+            raise NoReplicasException("Not enough good replicas to write.")
+
+    async def propagate(self, command, command_arg, response):
+        """
+        Propagate a successfully executed write command to the replicas
+        """
+
+        data, data_type = response
+        if data_type == RedisType.ERROR:
+            return
+
+        # No replica ever attached, so there is no replication stream to write
+        if self.connection_registry.backlog is None:
+            return
+
+        # Replicas must store the same ID as we did, not generate their own
+        if command == XADD:
+            command_arg = [command_arg[0], data, *command_arg[2:]]
+
+        # A relative TTL would start again whenever a replica applies it, so they get when it expires
+        if command == SET:
+            command_arg = self.get_set_propagation_args(command_arg)
+
+        await self.write_to_replicas(self.encoder.encode_array([command, *command_arg]))
+
+    def get_set_propagation_args(self, command_arg):
+        """
+        SET arguments with any expiry option replaced by PXAT, the expiry the key was stored with
+        """
+
+        args = command_arg[:2]
+        options = iter(command_arg[2:])
+        for option in options:
+            if option.lower() in ("ex", "px", "exat", "pxat"):
+                next(options, None)
+            else:
+                args.append(option)
+
+        expires_at = self.db.get_expiry(command_arg[0])
+        if expires_at is not None:
+            args.extend(["PXAT", str(int(expires_at.timestamp() * 1000))])
+        return args
+
+    async def write_to_replicas(self, data, db_index=None):
+        """
+        Write data to all registered replicas, selecting the database (ours by default)
+        first if the replication stream is on another one
+        """
+        if db_index is None:
+            db_index = self.db_index
+
+        registry = self.connection_registry
+        if registry.selected_db != db_index:
+            registry.selected_db = db_index
+            data = self.encoder.encode_array([SELECT, str(db_index)]) + data
+
+        self.last_write_offset = await registry.propagate(data)
@@ -0,0 +1,57 @@
+import os
+
+# Server configuration is kept in the environment (command line options are
+# exported there by main), these are the values used when nothing is set.
+DEFAULTS = {
+    "port": "6379",
+    "bind": "localhost",
+    "tcp-backlog": "511",
+    "tcp-keepalive": "300",
+    "maxclients": "10000",
+    "timeout": "0",
+    "client-output-buffer-limit": "normal 0 0 0 replica 256mb 64mb 60 pubsub 32mb 8mb 60",
+    "replica-read-only": "yes",
+    "repl-backlog-size": str(1024 * 1024),
+    "repl-ping-replica-period": "10",
+    "min-replicas-to-write": "0",
+    "min-replicas-max-lag": "10",
+    "offload-min-keys": "10000",
+    "offload-threads": "2",
+    "databases": "16",
+    "lazyfree-lazy-user-flush": "no",
+    "lazyfree-lazy-user-del": "no",
+    "lazyfree-lazy-expire": "no",
+    "lazyfree-lazy-eviction": "no",
+    "maxmemory": "0",
+    "maxmemory-policy": "noeviction",
+    "maxmemory-samples": "5",
+    "lfu-log-factor": "10",
+    "lfu-decay-time": "1",
+    "slowlog-log-slower-than": "10000",
+    "slowlog-max-len": "128",
+    "latency-monitor-threshold": "0",
+    "latency-tracking": "yes",
+    "latency-tracking-info-percentiles": "50 99 99.9",
+}
+
+
+def get_config(key: str):
+    """
+    Return the configured value for key, falling back to its default
+    """
+    return os.getenv(key, DEFAULTS.get(key))
+
+
+def get_int_config(key: str) -> int:
+    return int(get_config(key))
+
+
+def get_bool_config(key: str) -> bool:
+    """
+    Redis style boolean, yes or no
+    """
+    return str(get_config(key)).lower() == "yes"
+
+
+def set_config(key: str, value):
+    os.environ[key] = str(value)
@@ -1,4 +1,49 @@
 import asyncio
+import heapq
+import itertools
+import time
+
+from app.clients import get_idle_deadline
+from app.config import get_bool_config, get_int_config
+from app.timer_wheel import TimerWheel
+from app.utils import gen_random_string
+
+# Config keys which are read into ReplicationSettings
+REPLICATION_CONFIG = {"replica-read-only", "min-replicas-to-write", "min-replicas-max-lag"}
+
+
+class ReplicationSettings:
+    """
+    Config checked on every write, read once instead of from the environment every time
+    """
+
+    def __init__(self):
+        self.replica_read_only = get_bool_config("replica-read-only")
+        self.min_replicas_to_write = get_int_config("min-replicas-to-write")
+        self.min_replicas_max_lag = get_int_config("min-replicas-max-lag")
+        if self.min_replicas_to_write < 0 or self.min_replicas_max_lag < 0:
+            raise ValueError("min-replicas-to-write and min-replicas-max-lag can not be negative")
+
+
+_settings = None
+
+
+def get_replication_settings() -> ReplicationSettings:
+    global _settings
+    if _settings is None:
+        _settings = ReplicationSettings()
+    return _settings
+
+
+def reload_replication_settings():
+    """
+    Read the config again, after it was changed
+
+    Raises:
+        ValueError: Config is not valid, previous settings are kept
+    """
+    global _settings
+    _settings = ReplicationSettings()
 
 
 class ConnectionRegistry:
@@ -9,18 +54,109 @@ class ConnectionRegistry:
             cls._instance = super().__new__(cls)
             cls._instance._replicas = []
             cls._instance._lock = asyncio.Lock()
+
+            # Replication stream is shared by all the client connections
+            cls._instance.replication_id = gen_random_string(40)
+            cls._instance.replication_offset = 0
+
+            # WAIT waiters, min-heap ordered by target offset
+            cls._instance._waiters = []
+            cls._instance._waiter_ids = itertools.count()
+
+            # Offset at which GETACK was last requested from replicas
+            cls._instance._getack_offset = -1
+
+            # Replication backlog, created when the first replica attaches.
+            # Replicas which reconnect continue from it instead of a full resync
+            cls._instance.backlog = None
+            # Replication offset of the first byte in backlog
+            cls._instance.backlog_offset = 0
+
+            # Database the replication stream has selected, None to SELECT again
+            # before the next write (replicas start on database 0 after a sync)
+            cls._instance.selected_db = None
+
+            # Our own connection to master, when we are a replica
+            cls._instance.master_link = None
+
+            # Connections of all clients (RedisProtocol), replicas included
+            cls._instance.clients = set()
+            # Clients by when they are next checked for being idle, see app.clients
+            cls._instance.idle_clients = TimerWheel(time.monotonic())
         return cls._instance
 
-    async def add_replica(self, writer, replication_id=None, offset=0):
+    def reset_replication(self, replication_id, offset):
+        """
+        Start a new replication history, for example after full resync with our master
+        """
+        self.replication_id = replication_id
+        self.replication_offset = offset
+        self._getack_offset = -1
+        self.backlog = None
+        self.backlog_offset = offset
+
+    def feed_backlog(self, data: bytes):
+        """
+        Append data of the replication stream to the backlog
+        """
+
+        self.backlog += data
+
+        # Trim in chunks, so the head is not moved on every write
+        backlog_size = get_int_config("repl-backlog-size")
+        excess = len(self.backlog) - backlog_size
+        if excess > backlog_size // 4:
+            del self.backlog[:excess]
+            self.backlog_offset += excess
+
+    def get_backlog(self, offset: int):
+        """
+        Return the replication stream from offset onwards,
+        or None if backlog no longer (or never) had that offset
+        """
+
+        if self.backlog is None:
+            return None
+
+        if not self.backlog_offset <= offset <= self.replication_offset:
+            return None
+
+        return bytes(self.backlog[offset - self.backlog_offset:])
+
+    def add_client(self, client):
+        self.clients.add(client)
+        self.idle_clients.add(client, get_idle_deadline(client, time.monotonic()))
+
+    def remove_client(self, client):
+        self.clients.discard(client)
+        self.idle_clients.remove(client)
+
+    async def add_replica(self, writer, replication_id=None, offset=0, listening_port=None):
         """
         Add a replica connection with thread-safe registration
         """
+        if self.backlog is None:
+            self.backlog = bytearray()
+            self.backlog_offset = self.replication_offset
+
+        self.selected_db = None
+
+        try:
+            ip = writer.get_extra_info('peername')[0]
+        except (AttributeError, TypeError, IndexError):
+            ip = None
+
         async with self._lock:
+            now = asyncio.get_event_loop().time()
             replica = {
                 'writer': writer,
                 'replication_id': replication_id,
                 'offset': offset,
-                'registered_at': asyncio.get_event_loop().time()
+                'registered_at': now,
+                # Time of the last REPLCONF ACK, used for lag
+                'ack_time': now,
+                'ip': ip,
+                'port': listening_port,
             }
             self._replicas.append(replica)
             return replica
@@ -35,6 +171,15 @@ class ConnectionRegistry:
                 if replica['writer'] != writer
             ]
 
+    async def disconnect_replicas(self):
+        """
+        Close all replica connections, they reconnect and sync again
+        """
+        async with self._lock:
+            for replica in self._replicas:
+                replica['writer'].close()
+            self._replicas = []
+
     def get_replicas(self):
         """
         Get all registered replicas
@@ -43,12 +188,106 @@ class ConnectionRegistry:
 
     async def update_replica_offset(self, writer, offset):
         """
-        Update the offset for a specific replica
+        Update the offset for a specific replica, and wake up WAIT commands
+        which now have enough replicas acknowledging their offset
         """
         for replica in self._replicas:
             if replica['writer'] == writer:
+                previous_offset = replica['offset']
                 replica['offset'] = offset
+                replica['ack_time'] = asyncio.get_event_loop().time()
                 break
+        else:
+            return
+
+        if offset > previous_offset:
+            self._notify_waiters(previous_offset, offset)
+
+    def _notify_waiters(self, previous_offset, offset):
+        """
+        One replica moved from previous_offset to offset.
+        Only waiters with target in (previous_offset, offset] gain an acknowledgement.
+        """
+
+        reached = []
+        while self._waiters and self._waiters[0][0] <= offset:
+            reached.append(heapq.heappop(self._waiters))
+
+        for waiter in reached:
+            target, _, required, _, future = waiter
+
+            if future.done():
+                continue
+
+            if target > previous_offset:
+                waiter[3] += 1
+
+            if waiter[3] >= required:
+                future.set_result(waiter[3])
+            else:
+                heapq.heappush(self._waiters, waiter)
+
+    async def wait_for_replicas(self, offset, required, timeout=None):
+        """
+        Wait till `required` replicas acknowledge `offset`, or timeout (in seconds) expires.
+
+        Returns:
+            int: Number of replicas which acknowledged the offset
+        """
+
+        acked = self.check_replica_sync(offset)
+        if acked >= required:
+            return acked
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = [offset, next(self._waiter_ids), required, acked, future]
+        heapq.heappush(self._waiters, waiter)
+
+        await self.request_acks(offset)
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return self.check_replica_sync(offset)
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+
+    async def request_acks(self, offset):
+        """
+        Ask replicas for their offset with REPLCONF GETACK.
+        Replicas also send ACK on their own every second, so this only speeds up
+        the acknowledgement, and is sent once for any number of concurrent WAITs.
+        """
+
+        if self._getack_offset >= offset:
+            return
+
+        self._getack_offset = self.replication_offset
+        await self.propagate(b"*3\r\n$8\r\nREPLCONF\r\n$6\r\nGETACK\r\n$1\r\n*\r\n")
+
+    async def propagate(self, data):
+        """
+        Send data to all replicas as part of the replication stream,
+        and advance the replication offset by its length in bytes.
+        """
+
+        if isinstance(data, str):
+            data = data.encode('utf-8', 'surrogateescape')
+
+        # Until a replica attaches, there is no replication stream to keep offset of
+        if self.backlog is None:
+            return self.replication_offset
+
+        self.feed_backlog(data)
+        self.replication_offset += len(data)
+        offset = self.replication_offset
+
+        if self._replicas:
+            await self.broadcast(data)
+
+        return offset
 
     async def broadcast(self, data):
         """
@@ -72,6 +311,37 @@ class ConnectionRegistry:
             if tasks:
                 await asyncio.gather(*tasks, return_exceptions=True)
 
+    def get_replica_lag(self, replica):
+        """
+        Lag of a replica
+
+        Returns:
+            int: Seconds since its last acknowledgement
+            int: Bytes of the replication stream it has not acknowledged yet
+        """
+        seconds = int(asyncio.get_event_loop().time() - replica['ack_time'])
+        return seconds, max(0, self.replication_offset - replica['offset'])
+
+    def count_good_replicas(self, max_lag):
+        """
+        Count replicas which acknowledged within max_lag seconds
+        """
+        now = asyncio.get_event_loop().time()
+        return sum(1 for replica in self._replicas if now - replica['ack_time'] <= max_lag)
+
+    async def ping_replicas(self):
+        """
+        Heartbeat: PING replicas every repl-ping-replica-period seconds, as part of
+        the replication stream. Replicas see the link is alive even without writes.
+        """
+
+        while True:
+            await asyncio.sleep(get_int_config("repl-ping-replica-period"))
+
+            # Replicas only proxy the stream of their master, they do not add to it
+            if self._replicas and self.master_link is None:
+                await self.propagate(b"*1\r\n$4\r\nPING\r\n")
+
     def check_replica_sync(self, offset):
         """
         Check how many replicas are synced to given offset
@@ -1,9 +1,20 @@
 from collections import OrderedDict
 from datetime import datetime
 from enum import Enum
+from itertools import islice
 
+from app.config import get_int_config
+from app.eviction import new_access, touch
 from app.exceptions import RedisException
-from app.utils import Singleton, StreamUtils
+from app.keyspace import BucketIndex, SortedKeys
+from app.lazyfree import free_async, free_value, get_lazyfree_settings
+from app.memory import (
+    DEFAULT_SAMPLES, STREAM_SIZE, get_stream_entry_size, get_stream_key_size, get_stream_size,
+    get_string_entry_size, sample_stream_size
+)
+from app.slots import key_hash_slot
+from app.stats import get_stats
+from app.utils import StreamUtils
 
 STREAM = "stream"
 
@@ -13,6 +24,9 @@ class Stream(OrderedDict):
     Base class for stream
     """
 
+    # Estimated memory of the stream, kept up to date by Database
+    memory = STREAM_SIZE
+
 
 class DBErrorCode(Enum):
     STREAM_ID_SMALLER_THAN_TOP = (STREAM, "small-top", "Stream ID is smaller than top element")
@@ -46,19 +60,190 @@ class RedisDBException(RedisException):
         return self.error_code.message
 
 
-class Database(metaclass=Singleton):
+class Database:
+    """
+    One logical database (SELECT index) of the keyspace
+    """
 
     def __init__(self, data=None):
-        self.data = data or OrderedDict()
+        # Keys of every hash slot (slot -> set of keys), only kept in cluster mode
+        self.slot_index = None
+
+        # Keys MIGRATE sent and waits on the target for, writes to them are refused meanwhile
+        self.keys_in_flight = set()
+
+        # Plain dict keeps insertion order as well, and iterates much faster than OrderedDict.
+        # Setter builds the indexes below as well.
+        self.data = data or {}
+
+    @property
+    def data(self):
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        # Whole dataset replaced (for example synced from master)
+        self._data = data
+
+        # Keys in buckets of a hash table of our own, which SCAN can resume from
+        self.buckets = BucketIndex(data)
+
+        # Keys in sorted order as well, for KEYS with a prefix
+        self.sorted_keys = SortedKeys(data)
+
+        # Keys with an expiry, in the same kind of index, for volatile eviction policies
+        self.volatile = BucketIndex(
+            key for key, value in data.items()
+            if not isinstance(value, Stream) and value["expires_at"] is not None
+        )
+
+        # Access time and LFU counter of every key, see app.eviction
+        self.access = dict.fromkeys(data, new_access())
+
+        # Estimated memory of all the keys, kept up to date on every write,
+        # and the part of it streams take
+        self.used_memory = 0
+        self.stream_memory = 0
+        self.stream_count = 0
+        for key, value in data.items():
+            if isinstance(value, Stream):
+                value.memory = get_stream_size(value)
+            self._account(key, value)
+
+        if self.slot_index is not None:
+            self.enable_slot_index()
 
     def clear(self):
         self.data = {}
 
+    def flush(self, asynchronous: bool = False):
+        """
+        Remove all keys. With asynchronous, the database is emptied right away,
+        and the old keys are freed by the lazy free thread.
+        """
+
+        if not asynchronous:
+            self.clear()
+            return
+
+        data, access, slot_index, sorted_keys = self._data, self.access, self.slot_index, self.sorted_keys
+        indexes = (self.buckets, self.volatile)
+        self.clear()
+
+        # Indexes hold the keys as well, so they are freed in the background too
+        garbage = [data, access, sorted_keys.chunks]
+        for index in indexes:
+            garbage.append(index.table)
+            if index.new_table is not None:
+                garbage.append(index.new_table)
+        if slot_index is not None:
+            garbage.append(slot_index)
+        free_async(*garbage)
+
+    def enable_slot_index(self):
+        """
+        Index keys by hash slot, so that keys of a slot can be counted and listed
+        without a scan of the whole keyspace
+        """
+        self.slot_index = {}
+        for key in self._data:
+            self._index_slot(key)
+
+    def _key_added(self, key):
+        """
+        Called for every new key, before it is stored
+        """
+        self.buckets.add(key)
+        self.sorted_keys.add(key)
+        self.access[key] = new_access()
+        if self.slot_index is not None:
+            self._index_slot(key)
+
+    def _key_removed(self, key, value):
+        self.buckets.remove(key)
+        self.sorted_keys.remove(key)
+        del self.access[key]
+        self._account(key, value, -1)
+        if not isinstance(value, Stream) and value["expires_at"] is not None:
+            self.volatile.remove(key)
+        if self.slot_index is not None:
+            self._unindex_slot(key)
+
+    @staticmethod
+    def _get_entry_size(key, value) -> int:
+        if isinstance(value, Stream):
+            return get_stream_key_size(key) + value.memory
+        return get_string_entry_size(key, value)
+
+    def _account(self, key, value, sign: int = 1):
+        """
+        Add (or with sign of -1, remove) the estimated memory of a key to the totals
+        """
+        size = self._get_entry_size(key, value) * sign
+        self.used_memory += size
+        if isinstance(value, Stream):
+            self.stream_memory += size
+            self.stream_count += sign
+
+    def get_memory_usage(self, key, samples: int = DEFAULT_SAMPLES):
+        """
+        Estimated memory of the key and its value in bytes, None if the key does not exist.
+
+        Streams are measured again from samples of their entries (all with samples of 0),
+        rather than taken from the running estimate.
+        """
+        value = self._data.get(key)
+        if value is None:
+            return None
+
+        if isinstance(value, Stream):
+            return get_stream_key_size(key) + sample_stream_size(value, samples)
+        return get_string_entry_size(key, value)
+
+    def _index_slot(self, key):
+        slot = key_hash_slot(key)
+        keys = self.slot_index.get(slot)
+        if keys is None:
+            keys = self.slot_index[slot] = set()
+        keys.add(key)
+
+    def _unindex_slot(self, key):
+        slot = key_hash_slot(key)
+        keys = self.slot_index.get(slot)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.slot_index[slot]
+
+    def count_keys_in_slot(self, slot: int) -> int:
+        return len(self.slot_index.get(slot, ()))
+
+    def get_keys_with_prefix(self, prefix: str) -> list:
+        return self.sorted_keys.with_prefix(prefix)
+
+    def get_keys_in_slot(self, slot: int, count: int = None) -> list:
+        keys = self.slot_index.get(slot, ())
+        return list(islice(keys, count))
+
     def set(self, key, value, expires=None):
-        self.data[key] = {
+        old = self._data.get(key)
+        if old is None:
+            self._key_added(key)
+        else:
+            self._account(key, old, -1)
+            self.access[key] = touch(self.access[key])
+
+        entry = self._data[key] = {
             "value": value,
             "expires_at": expires,
         }
+        self.used_memory += get_string_entry_size(key, entry)
+
+        had_expiry = old is not None and not isinstance(old, Stream) and old["expires_at"] is not None
+        if expires is not None and not had_expiry:
+            self.volatile.add(key)
+        elif expires is None and had_expiry:
+            self.volatile.remove(key)
 
     def add_stream(self, stream_key, stream_id, *args):
         """
@@ -78,19 +263,31 @@ class Database(metaclass=Singleton):
             raise RedisDBException(DBErrorCode.STREAM_ID_SMALLER_THAN_0)
 
         # First check if stream_key exists, if not, create one
-        if stream_key not in self.data:
-            self.data[stream_key] = Stream()
+        stream = self._data.get(stream_key)
+        if stream is None:
             last_stream_id = "0-0"
         else:
-            last_stream_id = next(reversed(self.data[stream_key]))
+            last_stream_id = next(reversed(stream))
             if not StreamUtils.validate_stream_ids(last_stream_id, stream_id):
                 raise RedisDBException(DBErrorCode.STREAM_ID_SMALLER_THAN_TOP)
 
         stream_id = StreamUtils.generate_stream_id(stream_id, last_stream_id)
 
+        if stream is None:
+            self._key_added(stream_key)
+            stream = self._data[stream_key] = Stream()
+            self._account(stream_key, stream)
+        else:
+            self.access[stream_key] = touch(self.access[stream_key])
+
         # Args are key1, value1, key2, value2 format
         result = {args[i]: args[i + 1] for i in range(0, len(args), 2)}
-        self.data[stream_key][stream_id] = result
+        stream[stream_id] = result
+
+        entry_size = get_stream_entry_size(stream_id, result)
+        stream.memory += entry_size
+        self.used_memory += entry_size
+        self.stream_memory += entry_size
         return stream_id
 
     def get_range_stream(self, stream_key: str, start_stream_id: str, end_stream_id: str="+") -> list:
@@ -102,33 +299,144 @@ class Database(metaclass=Singleton):
         if streams is None:
             return []
 
+        return self.get_range_of_stream(streams, start_stream_id, end_stream_id)
+
+    @staticmethod
+    def get_range_of_stream(stream: Stream, start_stream_id: str, end_stream_id: str="+") -> list:
+        """
+        Same as get_range_stream, for a stream object (for example a snapshot of one)
+        """
+
         if start_stream_id == "-":
             start_stream_id = "0-0"
 
         if end_stream_id == "+":
-            end_stream_id = max(self.data[stream_key].keys())
+            end_stream_id = max(stream.keys())
+
+        return StreamUtils.get_single_stream(start_stream_id, end_stream_id, stream)
 
-        return StreamUtils.get_single_stream(start_stream_id, end_stream_id, streams)
+    def restore(self, key, value, expires=None):
+        """
+        Store a value restored from a DUMP payload, string or stream
+        """
 
-    def get(self, key: str):
-        value = self.data.get(key)
+        if not isinstance(value, Stream):
+            self.set(key, value, expires)
+            return
 
-        if isinstance(value, Stream):
-            return value
+        self.del_key(key)
+        self._key_added(key)
+        self._data[key] = value
+
+        value.memory = get_stream_size(value)
+        self._account(key, value)
+
+    def get_expiry(self, key):
+        """
+        Return when the key expires, None if it does not (streams never do)
+        """
+        value = self._data.get(key)
+        if value is None or isinstance(value, Stream):
+            return None
+        return value["expires_at"]
+
+    def get(self, key: str, update_access: bool = True):
+        """
+        Return the value of key, None if it does not exist (or expired).
+        Access time of the key is updated, unless update_access is disabled.
+        """
+        value = self._data.get(key)
 
-        if value is not None:
+        if value is None:
+            return None
+
+        if not isinstance(value, Stream):
             if value["expires_at"] is not None and value["expires_at"] < datetime.now():
-                self.del_key(key)
-                value = {}
+                self.del_key(key, get_lazyfree_settings().lazy_expire)
+                get_stats().expired_keys += 1
+                return None
+            value = value["value"]
+
+        if update_access:
+            self.access[key] = touch(self.access[key])
 
+        return value
+
+    def del_key(self, key, lazy: bool = False):
+        """
+        Remove the key. With lazy, a big value is freed by the lazy free thread.
+        """
+        value = self._data.pop(key, None)
         if value is None:
-            value = {}
+            return
 
-        return value.get("value")
+        self._key_removed(key, value)
+        if lazy:
+            free_value(value)
 
-    def del_key(self, key):
-        if key in self.data:
-            del self.data[key]
+    def scan(self, cursor: int, count: int = 10):
+        """
+        Return keys from cursor on (about count of them), and the cursor to continue from.
+        Cursor 0 starts, and is returned when the scan is complete.
+        """
+        return self.buckets.scan(cursor, count)
 
     def __iter__(self):
-        return iter(self.data)
+        return iter(self._data)
+
+    def __len__(self):
+        # Like Redis DBSIZE, expired keys count till they are deleted
+        return len(self._data)
+
+
+# Logical databases, index is the number clients SELECT.
+# Created on first use, with the number of databases configured.
+_databases = None
+
+
+def get_databases() -> list:
+    global _databases
+    if _databases is None:
+        _databases = [Database() for _ in range(get_int_config("databases"))]
+    return _databases
+
+
+def set_databases(databases: list):
+    global _databases
+    _databases = databases
+
+
+def get_database(index: int = 0) -> Database:
+    return get_databases()[index]
+
+
+def load_databases(rdb_databases: dict, key_filter=None):
+    """
+    Replace the data of every database with the ones read from an RDB file
+
+    Args:
+        rdb_databases: Database index -> data
+        key_filter: Keep only the keys this returns True for
+
+    Raises:
+        ValueError: RDB has more databases than configured
+    """
+
+    databases = get_databases()
+    for index in rdb_databases:
+        if index >= len(databases):
+            raise ValueError(f"RDB has database {index}, only {len(databases)} databases are configured")
+
+    for index, db in enumerate(databases):
+        data = rdb_databases.get(index, {})
+        if key_filter is not None:
+            data = {key: value for key, value in data.items() if key_filter(key)}
+        db.data = data
+
+
+def swap_databases(first: int, second: int):
+    """
+    SWAPDB, clients connected to one database see the data of the other right away
+    """
+    databases = get_databases()
+    databases[first], databases[second] = databases[second], databases[first]
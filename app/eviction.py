@@ -0,0 +1,295 @@
+"""
+maxmemory and eviction of keys, approximated the way Redis does it.
+
+Keys are not kept in any global LRU / LFU order. Every key has one int of
+access data instead, (access time in seconds << 8) | LFU counter:
+
+    LRU     idle time is now - access time
+    LFU     logarithmic counter of accesses (0-255), which decays by one for every
+            lfu-decay-time minutes the key is not accessed
+
+To evict, maxmemory-samples random keys of every database are scored, and the
+best candidates are kept in a small eviction pool, sorted by score. The pool
+is kept between evictions, so it keeps getting better than a single sample.
+Best key of the pool is evicted, till used memory is below maxmemory again.
+"""
+
+from bisect import insort
+import random
+from time import time
+
+from app.config import get_config, get_int_config
+from app.lazyfree import get_lazyfree_settings
+
+NOEVICTION = "noeviction"
+ALLKEYS_LRU = "allkeys-lru"
+ALLKEYS_LFU = "allkeys-lfu"
+ALLKEYS_RANDOM = "allkeys-random"
+VOLATILE_LRU = "volatile-lru"
+VOLATILE_LFU = "volatile-lfu"
+VOLATILE_RANDOM = "volatile-random"
+VOLATILE_TTL = "volatile-ttl"
+
+POLICIES = {
+    NOEVICTION, ALLKEYS_LRU, ALLKEYS_LFU, ALLKEYS_RANDOM,
+    VOLATILE_LRU, VOLATILE_LFU, VOLATILE_RANDOM, VOLATILE_TTL,
+}
+
+# Config keys which are read into EvictionSettings
+SETTINGS_KEYS = {"maxmemory", "maxmemory-policy", "maxmemory-samples", "lfu-log-factor", "lfu-decay-time"}
+
+# Candidates kept in the eviction pool
+EVPOOL_SIZE = 16
+
+# LFU counter of new keys, so that they are not evicted right away
+LFU_INIT_VAL = 5
+LFU_COUNTER_MAX = 255
+
+MEMORY_UNITS = {
+    "b": 1, "k": 1000, "kb": 1024, "m": 1000 ** 2, "mb": 1024 ** 2, "g": 1000 ** 3, "gb": 1024 ** 3,
+}
+
+
+def parse_memory(value: str) -> int:
+    """
+    Redis style memory size, 100mb, 1gb, 4096 and so on
+    """
+
+    value = str(value).strip().lower()
+    for unit in sorted(MEMORY_UNITS, key=len, reverse=True):
+        if value.endswith(unit) and value[:-len(unit)].isdigit():
+            return int(value[:-len(unit)]) * MEMORY_UNITS[unit]
+
+    return int(value)
+
+
+class EvictionSettings:
+    """
+    Config used on every access and write, read once instead of from the environment every time
+    """
+
+    def __init__(self):
+        self.maxmemory = parse_memory(get_config("maxmemory"))
+
+        self.policy = get_config("maxmemory-policy").lower()
+        if self.policy not in POLICIES:
+            raise ValueError(f"Invalid maxmemory-policy: {self.policy}")
+
+        self.samples = get_int_config("maxmemory-samples")
+        self.lfu_log_factor = get_int_config("lfu-log-factor")
+        self.lfu_decay_time = get_int_config("lfu-decay-time")
+
+        self.lfu = self.policy in (ALLKEYS_LFU, VOLATILE_LFU)
+        self.volatile = self.policy.startswith("volatile")
+
+
+_settings = None
+
+
+def get_settings() -> EvictionSettings:
+    global _settings
+    if _settings is None:
+        _settings = EvictionSettings()
+    return _settings
+
+
+def reload_settings():
+    """
+    Read the config again, after it was changed
+
+    Raises:
+        ValueError: Config is not valid, previous settings are kept
+    """
+    global _settings
+    _settings = EvictionSettings()
+
+    # Scores of the candidates may be of another policy
+    _pool.clear()
+
+
+def new_access() -> int:
+    return (int(time()) << 8) | LFU_INIT_VAL
+
+
+def touch(access: int) -> int:
+    """
+    Access data of a key which was just accessed
+    """
+
+    now = int(time())
+    settings = _settings or get_settings()
+    if not settings.lfu:
+        return (now << 8) | (access & LFU_COUNTER_MAX)
+
+    counter = lfu_log_incr(lfu_decr(access, now, settings.lfu_decay_time), settings.lfu_log_factor)
+    return (now << 8) | counter
+
+
+def lfu_decr(access: int, now: int, decay_time: int) -> int:
+    """
+    LFU counter, decayed by the periods passed since the last access
+    """
+    counter = access & LFU_COUNTER_MAX
+    if decay_time <= 0:
+        return counter
+
+    periods = (now - (access >> 8)) // (decay_time * 60)
+    return max(0, counter - periods)
+
+
+def lfu_log_incr(counter: int, log_factor: int) -> int:
+    """
+    Increment the counter with a probability which drops as it grows,
+    so 255 stands for about a million accesses with the default log factor
+    """
+    if counter >= LFU_COUNTER_MAX:
+        return counter
+
+    base = max(0, counter - LFU_INIT_VAL)
+    if random.random() < 1.0 / (base * log_factor + 1):
+        counter += 1
+    return counter
+
+
+def get_score(db, key: str, settings: EvictionSettings, now: int):
+    """
+    Score of an eviction candidate, the higher the score the better to evict it.
+    None if the key is gone (or has no expiry left, for volatile-ttl).
+    """
+
+    access = db.access.get(key)
+    if access is None:
+        return None
+
+    if settings.policy == VOLATILE_TTL:
+        expires_at = db.get_expiry(key)
+        if expires_at is None:
+            return None
+        # Sooner to expire, better to evict
+        return -expires_at.timestamp()
+
+    if settings.lfu:
+        return LFU_COUNTER_MAX - lfu_decr(access, now, settings.lfu_decay_time)
+
+    # Idle time
+    return now - (access >> 8)
+
+
+class EvictionPool:
+    """
+    Best candidates for eviction seen so far, as (score, db index, key) sorted by score
+    """
+
+    def __init__(self):
+        self.entries = []
+
+    def populate(self, db_index: int, db, settings: EvictionSettings):
+        index = db.volatile if settings.volatile else db.buckets
+        now = int(time())
+
+        for key in index.sample(settings.samples):
+            score = get_score(db, key, settings, now)
+            if score is None:
+                continue
+
+            if len(self.entries) >= EVPOOL_SIZE and score <= self.entries[0][0]:
+                continue
+
+            # Key may be in the pool with an older score already
+            self.entries = [
+                entry for entry in self.entries if entry[1] != db_index or entry[2] != key
+            ]
+            insort(self.entries, (score, db_index, key))
+            if len(self.entries) > EVPOOL_SIZE:
+                del self.entries[0]
+
+    def pop(self):
+        """
+        Remove and return the best candidate, as (db index, key), None when the pool is empty
+        """
+        if not self.entries:
+            return None
+        _, db_index, key = self.entries.pop()
+        return db_index, key
+
+    def clear(self):
+        self.entries = []
+
+
+_pool = EvictionPool()
+
+
+def get_used_memory(databases) -> int:
+    return sum(db.used_memory for db in databases)
+
+
+def select_victim(databases: list, settings: EvictionSettings):
+    """
+    Pick the key to evict next, as (db index, key), None if there is nothing to evict
+    """
+
+    if settings.policy in (ALLKEYS_RANDOM, VOLATILE_RANDOM):
+        candidates = [
+            (db_index, db) for db_index, db in enumerate(databases)
+            if len(db.volatile if settings.volatile else db.buckets)
+        ]
+        if not candidates:
+            return None
+
+        db_index, db = random.choice(candidates)
+        keys = (db.volatile if settings.volatile else db.buckets).sample(1)
+        return (db_index, keys[0]) if keys else None
+
+    for db_index, db in enumerate(databases):
+        _pool.populate(db_index, db, settings)
+
+    while True:
+        victim = _pool.pop()
+        if victim is None:
+            return None
+
+        db_index, key = victim
+        # Candidate could have been deleted meanwhile
+        if key in databases[db_index].access:
+            return victim
+
+
+def perform_evictions(databases: list) -> list:
+    """
+    Evict keys till used memory is within maxmemory. Values of evicted keys
+    are freed in the background with lazyfree-lazy-eviction.
+
+    Returns:
+        list: (db index, key) of the evicted keys. Still over maxmemory
+            if no more keys could be evicted, or the policy is noeviction.
+    """
+
+    settings = get_settings()
+    if settings.maxmemory <= 0:
+        return []
+
+    evicted = []
+    used_memory = get_used_memory(databases)
+    if used_memory <= settings.maxmemory:
+        return evicted
+
+    lazy = get_lazyfree_settings().lazy_eviction
+    while used_memory > settings.maxmemory and settings.policy != NOEVICTION:
+        victim = select_victim(databases, settings)
+        if victim is None:
+            break
+
+        db_index, key = victim
+        db = databases[db_index]
+
+        before = db.used_memory
+        db.del_key(key, lazy)
+        used_memory -= before - db.used_memory
+        evicted.append(victim)
+
+    return evicted
+
+
+def is_over_maxmemory(databases: list) -> bool:
+    settings = get_settings()
+    return 0 < settings.maxmemory < get_used_memory(databases)
@@ -2,3 +2,80 @@ class RedisException(Exception):
     """
     Generic RedisException
     """
+
+    # Prefix of the error reply, clients use it to tell the kind of error
+    error_code = "ERR"
+
+
+class ReadOnlyException(RedisException):
+    """
+    Write command sent to a read only replica
+    """
+
+    error_code = "READONLY"
+
+
+class NoReplicasException(RedisException):
+    """
+    Not enough replicas with acceptable lag to accept writes
+    """
+
+    error_code = "NOREPLICAS"
+
+
+class CrossSlotException(RedisException):
+    """
+    Keys of a multi key command are not all served by the same node (or shard)
+    """
+
+    error_code = "CROSSSLOT"
+
+
+class MovedException(RedisException):
+    """
+    Key is served by another cluster node, message is "<slot> <host>:<port>"
+    """
+
+    error_code = "MOVED"
+
+
+class AskException(RedisException):
+    """
+    Slot is being migrated and the key is not here (anymore), client should
+    retry on the target node once, preceded by ASKING. Message is "<slot> <host>:<port>"
+    """
+
+    error_code = "ASK"
+
+
+class TryAgainException(RedisException):
+    """
+    Multi key command on a slot being migrated, with only some of its keys here,
+    or write to a key MIGRATE is sending
+    """
+
+    error_code = "TRYAGAIN"
+
+
+class BusyKeyException(RedisException):
+    """
+    RESTORE of a key which already exists, without REPLACE
+    """
+
+    error_code = "BUSYKEY"
+
+
+class TargetIOException(RedisException):
+    """
+    Connection with the target of MIGRATE failed or timed out
+    """
+
+    error_code = "IOERR"
+
+
+class OutOfMemoryException(RedisException):
+    """
+    Command would use more memory, while used memory is over maxmemory and nothing can be evicted
+    """
+
+    error_code = "OOM"
@@ -1,58 +1,149 @@
 import asyncio
-import base64
 from datetime import datetime, timedelta
-import fnmatch
 import os
-
-from app.connection_registry import ConnectionRegistry
+from time import perf_counter_ns
+
+from app.clients import CLIENT_CONFIG, reload_client_settings
+from app.commands.clients import ClientCommandsMixin
+from app.commands.cluster import ClusterCommandsMixin
+from app.commands.databases import DatabaseCommandsMixin
+from app.commands.debug import DebugCommandsMixin
+from app.commands.introspection import IntrospectionCommandsMixin
+from app.commands.names import (
+    ASKING, CLIENT, CLUSTER, CONFIG, DBSIZE, DEBUG, DEL, DISCARD, DUMP, ECHO, EXEC, FLUSHALL, FLUSHDB, GET, INCR, INFO,
+    KEYS, LATENCY, MEMORY, MIGRATE, MOVE, MULTI, PING, PSYNC, REPLCONF, RESTORE, RESTORE_ASKING, SCAN, SELECT, SET,
+    SLOWLOG, SWAPDB, TYPE, UNLINK, WAIT, XADD, XRANGE, XREAD
+)
+from app.commands.replication import ReplicationCommandsMixin
+from app.connection_registry import ConnectionRegistry, REPLICATION_CONFIG, reload_replication_settings
 from app.serialiser import RedisEncoder, RedisDecoder, RedisType
-from app.exceptions import RedisException
-from app.database import Database, RedisDBException, STREAM
-from app.utils import gen_random_string
-
-
-PING = "ping"
-ECHO = "echo"
-SET = "set"
-GET = "get"
-INCR = "incr"
-XADD = "xadd"
-XRANGE = "xrange"
-XREAD = "xread"
-MULTI = "multi"
-EXEC = "exec"
-DISCARD = "discard"
-CONFIG = "config"
-KEYS = "keys"
-INFO = "info"
-REPLCONF = "replconf"
-PSYNC = "psync"
-WAIT = "wait"
-TYPE = "type"
-
-EMPTY_RDB = "UkVESVMwMDEx+glyZWRpcy12ZXIFNy4yLjD6CnJlZGlzLWJpdHPAQPoFY3RpbWXCbQi8ZfoIdXNlZC1tZW3CsMQQAPoIYW9mLWJhc2XAAP/wbjv+wP9aog=="
-
-
-class RedisCommandHandler:
+from app.config import get_config, set_config
+from app.exceptions import OutOfMemoryException, RedisException
+from app.database import Database, RedisDBException, STREAM, Stream, get_database, get_databases
+from app.eviction import SETTINGS_KEYS, is_over_maxmemory, perform_evictions, reload_settings
+from app.latency import COMMAND_EVENT, EVICTION_EVENT, LATENCY_CONFIG, get_latency_monitor
+from app.lazyfree import LAZYFREE_CONFIG, get_lazyfree_settings, reload_lazyfree_settings
+from app.offload import match_keys, run_offloaded, should_offload
+from app.pattern import compile_pattern
+from app.cluster import get_cluster
+from app.sharding import get_router
+from app.slowlog import SLOWLOG_CONFIG, get_slowlog
+from app.stats import STATS_CONFIG, get_info_percentiles, get_stats
+
+
+# Commands which modify the dataset, these are propagated to replicas
+WRITE_COMMANDS = {
+    SET, INCR, XADD, DEL, UNLINK, RESTORE, RESTORE_ASKING, MOVE, SWAPDB, FLUSHDB, FLUSHALL
+}
+
+# Commands which may use more memory, refused once over maxmemory with nothing left to evict
+DENYOOM_COMMANDS = {SET, INCR, XADD, RESTORE, RESTORE_ASKING}
+
+# Bytes of replies of a batch between checks of the output buffer limits
+OUTPUT_CHECK_BYTES = 64 * 1024
+
+
+class RedisCommandHandler(
+    ClusterCommandsMixin, DatabaseCommandsMixin, IntrospectionCommandsMixin,
+    DebugCommandsMixin, ClientCommandsMixin, ReplicationCommandsMixin
+):
 
     def __init__(self, connection_registry=None):
         self.encoder = RedisEncoder()
-        self.db = Database()
 
-        self.replication_id = None
-        self.replication_offset = None
+        # Logical database this connection SELECTed
+        self.db_index = 0
 
         self.connection_registry = connection_registry or ConnectionRegistry()
 
         self.is_replica = os.getenv("replicaof", False)
-        if not self.is_replica:
-            self.replication_id = gen_random_string(40)
-            self.replication_offset = 0
+
+        # Is this handler applying the replication stream sent by our master?
+        self.is_master_link = False
+
+        # Port a replica connected on this connection listens on (REPLCONF listening-port)
+        self.replica_listening_port = None
+
+        # Set in sharded mode, routes commands for keys owned by other worker processes
+        self.shard_router = get_router()
+
+        # Set in cluster mode, commands for keys of other nodes are redirected with MOVED
+        self.cluster = get_cluster()
+
+        # Counters of INFO, bumped for every command. Reset in place, the object is kept.
+        self.stats = get_stats()
+
+        # Client sent ASKING, next command may use keys of a slot we are importing
+        self.asking = False
+
+        # Connection (RedisProtocol) this handler serves, None when it serves none (master link)
+        self.client = None
+
+        # Last command of this connection, cmd of CLIENT LIST
+        self.last_command = None
+
+        # Built once per connection, looked up for every command
+        self.command_map = {
+            PING: self.ping,
+            ECHO: self.echo,
+            SET: self.set,
+            GET: self.get,
+            INCR: self.increment,
+            XADD: self.xadd,
+            XRANGE: self.xrange,
+            XREAD: self.xread,
+            MULTI: self.multi,
+            EXEC: self.exec,
+            DISCARD: self.discard,
+            CONFIG: self.config,
+            KEYS: self.keys,
+            INFO: self.info,
+            REPLCONF: self.replconf,
+            PSYNC: self.psync,
+            WAIT: self.wait,
+            TYPE: self.type,
+            SCAN: self.scan,
+            CLUSTER: self.cluster_command,
+            DEL: self.delete,
+            UNLINK: self.unlink,
+            DUMP: self.dump,
+            RESTORE: self.restore,
+            RESTORE_ASKING: self.restore,
+            ASKING: self.asking_command,
+            MIGRATE: self.migrate,
+            SELECT: self.select,
+            MOVE: self.move,
+            SWAPDB: self.swapdb,
+            DBSIZE: self.dbsize,
+            FLUSHDB: self.flushdb,
+            FLUSHALL: self.flushall,
+            MEMORY: self.memory_command,
+            SLOWLOG: self.slowlog_command,
+            LATENCY: self.latency_command,
+            DEBUG: self.debug_command,
+            CLIENT: self.client_command,
+        }
 
         self.bytes_processed = 0
 
+        # Replication offset right after the last write of this client, used by WAIT
+        self.last_write_offset = 0
+
         self.transaction_queue = None
 
+    @property
+    def db(self) -> Database:
+        # Looked up every time, SWAPDB changes the database behind an index
+        return get_database(self.db_index)
+
+    @property
+    def replication_id(self):
+        return self.connection_registry.replication_id
+
+    @property
+    def replication_offset(self):
+        return self.connection_registry.replication_offset
+
     ####### Actual Command Functions ######################
 
     async def ping(self, command_arr):
@@ -73,6 +164,10 @@ class RedisCommandHandler:
                 expires_at = datetime.now() + timedelta(milliseconds=int(optional_args[idx+1]))
             elif arg.lower() == "ex":
                 expires_at = datetime.now() + timedelta(seconds=int(optional_args[idx+1]))
+            elif arg.lower() == "pxat":
+                expires_at = datetime.fromtimestamp(int(optional_args[idx+1]) / 1000)
+            elif arg.lower() == "exat":
+                expires_at = datetime.fromtimestamp(int(optional_args[idx+1]))
 
         self.db.set(key, value, expires_at)
 
@@ -102,6 +197,12 @@ class RedisCommandHandler:
         start_id = args[1]
         end_id = args[2]
 
+        # Big streams are read from a snapshot in a worker thread
+        value = self.lookup_key_read(stream)
+        if isinstance(value, Stream) and should_offload(len(value)):
+            result = await run_offloaded(Database.get_range_of_stream, value.copy(), start_id, end_id)
+            return result, RedisType.ARRAY
+
         return self.db.get_range_stream(stream, start_id, end_id), RedisType.ARRAY
 
     async def xread(self, args):
@@ -187,10 +288,21 @@ class RedisCommandHandler:
 
         return None, RedisType.BULK_STRING  # No matching data found for any streams
 
+    def lookup_key_read(self, key):
+        """
+        Value of key for a read command, counted as a keyspace hit or miss
+        """
+        value = self.db.get(key)
+        if value is None:
+            self.stats.keyspace_misses += 1
+        else:
+            self.stats.keyspace_hits += 1
+        return value
+
     async def get(self, key):
 
         key = key[0]
-        value = self.db.get(key)
+        value = self.lookup_key_read(key)
 
         return value, RedisType.BULK_STRING
 
@@ -212,186 +324,218 @@ class RedisCommandHandler:
 
         return value, RedisType.INTEGER
 
+    @staticmethod
+    def get_value_type(value):
+        if isinstance(value, str):
+            return "string"
+        if isinstance(value, dict):
+            return "stream"
+        return "none"
+
     async def type(self, key):
         key = key[0]
-        value = self.db.get(key)
-
-        value_type = "none"
-
-        if isinstance(value, str):
-            value_type = "string"
-        elif isinstance(value, dict):
-            value_type = "stream"
+        value = self.lookup_key_read(key)
 
-        return value_type, RedisType.SIMPLE_STRING
+        return self.get_value_type(value), RedisType.SIMPLE_STRING
 
-    async def keys(self, pattern):
-        """
-        Match the pattern against DB keys, and return that
+    async def scan(self, args):
         """
+        SCAN cursor [MATCH pattern] [COUNT count] [TYPE type]
 
-        result = []
-        for key in self.db:
-            if fnmatch.fnmatch(key, pattern[0]):
-                result.append(key)
-
-        return result, RedisType.ARRAY
-
-    async def config_get(self, args):
-        key = args[0]
-        value = os.getenv(key)
-        return [key, value], RedisType.ARRAY
-
-    async def config(self, args):
-
-        subcommand = args[0].lower()
-
-        config_map = {
-            "get": self.config_get,
-        }
-
-        if subcommand not in config_map:
-            raise RedisException(f"Invalid config subcommand: {subcommand}")
-
-        return await config_map[subcommand](args[1:])
-
-    async def info_replication(self):
-        is_replica = os.getenv("replicaof")
-        role = "slave" if is_replica else "master"
-
-        # Initialize the response dictionary with the role
-        response_parts = {"role": role}
-
-        # Add additional master-specific information if the node is a master
-        if role == "master":
-            response_parts["master_repl_offset"] = self.replication_offset
-            response_parts["master_replid"] = self.replication_id
-
-        # Convert dictionary to formatted response lines and encode
-        response_lines = [f"{key}:{value}" for key, value in response_parts.items()]
-        return "\r\n".join(response_lines), RedisType.BULK_STRING
-
-    async def info(self, args=None):
-
-        args = args or []
-
-        if not args:
-            raise RedisException("Currently, INFO command expects subcommand")
+        Every key present from the start to the end of a full scan is returned
+        at least once (a key may be returned more than once).
+        """
 
-        subcommand = args[0].lower()
+        try:
+            cursor = int(args[0])
+        except ValueError:
+            raise RedisException("invalid cursor")
+
+        pattern = value_type = None
+        count = 10
+
+        options = args[1:]
+        if len(options) % 2 != 0:
+            raise RedisException("syntax error")
+
+        for idx in range(0, len(options), 2):
+            option, value = options[idx].lower(), options[idx + 1]
+            if option == "match":
+                pattern = value
+            elif option == "count":
+                count = int(value)
+                if count < 1:
+                    raise RedisException("syntax error")
+            elif option == "type":
+                value_type = value.lower()
+            else:
+                raise RedisException("syntax error")
+
+        if self.shard_router is not None:
+            cursor, keys = await self.scan_shards(cursor, args[1:], count, pattern, value_type)
+        else:
+            cursor, keys = self.scan_keys(cursor, count, pattern, value_type)
 
-        info_map = {
-            "replication": self.info_replication,
-        }
+        return [str(cursor), keys], RedisType.ARRAY
 
-        if subcommand not in info_map:
-            raise RedisException(f"Invalid info subcommand: {subcommand}")
+    def scan_keys(self, cursor, count, pattern, value_type):
+        cursor, keys = self.db.scan(cursor, count)
 
-        return await info_map[subcommand]()
+        if pattern is not None and pattern != "*":
+            keys = match_keys(keys, pattern)
 
-    async def wait(self, args):
+        result = []
+        for key in keys:
+            # Expired keys are deleted, and not returned
+            value = self.db.get(key, update_access=False)
+            if value is None:
+                continue
+            if value_type is not None and self.get_value_type(value) != value_type:
+                continue
+            result.append(key)
+
+        return cursor, result
+
+    async def scan_shards(self, cursor, options, count, pattern, value_type):
         """
-        Sends response back to wait command with continuous checking for replica sync.
-        Exits when either the required number of replicas are synced or timeout is reached.
-
-        Args:
-            args[0]: Required minimum number of synced replicas
-            args[1]: Timeout in milliseconds
+        In sharded mode, shards are scanned one after another.
+        Cursor carries the shard being scanned in its lowest digits (base number of shards).
         """
-        required_min_sync = int(args[0])
-        timeout_ms = int(args[1])
-        timeout_seconds = timeout_ms / 1000.0  # Convert milliseconds to seconds
 
-        # Capture the current offset before sending REPLCONF
-        # This ensures we wait for all writes that occurred before the WAIT command
-        target_offset = self.replication_offset
+        router = self.shard_router
+        shard_cursor, shard_id = divmod(cursor, router.shards)
 
-        if target_offset == 0:
-            return len(self.connection_registry.get_replicas()), RedisType.INTEGER
-
-        # Calculate when the timeout will occur
-        start_time = asyncio.get_event_loop().time()
-        end_time = start_time + timeout_seconds
-
-        # Send initial GETACK command to all replicas
-        await self.write_to_replicas(self.encoder.encode_array(["REPLCONF", "GETACK", "*"]))
+        if shard_id == router.shard_id:
+            shard_cursor, keys = self.scan_keys(shard_cursor, count, pattern, value_type)
+        else:
+            shard_cursor, keys = await router.get_client(shard_id).execute(SCAN, shard_cursor, *options)
+            shard_cursor = int(shard_cursor)
 
-        while True:
-            # Check current sync status
-            replicas_synced = self.connection_registry.check_replica_sync(target_offset)
+        if shard_cursor != 0:
+            return shard_cursor * router.shards + shard_id, keys
 
-            # If we have enough synced replicas, return immediately
-            if replicas_synced >= required_min_sync:
-                return replicas_synced, RedisType.INTEGER
+        # This shard is done, next one starts from its beginning
+        if shard_id + 1 < router.shards:
+            return shard_id + 1, keys
+        return 0, keys
 
-            # Check if we've exceeded the timeout
-            current_time = asyncio.get_event_loop().time()
-            if current_time >= end_time:
-                return replicas_synced, RedisType.INTEGER
+    def delete_keys(self, keys, lazy: bool):
+        deleted = 0
+        for key in keys:
+            if self.db.get(key) is not None:
+                self.db.del_key(key, lazy)
+                deleted += 1
 
-            # Calculate how long to wait before next check
-            # Use a small interval (e.g., 100ms) but don't exceed remaining timeout
-            remaining_time = end_time - current_time
-            wait_time = min(0.1, remaining_time)  # 100ms check interval
+        return deleted, RedisType.INTEGER
 
-            # Wait before next check
-            await asyncio.sleep(wait_time)
+    async def delete(self, keys):
+        return self.delete_keys(keys, get_lazyfree_settings().lazy_user_del)
 
-    async def replconf_getack(self, args):
+    async def unlink(self, keys):
         """
-        Sends response back to replconf getack command.
+        Same as DEL, but big values are freed in the background
         """
+        return self.delete_keys(keys, lazy=True)
 
-        return ["REPLCONF", "ACK", str(self.bytes_processed)], RedisType.ARRAY
-
-    async def replconf_ack(self, args, writer):
+    async def keys(self, pattern):
         """
-        Once master recives an acknowledgement,
-        it updates the correct offset
+        Match the pattern against DB keys, and return that
+
+        Matching runs on a snapshot of the keys, in a worker thread for big databases.
+        Patterns starting with a literal only look at the keys with that prefix.
         """
 
-        await self.connection_registry.update_replica_offset(writer, int(args[0]))
+        compiled = compile_pattern(pattern[0])
 
-    async def replconf(self, args, writer=None):
-        """
-        Sends response back to replconf command.
-        """
+        if compiled.is_literal:
+            keys = [compiled.prefix] if self.db.get(compiled.prefix, update_access=False) is not None else []
+        elif compiled.prefix:
+            keys = self.db.get_keys_with_prefix(compiled.prefix)
+        else:
+            keys = list(self.db)
 
-        args = args or []
+        if compiled.is_literal or compiled.is_prefix:
+            # Keys found are exactly the matching keys
+            result = keys
+        elif should_offload(len(keys)):
+            result = await run_offloaded(match_keys, keys, pattern[0])
+        else:
+            result = match_keys(keys, pattern[0])
 
-        if not args:
-            raise RedisException("Currently, REPLCONF command expects subcommand")
+        # Other shards hold the rest of the keyspace
+        if self.shard_router is not None:
+            for shard_keys in await self.shard_router.broadcast(KEYS, pattern):
+                result.extend(shard_keys)
 
-        subcommand = args[0].lower()
+        return result, RedisType.ARRAY
 
-        if subcommand == "getack":
-            return await self.replconf_getack(args[1:])
+    async def config_get(self, args):
+        key = args[0]
+        value = get_config(key)
+        return [key, value], RedisType.ARRAY
 
-        if subcommand == "ack":
-            return await self.replconf_ack(args[1:], writer)
+    async def config_set(self, args):
+        if len(args) % 2 != 0:
+            raise RedisException("wrong number of arguments for 'config|set' command")
+
+        keys = set()
+        # Values before, restored if the new ones are not valid
+        previous = {}
+        for idx in range(0, len(args), 2):
+            key = args[idx].lower()
+            keys.add(key)
+            previous.setdefault(key, os.environ.get(key))
+            set_config(key, args[idx + 1])
+
+        # Config used on every access or command is read once and kept
+        try:
+            if keys & SETTINGS_KEYS:
+                reload_settings()
+            if keys & SLOWLOG_CONFIG:
+                get_slowlog().reload()
+            if keys & LATENCY_CONFIG:
+                get_latency_monitor().reload()
+            if keys & STATS_CONFIG:
+                self.stats.reload()
+                get_info_percentiles()
+            if keys & CLIENT_CONFIG:
+                reload_client_settings()
+            if keys & REPLICATION_CONFIG:
+                reload_replication_settings()
+            if keys & LAZYFREE_CONFIG:
+                reload_lazyfree_settings()
+        except ValueError as exc:
+            for key, value in previous.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    set_config(key, value)
+            raise RedisException(f"Invalid argument: {exc}")
 
-        # If it doesn't match, send OK. We will add error handling later
         return "OK", RedisType.SIMPLE_STRING
 
-    async def psync(self, args, writer):
+    async def config_resetstat(self, args):
         """
-        Return fullresync response back to psync command.
+        Reset the counters of INFO stats and commandstats, and the slow log
         """
+        self.stats.reset()
+        get_slowlog().reset()
+        return "OK", RedisType.SIMPLE_STRING
+
+    async def config(self, args):
 
-        full_resync_command = self.encoder.encode_simple_string(
-            f"FULLRESYNC {self.replication_id} {self.replication_offset}"
-        ).encode('utf-8')
+        subcommand = args[0].lower()
 
-        empty_rdb = base64.b64decode(EMPTY_RDB)
+        config_map = {
+            "get": self.config_get,
+            "set": self.config_set,
+            "resetstat": self.config_resetstat,
+        }
 
-        # Asynchronously add replica to registry
-        await self.connection_registry.add_replica(
-            writer,
-            replication_id=self.replication_id,
-            offset=self.replication_offset
-        )
+        if subcommand not in config_map:
+            raise RedisException(f"Invalid config subcommand: {subcommand}")
 
-        return full_resync_command + self.encoder.encode_file(empty_rdb), None
+        return await config_map[subcommand](args[1:])
 
     async def multi(self, args):
 
@@ -427,12 +571,75 @@ class RedisCommandHandler:
 
     ##### Functions which handle meta-logic ####################
 
-    async def write_to_replicas(self, data):
+    async def check_maxmemory(self):
+        """
+        Evict keys till used memory is within maxmemory, before a command which may use more.
+        Replicas are told to delete the evicted keys as well, they never evict on their own.
+
+        Raises:
+            OutOfMemoryException: Still over maxmemory, nothing (more) could be evicted
+        """
+
+        databases = get_databases()
+
+        start = perf_counter_ns()
+        evicted = perform_evictions(databases)
+        if evicted:
+            self.stats.evicted_keys += len(evicted)
+            get_latency_monitor().add_sample(EVICTION_EVENT, (perf_counter_ns() - start) // 1_000_000)
+
+        for db_index, key in evicted:
+            await self.write_to_replicas(self.encoder.encode_array([DEL, key]), db_index)
+
+        if is_over_maxmemory(databases):
+            raise OutOfMemoryException("command not allowed when used memory > 'maxmemory'.")
+
+    @staticmethod
+    def is_blocking(command, command_arg) -> bool:
+        """
+        Commands which wait for something, their duration is not execution time
+        """
+        if command == WAIT:
+            return True
+        return command == XREAD and any(arg.lower() == "block" for arg in command_arg)
+
+    @staticmethod
+    def get_client_address(writer) -> str:
+        try:
+            host, port = writer.get_extra_info("peername")[:2]
+        except (AttributeError, TypeError, ValueError):
+            return ""
+        return f"{host}:{port}"
+
+    def record_duration(self, command, command_arg, duration_ns, writer, failed=False):
+        """
+        Feed the command stats, the slow log and the latency monitor with how long a command took
+        """
+
+        duration_us = duration_ns // 1000
+        self.stats.record_call(command, duration_us, failed)
+
+        slowlog = get_slowlog()
+        monitor = get_latency_monitor()
+
+        is_slow = slowlog.is_slow(duration_us)
+        is_spike = monitor.is_enabled() and duration_us >= monitor.threshold * 1000
+        if not (is_slow or is_spike) or self.is_blocking(command, command_arg):
+            return
+
+        if is_slow:
+            client_name = self.client.name if self.client is not None else ""
+            slowlog.add([command, *command_arg], duration_us, self.get_client_address(writer), client_name)
+        monitor.add_sample(COMMAND_EVENT, duration_us // 1000)
+
+    def record_rejected(self, command, known: bool):
         """
-        Write data to all registered replicas
+        Count a command refused before it was executed, unknown commands have no command stats
         """
-        await self.connection_registry.broadcast(data)
-        self.replication_offset += len(data)
+        if known:
+            self.stats.record_rejected(command)
+        else:
+            self.stats.total_error_replies += 1
 
     def get_command(self, command_arr):
         command = command_arr
@@ -445,27 +652,7 @@ class RedisCommandHandler:
 
     def get_command_kls(self, command):
 
-        kls_map = {
-            PING: self.ping,
-            ECHO: self.echo,
-            SET: self.set,
-            GET: self.get,
-            INCR: self.increment,
-            XADD: self.xadd,
-            XRANGE: self.xrange,
-            XREAD: self.xread,
-            MULTI: self.multi,
-            EXEC: self.exec,
-            DISCARD: self.discard,
-            CONFIG: self.config,
-            KEYS: self.keys,
-            INFO: self.info,
-            REPLCONF: self.replconf,
-            PSYNC: self.psync,
-            WAIT: self.wait,
-            TYPE: self.type,
-        }
-        kls = kls_map.get(command)
+        kls = self.command_map.get(command)
         if not kls:
             raise RedisException("Invalid command")
 
@@ -490,17 +677,60 @@ class RedisCommandHandler:
         # Commands which need to be passed writer argument
         writer_set = {PSYNC, REPLCONF}
 
-        kls = self.get_command_kls(command)
-
+        kls = start = None
         try:
-            if command in writer_set:
-                return await kls(command_arg, writer)
-
-            return await kls(command_arg)
+            kls = self.get_command_kls(command)
+
+            # Replicas apply whatever their master sends
+            if self.cluster is not None and not self.is_master_link:
+                # ASKING only holds for the command right after it
+                asking, self.asking = self.asking, False
+                self.cluster.check_command(
+                    command, command_arg, self.db, asking or command == RESTORE_ASKING
+                )
+
+            if self.shard_router is not None:
+                shard = self.shard_router.get_owner(command, command_arg)
+                if shard is not None:
+                    # Owner shard takes care of propagation as well
+                    data = await self.shard_router.forward(shard, command, command_arg)
+                    return data, None
+
+            if command in WRITE_COMMANDS and self.is_replica and not self.is_master_link:
+                self.check_replica_writable()
+
+            if command in WRITE_COMMANDS and self.db.keys_in_flight and not self.is_master_link:
+                self.check_keys_in_flight(command, command_arg)
+
+            if command in WRITE_COMMANDS and not self.is_replica:
+                self.check_enough_replicas()
+
+            if command in DENYOOM_COMMANDS and not self.is_replica:
+                await self.check_maxmemory()
+
+            start = perf_counter_ns()
+            failed = True
+            try:
+                if command in writer_set:
+                    response = await kls(command_arg, writer)
+                else:
+                    response = await kls(command_arg)
+                failed = bool(response) and response[1] == RedisType.ERROR
+            finally:
+                self.record_duration(command, command_arg, perf_counter_ns() - start, writer, failed)
 
         except RedisException as exc:
+            # Errors of the command itself were counted as failed calls already
+            if start is None:
+                self.record_rejected(command, kls is not None)
             return exc, RedisType.ERROR
 
+        # Replicas do not propagate on their own, they proxy the stream of their master
+        if command in WRITE_COMMANDS and not self.is_replica:
+            await self.propagate(command, command_arg, response)
+
+        return response
+
     async def execute(self, command, command_arg, writer=None, execute_transaction=False):
         response = await self._execute(command, command_arg, writer, execute_transaction)
         if response:
@@ -511,37 +741,82 @@ class RedisCommandHandler:
         command_arr = RedisDecoder().decode(command_data)
         command, command_arr = self.get_command(command_arr)
 
-        # Commands which need to be broadcasted to the replicas
-        broadcast_set = {SET}
-        if command in broadcast_set:
-            await self.write_to_replicas(command_data)
-
         return await self.execute(command, command_arr, writer)
 
-    async def handle_replica(self, command_data, propogated_command):
+    async def execute_commands(self, commands, propogated_command, writer=None):
         """
-        If it is replica, it might get multiple Write commands
+        Execute a batch of decoded commands in order.
+
+        Args:
+            commands (list): Each element is tuple of command with its length in bytes
+            propogated_command: Is this batch propogated from master to replica?
+            writer: Connection the commands were received on
         """
-        command_arr = RedisDecoder().multi_command_decoder(command_data)
 
         # Commands to which Replicas need to reply in case of propogation
         reply_back_commands = {REPLCONF}
 
         responses = []
 
-        for command, comm_length in command_arr:
+        # Replies of the batch are checked against the output buffer limits as they
+        # pile up, every OUTPUT_CHECK_BYTES, rather than once the whole batch is written
+        reply_size = 0
+        next_check = OUTPUT_CHECK_BYTES
+
+        for command, comm_length in commands:
+            # Null or empty values hold no command, in the replication stream their bytes still count
+            if not command:
+                if propogated_command:
+                    self.bytes_processed += comm_length
+                continue
+
             comm, comm_arr = self.get_command(command)
-            response = await self.execute(comm, comm_arr)
+            self.last_command = comm
+            response = await self.execute(comm, comm_arr, writer)
 
             # Send back the response to the client
             # In case this is propogation, only send back replies when needed
-            if not propogated_command or comm in reply_back_commands:
+            if response and (not propogated_command or comm in reply_back_commands):
                 responses.append(response)
 
-            self.bytes_processed += comm_length
+                reply_size += len(response)
+                if reply_size >= next_check and self.client is not None:
+                    next_check = reply_size + OUTPUT_CHECK_BYTES
+                    # Client is disconnected, neither these replies nor the rest of the batch matter
+                    if self.client.is_over_output_limit(reply_size):
+                        self.client.close_over_output_limit(reply_size)
+                        return ""
+
+            # Only the replication stream counts towards our replication offset
+            if propogated_command:
+                self.bytes_processed += comm_length
+
+        # PSYNC reply carries the RDB payload as bytes
+        if any(isinstance(response, bytes) for response in responses):
+            return b"".join(
+                response if isinstance(response, bytes) else response.encode("utf-8")
+                for response in responses
+            )
 
         return "".join(responses)
 
+    async def handle_replica(self, command_data, propogated_command, writer=None):
+        """
+        If it is replica, it might get multiple Write commands
+        """
+        command_arr = RedisDecoder().multi_command_decoder(command_data)
+        return await self.execute_commands(command_arr, propogated_command, writer)
+
+    async def handle_propagated(self, commands):
+        """
+        Apply a batch of commands propogated by the master.
+        Replication offset is advanced by exact wire length of every command.
+
+        Args:
+            commands (list): Each element is tuple of command with its length in bytes
+        """
+        return await self.execute_commands(commands, propogated_command=True)
+
     async def handle(self, command_data, writer=None, propogated_command:bool=False):
         """
         Handle commands from master or replica
@@ -551,7 +826,7 @@ class RedisCommandHandler:
         """
 
         if self.is_replica:
-            return await self.handle_replica(command_data, propogated_command)
+            return await self.handle_replica(command_data, propogated_command, writer)
 
         return await self.handle_master_command(command_data, writer)
 
@@ -0,0 +1,137 @@
+"""
+Latency histogram with log-linear buckets, the way HdrHistogram lays them out.
+
+Values below 2 ** SUB_BUCKET_BITS get a bucket each. Above that, every power
+of two range is split into 2 ** (SUB_BUCKET_BITS - 1) buckets of equal width,
+so a bucket is never wider than about 1 / 16th of the values it holds (~6%).
+The buckets are one fixed array, and recording a value is a few int operations.
+
+Values are in microseconds, anything above HISTOGRAM_MAX_VALUE counts as that.
+"""
+
+from array import array
+
+SUB_BUCKET_BITS = 5
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+SUB_BUCKET_HALF_COUNT = SUB_BUCKET_COUNT >> 1
+
+# About 19 hours in microseconds
+HISTOGRAM_MAX_VALUE = (1 << 36) - 1
+
+# Bucket HISTOGRAM_MAX_VALUE falls into is the last one
+BUCKET_COUNT = (
+    (HISTOGRAM_MAX_VALUE.bit_length() - SUB_BUCKET_BITS) * SUB_BUCKET_HALF_COUNT
+    + (HISTOGRAM_MAX_VALUE >> (HISTOGRAM_MAX_VALUE.bit_length() - SUB_BUCKET_BITS)) + 1
+)
+
+
+def get_bucket_index(value: int) -> int:
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    if shift <= 0:
+        return value
+    return shift * SUB_BUCKET_HALF_COUNT + (value >> shift)
+
+
+def get_bucket_range(index: int):
+    """
+    Lowest and highest value of the bucket, both inclusive
+    """
+    if index < SUB_BUCKET_COUNT:
+        return index, index
+
+    shift = (index >> (SUB_BUCKET_BITS - 1)) - 1
+    low = (index - shift * SUB_BUCKET_HALF_COUNT) << shift
+    return low, low + (1 << shift) - 1
+
+
+class LatencyHistogram:
+
+    __slots__ = ("counts", "total", "max")
+
+    def __init__(self):
+        self.counts = array("Q", bytes(8 * BUCKET_COUNT))
+        self.total = 0
+        self.max = 0
+
+    def record(self, value: int):
+        if value > HISTOGRAM_MAX_VALUE:
+            value = HISTOGRAM_MAX_VALUE
+
+        shift = value.bit_length() - SUB_BUCKET_BITS
+        if shift <= 0:
+            self.counts[value] += 1
+        else:
+            self.counts[shift * SUB_BUCKET_HALF_COUNT + (value >> shift)] += 1
+
+        self.total += 1
+        if value > self.max:
+            self.max = value
+
+    def get_percentile(self, percentile: float) -> int:
+        """
+        Value percentile percent of the recorded values are at or below,
+        as the highest value of its bucket
+        """
+
+        if not self.total:
+            return 0
+
+        # At least one value, so that the 0th percentile is the lowest one
+        target = max(1, -int(-percentile * self.total // 100))
+
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if not count:
+                continue
+            seen += count
+            if seen >= target:
+                return min(get_bucket_range(index)[1], self.max)
+
+        return self.max
+
+    def get_counts_below(self, bounds: list) -> list:
+        """
+        Values recorded below every one of bounds (sorted powers of two), cumulative
+        """
+
+        counts = []
+        seen = 0
+        index = 0
+        for bound in bounds:
+            # Powers of two are always the lowest value of a bucket
+            end = BUCKET_COUNT if bound > HISTOGRAM_MAX_VALUE else get_bucket_index(bound)
+            seen += sum(self.counts[index:end])
+            index = max(index, end)
+            counts.append(seen)
+        return counts
+
+    def get_cumulative_buckets(self) -> list:
+        """
+        Values recorded below every power of two (1, 2, 4, ...) as [bound, count, ...],
+        like histogram_usec of LATENCY HISTOGRAM. Only bounds which add values are listed.
+        """
+
+        result = []
+        bound = 1
+        seen = 0
+        added = 0
+
+        for index, count in enumerate(self.counts):
+            if not count:
+                continue
+
+            low, _ = get_bucket_range(index)
+            # Power of two bounds are always bucket boundaries
+            while low >= bound:
+                if added:
+                    result.extend([bound, seen])
+                    added = 0
+                bound <<= 1
+
+            seen += count
+            added += count
+
+        if added:
+            result.extend([bound, seen])
+
+        return result
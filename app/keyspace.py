@@ -0,0 +1,361 @@
+"""
+Bucket index of the keyspace, for SCAN.
+
+Python dict gives no stable order to resume an iteration from, so keys are also
+kept in a hash table of our own: a power of two number of buckets, key goes to
+bucket hash(key) & mask. SCAN walks the buckets with a reverse binary cursor
+(same as Redis), which returns every key present for the whole scan, even when
+the table grows or shrinks in between calls.
+
+The table is resized incrementally, again like Redis: during a resize both the
+old and the new table are kept, and every write moves a bucket over to the new one.
+
+Keys are also kept in sorted order, so that KEYS with a prefix (user:123:*) only
+reads the keys which start with it, rather than the whole keyspace.
+"""
+
+from bisect import bisect_left, insort
+from itertools import islice
+import random
+import sys
+
+MIN_BUCKETS = 4
+
+# Grow once there are this many keys per bucket, shrink at 1/8 of it
+LOAD_FACTOR = 16
+
+# Buckets of the old table moved to the new one per write, during a resize
+REHASH_STEP = 4
+
+MASK64 = (1 << 64) - 1
+
+# Keys per chunk of the sorted index, a chunk is split in two at twice as many
+SORTED_CHUNK_SIZE = 512
+
+
+def reverse_bits(value: int) -> int:
+    return int(f"{value:064b}"[::-1], 2)
+
+
+def next_cursor(cursor: int, mask: int) -> int:
+    """
+    Increment the masked bits of the cursor in reverse order (most significant first)
+    """
+    cursor |= ~mask & MASK64
+    cursor = reverse_bits(cursor)
+    cursor = (cursor + 1) & MASK64
+    return reverse_bits(cursor)
+
+
+def get_prefix_end(prefix: str):
+    """
+    Smallest string greater than every string starting with prefix,
+    None if there is not one (prefix is empty, or only the largest character)
+    """
+
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class BucketIndex:
+
+    def __init__(self, keys=()):
+        self.count = 0
+        # Buckets are lists of keys, None while empty.
+        # Buckets are small, so lists do well, and take far less memory than sets.
+        self.table = [None] * MIN_BUCKETS
+        # Table we are resizing into, None when no resize is running
+        self.new_table = None
+        # Buckets of the old table before this index are moved already
+        self.rehash_index = 0
+
+        for key in keys:
+            self.add(key)
+
+    def __len__(self):
+        return self.count
+
+    def is_rehashing(self):
+        return self.new_table is not None
+
+    def add(self, key):
+        """
+        Add a key, which must not be in the index already
+        """
+
+        if self.new_table is None:
+            table = self.table
+        else:
+            self._rehash_step()
+            # During a resize, new keys go straight to the new table
+            table = self.new_table or self.table
+
+        idx = hash(key) & (len(table) - 1)
+        bucket = table[idx]
+        if bucket is None:
+            table[idx] = [key]
+        else:
+            bucket.append(key)
+
+        self.count += 1
+
+        if self.new_table is None and self.count > len(self.table) * LOAD_FACTOR:
+            self._start_resize(len(self.table) * 2)
+
+    def remove(self, key):
+        if self.new_table is not None:
+            self._rehash_step()
+
+        key_hash = hash(key)
+
+        table = self.table
+        idx = key_hash & (len(table) - 1)
+        bucket = table[idx]
+
+        if (bucket is None or key not in bucket) and self.new_table is not None:
+            table = self.new_table
+            idx = key_hash & (len(table) - 1)
+            bucket = table[idx]
+
+        if bucket is None or key not in bucket:
+            return
+
+        bucket.remove(key)
+        if not bucket:
+            table[idx] = None
+        self.count -= 1
+
+        size = len(self.table)
+        if self.new_table is None and size > MIN_BUCKETS and self.count < size * LOAD_FACTOR // 8:
+            self._start_resize(size // 2)
+
+    def clear(self):
+        self.__init__()
+
+    def _start_resize(self, size: int):
+        self.new_table = [None] * size
+        self.rehash_index = 0
+
+    @staticmethod
+    def _merge_bucket(table, idx, keys):
+        bucket = table[idx]
+        if bucket is None:
+            table[idx] = keys
+        else:
+            bucket.extend(keys)
+
+    def _rehash_step(self):
+        """
+        Move the next few buckets of the old table to the new one.
+
+        Table size is always doubled or halved, so a bucket either splits in two
+        buckets (idx and idx + old size), or merges into one (idx & new mask).
+        Both are done with list comprehensions, rather than key by key.
+        """
+
+        table, new_table = self.table, self.new_table
+        old_size, new_size = len(table), len(new_table)
+        start = self.rehash_index
+        end = min(start + REHASH_STEP, old_size)
+
+        for idx in range(start, end):
+            bucket = table[idx]
+            if bucket is None:
+                continue
+            table[idx] = None
+
+            if new_size > old_size:
+                low = [key for key in bucket if not hash(key) & old_size]
+                if len(low) < len(bucket):
+                    high = [key for key in bucket if hash(key) & old_size]
+                    self._merge_bucket(new_table, idx + old_size, high)
+                if low:
+                    self._merge_bucket(new_table, idx, low)
+            else:
+                self._merge_bucket(new_table, idx & (new_size - 1), bucket)
+
+        self.rehash_index = end
+
+        if end >= old_size:
+            self.table = new_table
+            self.new_table = None
+            self.rehash_index = 0
+
+    def sample(self, count: int) -> list:
+        """
+        Return about count random keys (fewer if there are not as many), like
+        dictGetSomeKeys of Redis: keys of consecutive buckets from a random one.
+        Keys are not uniformly random, but cheap to get, which is what eviction needs.
+        """
+
+        if not self.count:
+            return []
+
+        tables = [self.table] if self.new_table is None else [self.table, self.new_table]
+        largest = max(len(table) for table in tables)
+        idx = random.getrandbits(64)
+        keys = []
+
+        # Every bucket of the largest table is visited at most once
+        for _ in range(largest):
+            for table in tables:
+                bucket = table[idx & (len(table) - 1)]
+                if bucket:
+                    keys.extend(bucket)
+
+            if len(keys) >= count:
+                break
+            idx += 1
+
+        if len(keys) > count:
+            return random.sample(keys, count)
+        return keys
+
+    def scan(self, cursor: int, count: int = 10):
+        """
+        Return keys of the buckets from cursor on, till at least count keys are collected
+        (or 10 * count buckets are visited), along with the cursor to continue from.
+        Cursor of 0 starts a scan, and is returned once the scan is complete.
+        """
+
+        keys = []
+        max_visits = count * 10
+
+        while True:
+            cursor = self._scan_step(cursor, keys)
+            max_visits -= 1
+            if cursor == 0 or len(keys) >= count or max_visits <= 0:
+                return cursor, keys
+
+    def _scan_step(self, cursor: int, keys: list) -> int:
+        if self.new_table is None:
+            mask = len(self.table) - 1
+            bucket = self.table[cursor & mask]
+            if bucket:
+                keys.extend(bucket)
+            return next_cursor(cursor, mask)
+
+        # During a resize, visit the bucket in the smaller table, and all the
+        # buckets it expands to in the larger table
+        small, large = self.table, self.new_table
+        if len(small) > len(large):
+            small, large = large, small
+
+        small_mask, large_mask = len(small) - 1, len(large) - 1
+
+        bucket = small[cursor & small_mask]
+        if bucket:
+            keys.extend(bucket)
+
+        while True:
+            bucket = large[cursor & large_mask]
+            if bucket:
+                keys.extend(bucket)
+
+            cursor = next_cursor(cursor, large_mask)
+            if not cursor & (small_mask ^ large_mask):
+                return cursor
+
+
+class SortedKeys:
+    """
+    Keys in sorted order, keys with a common prefix are next to each other.
+
+    One sorted list moves half the keys on every insert, so keys are kept in
+    sorted chunks instead, with the last key of every chunk in a list of its own.
+    Both are searched with bisect, and an insert or remove only moves keys of one chunk.
+    """
+
+    def __init__(self, keys=()):
+        keys = sorted(keys)
+        self.chunks = [keys[idx:idx + SORTED_CHUNK_SIZE] for idx in range(0, len(keys), SORTED_CHUNK_SIZE)]
+        # Last (largest) key of every chunk
+        self.maxes = [chunk[-1] for chunk in self.chunks]
+        self.count = len(keys)
+
+    def __len__(self):
+        return self.count
+
+    def add(self, key):
+        """
+        Add a key, which must not be in the index already
+        """
+
+        chunks, maxes = self.chunks, self.maxes
+        self.count += 1
+
+        if not maxes:
+            chunks.append([key])
+            maxes.append(key)
+            return
+
+        idx = bisect_left(maxes, key)
+        if idx == len(maxes):
+            # Largest key so far, goes at the end of the last chunk
+            idx -= 1
+            chunk = chunks[idx]
+            chunk.append(key)
+            maxes[idx] = key
+        else:
+            chunk = chunks[idx]
+            insort(chunk, key)
+
+        if len(chunk) > SORTED_CHUNK_SIZE * 2:
+            chunks[idx:idx + 1] = [chunk[:SORTED_CHUNK_SIZE], chunk[SORTED_CHUNK_SIZE:]]
+            maxes.insert(idx, chunk[SORTED_CHUNK_SIZE - 1])
+
+    def remove(self, key):
+        chunks, maxes = self.chunks, self.maxes
+
+        idx = bisect_left(maxes, key)
+        if idx == len(maxes):
+            return
+
+        chunk = chunks[idx]
+        pos = bisect_left(chunk, key)
+        if chunk[pos] != key:
+            return
+
+        del chunk[pos]
+        self.count -= 1
+
+        if not chunk:
+            del chunks[idx]
+            del maxes[idx]
+        elif pos == len(chunk):
+            maxes[idx] = chunk[-1]
+
+    def clear(self):
+        self.__init__()
+
+    def with_prefix(self, prefix: str) -> list:
+        """
+        Return the keys which start with prefix, in sorted order.
+        They are the keys from prefix up to (not including) the next string after
+        every string with the prefix, so both ends of the run are found with bisect.
+        """
+
+        chunks, maxes = self.chunks, self.maxes
+        upper = get_prefix_end(prefix)
+
+        start = bisect_left(maxes, prefix)
+        end = len(chunks) if upper is None else bisect_left(maxes, upper)
+        if start == len(chunks):
+            return []
+
+        chunk = chunks[start]
+        if start == end:
+            return chunk[bisect_left(chunk, prefix):bisect_left(chunk, upper)]
+
+        # Chunks in between hold matching keys only
+        keys = chunk[bisect_left(chunk, prefix):]
+        for chunk in islice(chunks, start + 1, end):
+            keys.extend(chunk)
+
+        if end < len(chunks):
+            chunk = chunks[end]
+            keys.extend(chunk[:bisect_left(chunk, upper)])
+
+        return keys
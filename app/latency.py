@@ -0,0 +1,134 @@
+"""
+Latency monitor, same as Redis LATENCY.
+
+Operations which took at least latency-monitor-threshold milliseconds are
+recorded as samples of an event (0 disables the monitor):
+
+    command         a command, from the start to the end of its execution
+    event-loop      event loop did not run for this long, something blocked it
+    eviction-cycle  eviction of keys, before a write, to get within maxmemory
+
+Every event keeps its latest and highest latency, and a history of the last
+samples, at most one per second (the highest one of that second).
+"""
+
+import asyncio
+from collections import deque
+import time
+
+from app.config import get_int_config
+from app.stats import get_stats
+
+# Config keys which are read into LatencyMonitor
+LATENCY_CONFIG = {"latency-monitor-threshold"}
+
+# Samples kept in the history of an event
+LATENCY_HISTORY_LEN = 160
+
+# Event loop is checked this often for stalls, in seconds
+LOOP_CHECK_INTERVAL = 0.1
+
+COMMAND_EVENT = "command"
+EVENT_LOOP_EVENT = "event-loop"
+EVICTION_EVENT = "eviction-cycle"
+
+
+class LatencyEvent:
+
+    def __init__(self):
+        # (unix time, latency in milliseconds)
+        self.history = deque(maxlen=LATENCY_HISTORY_LEN)
+        self.max = 0
+
+    def add(self, timestamp: int, latency: int):
+        self.max = max(self.max, latency)
+
+        if self.history and self.history[-1][0] == timestamp:
+            if latency > self.history[-1][1]:
+                self.history[-1] = (timestamp, latency)
+            return
+
+        self.history.append((timestamp, latency))
+
+
+class LatencyMonitor:
+
+    def __init__(self):
+        self.events = {}
+        self.reload()
+
+    def reload(self):
+        """
+        Read the config again, it is kept rather than read for every command
+        """
+        self.threshold = get_int_config("latency-monitor-threshold")
+
+    def is_enabled(self) -> bool:
+        return self.threshold > 0
+
+    def add_sample(self, event: str, latency: int):
+        """
+        Record the latency (in milliseconds) of an event, if it reaches the threshold
+        """
+
+        if self.threshold <= 0 or latency < self.threshold:
+            return
+
+        record = self.events.get(event)
+        if record is None:
+            record = self.events[event] = LatencyEvent()
+        record.add(int(time.time()), latency)
+
+    def latest(self) -> list:
+        """
+        LATENCY LATEST, event name, time and latency of its latest sample, and its highest latency
+        """
+        return [
+            [event, *record.history[-1], record.max]
+            for event, record in self.events.items() if record.history
+        ]
+
+    def history(self, event: str) -> list:
+        record = self.events.get(event)
+        if record is None:
+            return []
+        return [list(sample) for sample in record.history]
+
+    def reset(self, events=None) -> int:
+        """
+        Forget the samples of the events (all of them by default), return how many were reset
+        """
+        if not events:
+            count = len(self.events)
+            self.events = {}
+            return count
+
+        return sum(1 for event in events if self.events.pop(event, None) is not None)
+
+
+_monitor = None
+
+
+def get_latency_monitor() -> LatencyMonitor:
+    global _monitor
+    if _monitor is None:
+        _monitor = LatencyMonitor()
+    return _monitor
+
+
+async def monitor_event_loop(interval: float = LOOP_CHECK_INTERVAL):
+    """
+    Wake up every interval, anything past the interval is how long the loop was blocked.
+    Every lag is kept in the event loop lag of INFO stats, spikes go to the latency monitor.
+    """
+
+    monitor = get_latency_monitor()
+    stats = get_stats()
+    loop = asyncio.get_running_loop()
+
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        stall = max(0.0, loop.time() - start - interval)
+        stats.record_loop_lag(int(stall * 1_000_000))
+        monitor.add_sample(EVENT_LOOP_EVENT, int(stall * 1000))
@@ -0,0 +1,149 @@
+"""
+Lazy free: release big objects in a background thread, off the event loop.
+
+Dropping the last reference to a dict of millions of keys frees all of them
+in one go, which blocks the event loop for seconds. Objects which are no longer
+reachable by any command (for example the dict of a flushed database) are
+handed over here instead, and freed by a single background thread.
+
+Freeing is done in chunks (popitem / slice deletion), rather than one clear(),
+since the GIL is only handed back to the event loop in between bytecodes.
+"""
+
+import logging
+import queue
+import threading
+
+from app.config import get_bool_config
+
+logger = logging.getLogger(__name__)
+
+LAZYFREE_CONFIG = {
+    "lazyfree-lazy-user-flush", "lazyfree-lazy-user-del", "lazyfree-lazy-expire", "lazyfree-lazy-eviction",
+}
+
+# Items freed per step, the GIL can only be handed over in between steps
+FREE_CHUNK_SIZE = 1000
+
+# Values with fewer items than this are freed inline, handing them over costs more
+LAZYFREE_THRESHOLD = 64
+
+_queue = queue.SimpleQueue()
+_thread = None
+_lock = threading.Lock()
+
+# Objects handed over and not freed yet
+_pending = 0
+
+
+class LazyFreeSettings:
+    """
+    Config checked on every delete and expiry, read once instead of from the environment every time
+    """
+
+    def __init__(self):
+        self.lazy_user_flush = get_bool_config("lazyfree-lazy-user-flush")
+        self.lazy_user_del = get_bool_config("lazyfree-lazy-user-del")
+        self.lazy_expire = get_bool_config("lazyfree-lazy-expire")
+        self.lazy_eviction = get_bool_config("lazyfree-lazy-eviction")
+
+
+_settings = None
+
+
+def get_lazyfree_settings() -> LazyFreeSettings:
+    global _settings
+    if _settings is None:
+        _settings = LazyFreeSettings()
+    return _settings
+
+
+def reload_lazyfree_settings():
+    """
+    Read the config again, after it was changed
+    """
+    global _settings
+    _settings = LazyFreeSettings()
+
+
+def get_free_effort(value) -> int:
+    """
+    Rough number of objects released along with value
+    """
+    if isinstance(value, (dict, set, list)):
+        return len(value)
+    return 1
+
+
+def free_object(obj):
+    """
+    Release the items of a dict, set or list chunk by chunk
+    """
+
+    if isinstance(obj, dict):
+        popitem = obj.popitem
+        while obj:
+            for _ in range(min(FREE_CHUNK_SIZE, len(obj))):
+                popitem()
+    elif isinstance(obj, set):
+        pop = obj.pop
+        while obj:
+            for _ in range(min(FREE_CHUNK_SIZE, len(obj))):
+                pop()
+    elif isinstance(obj, list):
+        while obj:
+            del obj[-FREE_CHUNK_SIZE:]
+
+
+def _run():
+    global _pending
+
+    while True:
+        obj = _queue.get()
+        try:
+            free_object(obj)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Lazy free failed")
+
+        # Last reference goes here, the object itself is released in this thread
+        del obj
+        with _lock:
+            _pending -= 1
+
+
+def free_async(*objects):
+    """
+    Hand objects over to the lazy free thread. Caller must not use them anymore.
+    """
+
+    global _thread, _pending
+
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_run, name="lazyfree", daemon=True)
+            _thread.start()
+        _pending += len(objects)
+
+    for obj in objects:
+        _queue.put(obj)
+
+
+def free_value(value) -> bool:
+    """
+    Free a value removed from the keyspace in the background, if it is big enough to be worth it
+
+    Returns:
+        bool: Value was handed over to the lazy free thread
+    """
+    if get_free_effort(value) <= LAZYFREE_THRESHOLD:
+        return False
+
+    free_async(value)
+    return True
+
+
+def pending_objects() -> int:
+    """
+    Number of objects waiting to be freed, lazyfree_pending_objects of INFO
+    """
+    return _pending
@@ -2,49 +2,84 @@ import argparse
 import asyncio
 import logging
 import os
+import signal
 
+from app.clients import check_idle_clients, reload_client_settings
+from app.config import get_config, get_int_config
 from app.connection_registry import ConnectionRegistry
 from app.handler import RedisCommandHandler
+from app.latency import monitor_event_loop
+from app.metrics import run_metrics_server
+from app.protocol import RedisProtocol
 from app.rdb.parser import RDBParser
-from app.database import Database
+from app.database import get_database, load_databases
+from app.eviction import POLICIES, reload_settings
 from app.replica import Replica
+from app.cluster import ClusterState, set_cluster
+from app.sharding import ShardRouter, get_router, set_router
+from app.stats import sample_stats
 
 
 logger = logging.getLogger(__name__)
 
 
-async def handle_client(reader, writer):
+def install_event_loop(preference: str = "auto") -> str:
+    """
+    Use uvloop when it is installed (or asked for), otherwise the default asyncio loop.
 
-    connection_registry = ConnectionRegistry()
-    handler = RedisCommandHandler(connection_registry)
+    Returns:
+        str: Name of the event loop in use
+    """
+
+    if preference == "asyncio":
+        return "asyncio"
 
     try:
-        while True:
-            data = await reader.read(1024)
+        import uvloop  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        if preference == "uvloop":
+            raise
+        return "asyncio"
 
-            if not data:
-                break
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return "uvloop"
 
-            data = data.decode("utf-8")
-            response = await handler.handle(data, writer)
 
-            if response:
-                if isinstance(response, str):
-                    response = response.encode("utf-8")
-                writer.write(response)
+async def run_server(port:int):
+    loop = asyncio.get_running_loop()
 
-            await writer.drain()
-    except Exception as e:
-        print("Error", e)
-    finally:
-        # Ensure cleanup of replica if connection closes
-        await connection_registry.remove_replica(writer)
-        writer.close()
-        await writer.wait_closed()
+    # Like Redis, bind can list multiple addresses separated by space
+    hosts = get_config("bind").split()
 
+    # Shards all listen on the same port, kernel balances connections over them
+    router = get_router()
 
-async def run_server(port:int):
-    server = await asyncio.start_server(handle_client, "localhost", port)
+    server = await loop.create_server(
+        RedisProtocol,
+        hosts,
+        port,
+        backlog=get_int_config("tcp-backlog"),
+        reuse_address=True,
+        reuse_port=router is not None,
+    )
+
+    async with server:
+        await server.serve_forever()
+
+
+async def run_shard_server(router: ShardRouter):
+    """
+    Accept commands forwarded by the other shards
+    """
+    loop = asyncio.get_running_loop()
+
+    if os.path.exists(router.socket_path):
+        os.unlink(router.socket_path)
+
+    server = await loop.create_unix_server(
+        lambda: RedisProtocol(forwarded=True),
+        router.socket_path,
+    )
 
     async with server:
         await server.serve_forever()
@@ -53,8 +88,9 @@ async def run_server(port:int):
 async def run_replica(master_host: str, master_port: int, self_port: int):
     handler = RedisCommandHandler()
     replica = Replica(master_host, master_port, self_port, handler)
-    await replica.handshake()
-    await replica.listen_for_commands()
+
+    # Reconnects and resyncs on its own whenever the link with master fails
+    await replica.run()
 
 
 async def main(args):
@@ -67,23 +103,78 @@ async def main(args):
     if args.dbfilename:
         os.environ["dbfilename"] = args.dbfilename
 
+    if args.databases is not None:
+        os.environ["databases"] = str(args.databases)
+
+    if args.maxmemory is not None:
+        os.environ["maxmemory"] = args.maxmemory
+
+    if args.maxmemory_policy is not None:
+        os.environ["maxmemory-policy"] = args.maxmemory_policy
+
+    # Fails early on invalid eviction config
+    reload_settings()
+
+    for key, value in (
+        ("port", args.port),
+        ("bind", args.bind),
+        ("tcp-backlog", args.tcp_backlog),
+        ("tcp-keepalive", args.tcp_keepalive),
+        ("maxclients", args.maxclients),
+        ("timeout", args.timeout),
+    ):
+        if value is not None:
+            os.environ[key] = str(value)
+
+    # Fails early on invalid client limits
+    reload_client_settings()
+
+    cluster = None
+    if args.cluster_config_file:
+        cluster = ClusterState.from_file(args.cluster_config_file, args.port)
+        set_cluster(cluster)
+
     # Always add the server task
     server_task = asyncio.create_task(run_server(args.port))
     tasks.append(server_task)
 
+    # Records event loop stalls, once latency-monitor-threshold is set
+    tasks.append(asyncio.create_task(monitor_event_loop()))
+
+    # Instantaneous rates of INFO stats
+    tasks.append(asyncio.create_task(sample_stats()))
+
+    # Closes clients idle for longer than timeout
+    tasks.append(asyncio.create_task(check_idle_clients(ConnectionRegistry())))
+
+    router = get_router()
+
+    if args.metrics_port:
+        # Every shard is a process of its own, with metrics of its own
+        metrics_port = args.metrics_port + (router.shard_id if router is not None else 0)
+        tasks.append(asyncio.create_task(run_metrics_server(metrics_port, ConnectionRegistry())))
+    if router is not None:
+        tasks.append(asyncio.create_task(run_shard_server(router)))
+
     if args.replicaof:
         os.environ["replicaof"] = args.replicaof
         master_host, master_port = args.replicaof.split()
         replica_task = asyncio.create_task(run_replica(master_host, master_port, args.port))
         tasks.append(replica_task)
-
-    db_data = {}
+    else:
+        # Heartbeat to our replicas, replicas forward the heartbeat of their master instead
+        heartbeat_task = asyncio.create_task(ConnectionRegistry().ping_replicas())
+        tasks.append(heartbeat_task)
 
     if args.dbfilename:
         rdb = RDBParser(args.dir, args.dbfilename)
-        db_data = rdb.databases[0] if rdb.databases else {}
+        # Each shard keeps only the keys of its own slots
+        load_databases(rdb.databases, router.owns_key if router is not None else None)
 
-    Database(db_data)
+    # CLUSTER COUNTKEYSINSLOT and GETKEYSINSLOT are served from the slot index.
+    # Cluster mode only serves database 0.
+    if cluster is not None:
+        get_database(0).enable_slot_index()
 
     # Keep track of completed tasks
     while tasks:
@@ -96,7 +187,7 @@ async def main(args):
             try:
                 await task
             except Exception as e:
-                logger.exception("Task failed", e)
+                logger.exception("Task failed: %s", e)
 
             # Remove completed task
             tasks.remove(task)
@@ -105,7 +196,54 @@ async def main(args):
         if server_task not in tasks and not server_task.done():
             tasks.append(server_task)
 
-        # If replica task failed or completed, it won't be restarted automatically
+
+def run_shards(args):
+    """
+    Fork a worker process per shard, and wait on them.
+
+    Workers own disjoint slot ranges of the keyspace, so a worker which dies
+    takes its keys with it. We then stop the other workers as well, rather than
+    keep serving a partial keyspace.
+    """
+
+    workers = {}
+    stopping = False
+
+    for shard_id in range(args.shards):
+        pid = os.fork()
+        if pid == 0:
+            set_router(ShardRouter(shard_id, args.shards, args.port))
+            try:
+                asyncio.run(main(args))
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os._exit(0)
+
+        workers[pid] = shard_id
+
+    def stop_workers(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop_workers)
+    signal.signal(signal.SIGINT, stop_workers)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+
+        shard_id = workers.pop(pid)
+        if not stopping:
+            logger.error("Shard %s exited with status %s, stopping all shards", shard_id, status)
+            stop_workers(None, None)
 
 
 if __name__ == "__main__":
@@ -117,6 +255,47 @@ if __name__ == "__main__":
     parser.add_argument(
         "--replicaof",
         help="If this is specified, it is assumed that this is slave replica. '<Master HOST> <Master PORT>' is needed")
+    parser.add_argument("--bind", help="Addresses to listen on, separated by space. Default is localhost")
+    parser.add_argument("--tcp-backlog", type=int, help="Listen backlog of the server socket. Default is 511")
+    parser.add_argument(
+        "--tcp-keepalive", type=int,
+        help="Seconds before TCP keepalive probes are sent to idle clients, 0 disables. Default is 300")
+    parser.add_argument("--maxclients", type=int, help="Clients connected at once, more are refused. Default is 10000")
+    parser.add_argument(
+        "--timeout", type=int, help="Seconds before an idle client is disconnected, 0 never. Default is 0")
+    parser.add_argument(
+        "--event-loop", choices=["auto", "uvloop", "asyncio"], default="auto",
+        help="Event loop implementation. auto uses uvloop when it is installed")
+    parser.add_argument("--maxmemory", help="Memory limit of the dataset, like 100mb. Default is 0, no limit")
+    parser.add_argument(
+        "--maxmemory-policy", choices=sorted(POLICIES),
+        help="Keys evicted once over maxmemory. Default is noeviction")
+    parser.add_argument("--databases", type=int, help="Number of logical databases. Default is 16")
+    parser.add_argument(
+        "--shards", type=int, default=1,
+        help="Number of worker processes, each owning a part of the keyspace. Default is 1")
+    parser.add_argument(
+        "--metrics-port", type=int,
+        help="Serve metrics in OpenMetrics format on this port, at /metrics. "
+             "With --shards, every shard serves on a port of its own from this one on")
+    parser.add_argument(
+        "--cluster-config-file",
+        help="Enables cluster mode. Static config listing the nodes and the hash slots they serve")
     args = parser.parse_args()
 
-    asyncio.run(main(args))
+    if args.databases is not None and args.databases < 1:
+        parser.error("--databases must be at least 1")
+
+    if args.shards > 1 and args.replicaof:
+        parser.error("--shards can not be used along with --replicaof")
+
+    if args.shards > 1 and args.cluster_config_file:
+        parser.error("--shards can not be used along with --cluster-config-file")
+
+    loop_name = install_event_loop(args.event_loop)
+    logger.info("Using %s event loop", loop_name)
+
+    if args.shards > 1:
+        run_shards(args)
+    else:
+        asyncio.run(main(args))
@@ -0,0 +1,113 @@
+"""
+Estimated memory usage of the dataset.
+
+Measuring real usage of Python objects on every write is far too slow, so
+every key is given an estimate built from sys.getsizeof of its parts and
+fixed overheads of the structures which hold it. Database keeps the sum up
+to date on every write, which is what maxmemory is checked against.
+"""
+
+from itertools import islice
+import os
+import resource
+import sys
+
+# Keyspace dict slot, bucket index entry, and access clock entry of every key
+KEY_OVERHEAD = 120
+
+# Value of a string key, {"value": ..., "expires_at": ...}
+STRING_ENTRY_SIZE = sys.getsizeof({"value": None, "expires_at": None})
+
+# Entry of a key in the index of keys with an expiry
+VOLATILE_KEY_OVERHEAD = 20
+
+# Expiry timestamp (a datetime), and the key in the index of keys with an expiry
+EXPIRY_SIZE = 48 + VOLATILE_KEY_OVERHEAD
+
+# Entries of a stream MEMORY USAGE looks at by default, 0 is all of them
+DEFAULT_SAMPLES = 5
+
+# Base size of an empty stream (OrderedDict), and link node plus dict slot of every entry
+STREAM_SIZE = 120
+STREAM_ENTRY_OVERHEAD = 100
+
+
+def get_string_entry_size(key: str, entry: dict) -> int:
+    size = KEY_OVERHEAD + sys.getsizeof(key) + STRING_ENTRY_SIZE + sys.getsizeof(entry["value"])
+    if entry["expires_at"] is not None:
+        size += EXPIRY_SIZE
+    return size
+
+
+def get_stream_entry_size(stream_id: str, fields: dict) -> int:
+    """
+    Size of one entry of a stream
+    """
+    size = STREAM_ENTRY_OVERHEAD + sys.getsizeof(stream_id) + sys.getsizeof(fields)
+    for field, value in fields.items():
+        size += sys.getsizeof(field) + sys.getsizeof(value)
+    return size
+
+
+def get_stream_size(stream) -> int:
+    """
+    Size of a whole stream, without its key. Linear in the entries of the stream.
+    """
+    return STREAM_SIZE + sum(
+        get_stream_entry_size(stream_id, fields) for stream_id, fields in stream.items()
+    )
+
+
+def get_stream_key_size(key: str) -> int:
+    """
+    Size of a stream key, to which the size of the stream adds up
+    """
+    return KEY_OVERHEAD + sys.getsizeof(key)
+
+
+def sample_stream_size(stream, samples: int = DEFAULT_SAMPLES) -> int:
+    """
+    Size of a stream estimated from its first samples entries, same as MEMORY USAGE
+    of Redis does for aggregate types. All entries are looked at with samples of 0.
+    """
+
+    if samples <= 0 or len(stream) <= samples:
+        return get_stream_size(stream)
+
+    sampled = sum(
+        get_stream_entry_size(stream_id, fields)
+        for stream_id, fields in islice(stream.items(), samples)
+    )
+    return STREAM_SIZE + sampled * len(stream) // samples
+
+
+def get_process_memory():
+    """
+    Resident memory of the process, now and at its peak, in bytes
+    """
+
+    # ru_maxrss is in kilobytes on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    try:
+        with open("/proc/self/statm", encoding="ascii") as fd:
+            current = int(fd.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        current = peak
+
+    return current, peak
+
+
+def bytes_to_human(size: int) -> str:
+    """
+    Size the way INFO shows it next to the exact figure, like 1.50M
+    """
+    for unit in ("B", "K", "M", "G"):
+        if size < 1024 or unit == "G":
+            break
+        size /= 1024
+
+    if unit == "B":
+        return f"{size}B"
+    return f"{size:.2f}{unit}"
+
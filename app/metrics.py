@@ -0,0 +1,251 @@
+"""
+Metrics of the server in OpenMetrics text format, for Prometheus to scrape.
+
+Served over plain HTTP by a tiny handler on the event loop of the server
+(GET /metrics), enabled with --metrics-port. Everything is read from counters
+the server keeps anyway (app.stats, ConnectionRegistry, Database), nothing is
+measured on a scrape. The reply is rendered one metric family group at a time,
+and written out as it goes, so a scrape never holds the loop for long.
+"""
+
+import asyncio
+import logging
+
+from app.config import get_config
+from app.database import get_databases
+from app.eviction import get_settings, get_used_memory
+from app.lazyfree import pending_objects
+from app.memory import get_process_memory
+from app.stats import get_stats
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# Bounds of the command latency histograms, powers of two microseconds from 1us to ~1s
+LATENCY_BOUNDS = [1 << power for power in range(21)]
+
+# Longest request (line and headers) accepted, and how long a client may take to send it
+MAX_REQUEST_SIZE = 8192
+REQUEST_TIMEOUT = 5
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in labels.items()) + "}"
+
+
+class MetricFamily:
+    """
+    Lines of one metric family, its TYPE and HELP followed by its samples
+    """
+
+    def __init__(self, name: str, metric_type: str, help_text: str):
+        self.name = name
+        self.lines = [f"# TYPE {name} {metric_type}", f"# HELP {name} {help_text}"]
+        # Counters are exposed with a _total suffix
+        self.suffix = "_total" if metric_type == "counter" else ""
+
+    def add(self, value, labels: dict = None, suffix: str = None):
+        suffix = self.suffix if suffix is None else suffix
+        self.lines.append(f"{self.name}{suffix}{format_labels(labels)} {value}")
+        return self
+
+    def render(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+def render_server() -> str:
+    stats = get_stats()
+    families = [
+        MetricFamily("redis_uptime_seconds", "gauge", "Seconds since the server started")
+        .add(stats.get_uptime()),
+        MetricFamily("redis_commands_processed", "counter", "Commands executed")
+        .add(stats.total_commands_processed),
+        MetricFamily("redis_instantaneous_ops_per_sec", "gauge", "Commands per second, recent average")
+        .add(round(stats.ops_per_sec.get())),
+        MetricFamily("redis_connections_received", "counter", "Connections accepted")
+        .add(stats.total_connections_received),
+        MetricFamily("redis_rejected_connections", "counter", "Connections refused, over maxclients")
+        .add(stats.rejected_connections),
+        MetricFamily(
+            "redis_client_output_buffer_limit_disconnections", "counter",
+            "Clients closed, over client-output-buffer-limit",
+        ).add(stats.client_output_buffer_limit_disconnections),
+        MetricFamily("redis_net_input_bytes", "counter", "Bytes read from connections")
+        .add(stats.total_net_input_bytes),
+        MetricFamily("redis_net_output_bytes", "counter", "Bytes written to connections")
+        .add(stats.total_net_output_bytes),
+        MetricFamily("redis_error_replies", "counter", "Commands replied with an error")
+        .add(stats.total_error_replies),
+        MetricFamily("redis_keyspace_hits", "counter", "Reads of keys which existed")
+        .add(stats.keyspace_hits),
+        MetricFamily("redis_keyspace_misses", "counter", "Reads of keys which did not exist")
+        .add(stats.keyspace_misses),
+        MetricFamily("redis_expired_keys", "counter", "Keys deleted when found expired")
+        .add(stats.expired_keys),
+        MetricFamily("redis_evicted_keys", "counter", "Keys evicted to get within maxmemory")
+        .add(stats.evicted_keys),
+    ]
+    return "".join(family.render() for family in families)
+
+
+def render_commands() -> str:
+    stats = get_stats()
+
+    calls = MetricFamily("redis_commands", "counter", "Calls of a command")
+    failed = MetricFamily("redis_commands_failed_calls", "counter", "Calls of a command which replied with an error")
+    rejected = MetricFamily("redis_commands_rejected_calls", "counter", "Calls of a command refused before it ran")
+    latency = MetricFamily("redis_command_latency_seconds", "histogram", "Latency of a command")
+
+    for command, command_stats in stats.commands.items():
+        labels = {"cmd": command}
+        calls.add(command_stats.calls, labels)
+        failed.add(command_stats.failed_calls, labels)
+        rejected.add(command_stats.rejected_calls, labels)
+
+        histogram = command_stats.histogram
+        if histogram is None:
+            continue
+
+        for bound, count in zip(LATENCY_BOUNDS, histogram.get_counts_below(LATENCY_BOUNDS)):
+            latency.add(count, {"cmd": command, "le": f"{bound / 1_000_000:g}"}, "_bucket")
+        latency.add(histogram.total, {"cmd": command, "le": "+Inf"}, "_bucket")
+        latency.add(histogram.total, labels, "_count")
+        latency.add(command_stats.usec / 1_000_000, labels, "_sum")
+
+    return calls.render() + failed.render() + rejected.render() + latency.render()
+
+
+def render_clients(registry) -> str:
+    replicas = registry.get_replicas()
+
+    connected_replicas = MetricFamily("redis_connected_slaves", "gauge", "Replicas attached")
+    connected_replicas.add(len(replicas))
+
+    offset = MetricFamily("redis_master_repl_offset", "gauge", "Offset of the replication stream")
+    offset.add(registry.replication_offset)
+
+    replica_offset = MetricFamily("redis_slave_repl_offset", "gauge", "Offset a replica acknowledged")
+    replica_lag = MetricFamily("redis_slave_lag_seconds", "gauge", "Seconds since a replica acknowledged")
+    for replica in replicas:
+        labels = {"slave_ip": replica["ip"], "slave_port": replica["port"]}
+        lag, _ = registry.get_replica_lag(replica)
+        replica_offset.add(replica["offset"], labels)
+        replica_lag.add(lag, labels)
+
+    families = [
+        # Replicas connect as clients as well, they are not counted
+        MetricFamily("redis_connected_clients", "gauge", "Client connections")
+        .add(max(0, len(registry.clients) - len(replicas))),
+        connected_replicas, offset, replica_offset, replica_lag,
+    ]
+
+    master_link = registry.master_link
+    if master_link is not None:
+        families.append(
+            MetricFamily("redis_master_link_up", "gauge", "Link with our master is up")
+            .add(int(master_link.is_link_up()))
+        )
+
+    return "".join(family.render() for family in families)
+
+
+def render_keyspace() -> str:
+    databases = get_databases()
+
+    keys = MetricFamily("redis_db_keys", "gauge", "Keys of a database")
+    expiring = MetricFamily("redis_db_keys_expiring", "gauge", "Keys of a database with an expiry")
+    for index, db in enumerate(databases):
+        if not len(db):
+            continue
+        keys.add(len(db), {"db": f"db{index}"})
+        expiring.add(len(db.volatile), {"db": f"db{index}"})
+
+    rss, _ = get_process_memory()
+    families = [
+        keys, expiring,
+        MetricFamily("redis_memory_used_bytes", "gauge", "Estimated memory of the dataset")
+        .add(get_used_memory(databases)),
+        MetricFamily("redis_memory_max_bytes", "gauge", "maxmemory, 0 for no limit")
+        .add(get_settings().maxmemory),
+        MetricFamily("redis_memory_used_rss_bytes", "gauge", "Resident memory of the process")
+        .add(rss),
+        MetricFamily("redis_lazyfree_pending_objects", "gauge", "Objects waiting to be freed")
+        .add(pending_objects()),
+    ]
+    return "".join(family.render() for family in families)
+
+
+def render_metrics(registry):
+    """
+    Metrics in OpenMetrics text format, in parts which can be written one by one
+    """
+    yield render_server()
+    yield render_commands()
+    yield render_clients(registry)
+    yield render_keyspace()
+    yield "# EOF\n"
+
+
+class MetricsServer:
+    """
+    Minimal HTTP server for GET /metrics. Every reply closes the connection.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    async def handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), REQUEST_TIMEOUT)
+            method, path, _ = request.split(b"\r\n", 1)[0].decode("latin-1").split(" ", 2)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ValueError):
+            writer.close()
+            return
+
+        try:
+            if method not in ("GET", "HEAD"):
+                self.write_head(writer, "405 Method Not Allowed", "text/plain")
+            elif path.split("?", 1)[0] not in ("/", "/metrics"):
+                self.write_head(writer, "404 Not Found", "text/plain")
+            else:
+                self.write_head(writer, "200 OK", CONTENT_TYPE)
+                if method == "GET":
+                    for part in render_metrics(self.registry):
+                        writer.write(part.encode("utf-8"))
+                        await writer.drain()
+                        # Commands of clients run in between the parts
+                        await asyncio.sleep(0)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        except Exception as e:  # pylint: disable=broad-except
+            logger.exception("Error while serving metrics: %s", e)
+        finally:
+            writer.close()
+
+    @staticmethod
+    def write_head(writer, status: str, content_type: str):
+        # No Content-Length, the body ends when the connection is closed
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nConnection: close\r\n\r\n".encode("latin-1")
+        )
+
+
+async def run_metrics_server(port: int, registry):
+    server = await asyncio.start_server(
+        MetricsServer(registry).handle,
+        get_config("bind").split(),
+        port,
+        limit=MAX_REQUEST_SIZE,
+        reuse_address=True,
+    )
+
+    async with server:
+        await server.serve_forever()
@@ -0,0 +1,60 @@
+"""
+Execution tier for heavy read only commands (KEYS, XRANGE over big streams).
+
+A snapshot of what the command reads is taken on the event loop, which is a
+C level copy (list of keys, copy of a stream) and much cheaper than the command
+itself. The command then runs on the snapshot in a worker thread, and the event
+loop keeps serving other clients meanwhile.
+
+Worker threads share the GIL with the event loop, so work is done in chunks
+of bytecode, letting the interpreter switch back to the loop regularly.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import get_int_config
+from app.pattern import compile_pattern
+
+# Keys matched per step, the GIL can only be handed over in between steps
+MATCH_CHUNK_SIZE = 10_000
+
+_executor = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=get_int_config("offload-threads"), thread_name_prefix="offload"
+        )
+    return _executor
+
+
+def should_offload(size: int) -> bool:
+    """
+    Is a command reading this many items worth a trip to a worker thread?
+    """
+    threshold = get_int_config("offload-min-keys")
+    return 0 < threshold <= size
+
+
+async def run_offloaded(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), func, *args)
+
+
+def match_keys(keys: list, pattern: str) -> list:
+    """
+    Return keys which match the glob pattern
+    """
+
+    compiled = compile_pattern(pattern)
+    if compiled.match_all:
+        return list(keys)
+
+    match = compiled.match
+    result = []
+    for start in range(0, len(keys), MATCH_CHUNK_SIZE):
+        result.extend(filter(match, keys[start:start + MATCH_CHUNK_SIZE]))
+
+    return result
@@ -0,0 +1,148 @@
+"""
+Glob style patterns of KEYS and SCAN MATCH, with Redis semantics:
+
+    *       any sequence of characters, including none
+    ?       any single character
+    [abc]   one of the characters, [^abc] none of them, [a-z] a range
+    \\x      x literally, in and out of brackets
+
+Matching is always case sensitive. Patterns are compiled once (and cached) into
+the cheapest matcher which does the job: string equality for literals,
+startswith for prefixes (user:123:*), and a regular expression otherwise.
+"""
+
+from functools import lru_cache
+from operator import methodcaller
+import re
+
+SPECIAL_CHARS = "*?[\\"
+
+
+class Pattern:
+    """
+    Compiled pattern, call it with a key to match
+    """
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+
+        # Pattern matches every key
+        self.match_all = False
+        # Literal part the pattern starts with, every matching key starts with it
+        self.prefix = ""
+        # Pattern is only the literal, without anything after it
+        self.is_literal = False
+        # Pattern is the literal followed by *
+        self.is_prefix = False
+
+        self._parse()
+
+        if self.is_literal:
+            self.match = self.prefix.__eq__
+        elif self.is_prefix:
+            self.match_all = not self.prefix
+            self.match = methodcaller("startswith", self.prefix)
+        else:
+            self.match = re.compile(self._to_regex(), re.DOTALL).fullmatch
+
+    def __call__(self, key: str) -> bool:
+        return bool(self.match(key))
+
+    def _parse(self):
+        prefix = []
+        pattern = self.pattern
+        idx = 0
+
+        while idx < len(pattern):
+            char = pattern[idx]
+            if char == "\\" and idx + 1 < len(pattern):
+                prefix.append(pattern[idx + 1])
+                idx += 2
+                continue
+            if char in SPECIAL_CHARS:
+                break
+            prefix.append(char)
+            idx += 1
+
+        self.prefix = "".join(prefix)
+        rest = pattern[idx:]
+
+        self.is_literal = not rest
+        self.is_prefix = bool(rest) and rest == "*" * len(rest)
+
+    def _to_regex(self) -> str:
+        pattern = self.pattern
+        parts = []
+        idx = 0
+
+        while idx < len(pattern):
+            char = pattern[idx]
+
+            if char == "*":
+                # Consecutive stars are same as one
+                while idx + 1 < len(pattern) and pattern[idx + 1] == "*":
+                    idx += 1
+                parts.append(".*")
+            elif char == "?":
+                parts.append(".")
+            elif char == "[":
+                regex, idx = self._class_to_regex(idx + 1)
+                parts.append(regex)
+                continue
+            elif char == "\\" and idx + 1 < len(pattern):
+                idx += 1
+                parts.append(re.escape(pattern[idx]))
+            else:
+                parts.append(re.escape(char))
+
+            idx += 1
+
+        return "".join(parts)
+
+    def _class_to_regex(self, idx: int):
+        """
+        Translate the [...] class starting at idx (right after the bracket).
+        Like Redis, a class which is not closed runs till the end of the pattern.
+
+        Returns:
+            tuple: Regex of the class, and index right after the class
+        """
+
+        pattern = self.pattern
+        negate = idx < len(pattern) and pattern[idx] == "^"
+        if negate:
+            idx += 1
+
+        items = []
+        while idx < len(pattern) and pattern[idx] != "]":
+            char = pattern[idx]
+
+            if char == "\\" and idx + 1 < len(pattern):
+                idx += 1
+                items.append(re.escape(pattern[idx]))
+            elif idx + 2 < len(pattern) and pattern[idx + 1] == "-" and pattern[idx + 2] != "]":
+                start, end = char, pattern[idx + 2]
+                # Redis accepts reversed ranges, [z-a] is same as [a-z]
+                if start > end:
+                    start, end = end, start
+                items.append(f"{re.escape(start)}-{re.escape(end)}")
+                idx += 2
+            else:
+                items.append(re.escape(char))
+
+            idx += 1
+
+        # Skip the closing bracket
+        idx += 1
+
+        if not items:
+            # [] matches nothing, [^] matches any character
+            return ("." if negate else "(?!)"), idx
+
+        return f"[{'^' if negate else ''}{''.join(items)}]", idx
+
+
+@lru_cache(maxsize=256)
+def compile_pattern(pattern: str) -> Pattern:
+    return Pattern(pattern)
+
@@ -0,0 +1,261 @@
+import asyncio
+import logging
+import socket
+import time
+
+from app.clients import NORMAL, get_client_settings, is_over_output_buffer_limit, next_client_id
+from app.config import get_int_config
+from app.connection_registry import ConnectionRegistry
+from app.handler import RedisCommandHandler
+from app.serialiser import RedisEncoder, RedisStreamDecoder
+from app.stats import get_stats
+
+logger = logging.getLogger(__name__)
+
+# Stop reading from a client which has this many commands waiting to be executed
+MAX_PENDING_COMMANDS = 10_000
+
+
+def set_socket_options(sock, keepalive: int):
+    """
+    Send replies without waiting to coalesce (TCP_NODELAY), and detect dead
+    peers with TCP keepalive probes, same as Redis does with tcp-keepalive.
+
+    Args:
+        keepalive: Seconds of idle time before probes are sent, 0 disables keepalive
+    """
+    if sock is None or sock.family not in (socket.AF_INET, socket.AF_INET6):
+        return
+
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    if keepalive <= 0:
+        return
+
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+    # Fine grained options are not available on every platform
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, keepalive)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(1, keepalive // 3))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+
+
+class TransportWriter:
+    """
+    StreamWriter like interface over a transport.
+
+    Handler and ConnectionRegistry write to connections through this
+    (for example propagating to a replica), same as they would with a StreamWriter.
+    """
+
+    def __init__(self, transport, protocol):
+        self.transport = transport
+        self.protocol = protocol
+
+    def write(self, data):
+        self.protocol.stats.total_net_output_bytes += len(data)
+        self.transport.write(data)
+        self.protocol.check_output_buffer()
+
+    async def drain(self):
+        await self.protocol.wait_writable()
+
+    def get_extra_info(self, name, default=None):
+        return self.transport.get_extra_info(name, default)
+
+    def is_closing(self):
+        return self.transport.is_closing()
+
+    def close(self):
+        self.transport.close()
+
+
+class RedisProtocol(asyncio.Protocol):
+    """
+    One instance per client connection.
+
+    Received data is fed straight into an incremental decoder, and all complete
+    commands (a whole pipeline) are executed together, with their replies sent in
+    a single transport write. Backpressure comes from the transport: when its write
+    buffer is full we stop executing commands and stop reading, till it drains.
+    Replies still pile up in the write buffer of a client which does not read them,
+    up to client-output-buffer-limit.
+    """
+
+    def __init__(self, connection_registry=None, forwarded=False):
+        self.connection_registry = connection_registry or ConnectionRegistry()
+        self.handler = RedisCommandHandler(self.connection_registry)
+        self.handler.client = self
+
+        # Connection of another shard, which forwards commands of its clients
+        self.forwarded = forwarded
+
+        # Commands forwarded by another shard are always for keys we own
+        if forwarded:
+            self.handler.shard_router = None
+
+        # What CLIENT LIST shows of us
+        self.id = next_client_id()
+        self.name = ""
+        self.client_type = NORMAL
+        self.created_at = self.last_interaction = time.monotonic()
+
+        # Since when the output buffer is above the soft limit
+        self.soft_limit_reached_at = None
+        # CLIENT KILL of our own connection, it is closed once the reply is sent
+        self.close_after_reply = False
+
+        self.decoder = RedisStreamDecoder()
+
+        # Counters are reset in place, the object itself is kept
+        self.stats = get_stats()
+
+        self.transport = None
+        self.writer = None
+
+        self.pending = []
+        self.task = None
+        self.reading_paused = False
+
+        self._writable = asyncio.Event()
+        self._writable.set()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.writer = TransportWriter(transport, self)
+
+        registry = self.connection_registry
+        if not self.forwarded and len(registry.clients) >= get_client_settings().maxclients:
+            transport.write(RedisEncoder().encode_error("max number of clients reached").encode("utf-8"))
+            transport.close()
+            self.stats.rejected_connections += 1
+            return
+
+        registry.add_client(self)
+        self.stats.total_connections_received += 1
+
+        set_socket_options(transport.get_extra_info("socket"), get_int_config("tcp-keepalive"))
+
+    def connection_lost(self, exc):
+        # Unblock anyone waiting to write to us
+        self._writable.set()
+        self.connection_registry.remove_client(self)
+
+        # Ensure cleanup of replica if connection closes
+        asyncio.get_running_loop().create_task(self.connection_registry.remove_replica(self.writer))
+
+    def pause_writing(self):
+        self._writable.clear()
+
+    def resume_writing(self):
+        self._writable.set()
+
+    async def wait_writable(self):
+        await self._writable.wait()
+
+    def get_buffer_sizes(self):
+        """
+        Bytes buffered for this client, as (query buffer, output buffer)
+        """
+        output = self.transport.get_write_buffer_size() if self.transport is not None else 0
+        return self.decoder.pending(), output
+
+    def get_address(self, name: str = "peername") -> str:
+        """
+        host:port of the client (peername), or of our end of the connection (sockname)
+        """
+        try:
+            host, port = self.transport.get_extra_info(name)[:2]
+        except (AttributeError, TypeError, ValueError):
+            return ""
+        return f"{host}:{port}"
+
+    def get_fd(self) -> int:
+        sock = self.transport.get_extra_info("socket") if self.transport is not None else None
+        return sock.fileno() if sock is not None else -1
+
+    def is_over_output_limit(self, pending: int = 0) -> bool:
+        """
+        Is the output buffer, with pending bytes of replies still to be written, over the limits
+        """
+        if self.forwarded:
+            return False
+        size = self.transport.get_write_buffer_size() + pending
+        return is_over_output_buffer_limit(self, size, time.monotonic())
+
+    def check_output_buffer(self):
+        """
+        Disconnect the client once its output buffer is over the limits of its class
+        """
+
+        size = self.transport.get_write_buffer_size()
+        if (not size and self.soft_limit_reached_at is None) or self.forwarded:
+            return
+
+        if is_over_output_buffer_limit(self, size, time.monotonic()):
+            self.close_over_output_limit(size)
+
+    def close_over_output_limit(self, size: int):
+        logger.warning(
+            "Client id=%s addr=%s closed for overcoming of output buffer limits (%s bytes)",
+            self.id, self.get_address(), size,
+        )
+        self.stats.client_output_buffer_limit_disconnections += 1
+        # Replies it did not read are dropped, not sent
+        self.transport.abort()
+
+    def data_received(self, data):
+        self.last_interaction = time.monotonic()
+        self.stats.total_net_input_bytes += len(data)
+        self.decoder.feed(data)
+
+        try:
+            commands = self.decoder.get_values()
+        except ValueError:
+            self.transport.write(RedisEncoder().encode_error("Protocol error").encode("utf-8"))
+            self.transport.close()
+            return
+
+        # Empty lines are valid in inline protocol, there is nothing to execute
+        self.pending.extend(item for item in commands if item[0])
+
+        if self.pending and self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.process())
+
+        if len(self.pending) > MAX_PENDING_COMMANDS and not self.reading_paused:
+            self.reading_paused = True
+            self.transport.pause_reading()
+
+    async def process(self):
+        """
+        Execute pending commands in batches till there is nothing left
+        """
+
+        try:
+            while self.pending and not self.transport.is_closing():
+                commands, self.pending = self.pending, []
+
+                response = await self.handler.execute_commands(commands, False, self.writer)
+                if response and not self.transport.is_closing():
+                    if isinstance(response, str):
+                        response = response.encode("utf-8", "surrogateescape")
+                    self.stats.total_net_output_bytes += len(response)
+                    self.transport.write(response)
+                    self.check_output_buffer()
+
+                if self.close_after_reply:
+                    self.transport.close()
+                    break
+
+                # Client is not reading its replies, wait before executing more
+                await self._writable.wait()
+
+                if self.reading_paused:
+                    self.reading_paused = False
+                    self.transport.resume_reading()
+        except Exception as e:
+            logger.exception("Error while processing commands: %s", e)
+            self.transport.close()
+        finally:
+            self.task = None
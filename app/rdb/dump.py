@@ -0,0 +1,117 @@
+"""
+DUMP / RESTORE payloads.
+
+Same layout as Redis: the value in RDB encoding, followed by the RDB version
+(2 bytes, little endian) and CRC64 of everything before it (8 bytes, little endian).
+
+Values are encoded like in the snapshots sent to replicas (app.rdb.snapshot).
+Strings use the RDB string encoding, so their payloads can be restored by Redis as well.
+Streams use a simple encoding of our own, which only this server understands.
+"""
+
+import io
+
+from app.database import Stream
+from app.rdb.parser import STREAM_ENCODING, STRING_ENCODING
+from app.rdb.snapshot import RDB_VERSION, encode_value
+
+
+def _make_crc64_table():
+    # CRC64 Jones (reflected), as used by Redis for RDB and DUMP checksums
+    poly = 0x95AC9329AC4BC9B5
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ poly if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+CRC64_TABLE = _make_crc64_table()
+
+
+def crc64(data: bytes, crc: int = 0) -> int:
+    for byte in data:
+        crc = CRC64_TABLE[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc
+
+
+class DumpPayloadException(ValueError):
+    """
+    Payload is corrupt, or of a version we do not understand
+    """
+
+
+def read_length(fd) -> int:
+    first = fd.read(1)
+    if not first:
+        raise DumpPayloadException("Unexpected end of payload")
+
+    kind = first[0] >> 6
+    if kind == 0:
+        return first[0] & 0x3F
+    if kind == 1:
+        return ((first[0] & 0x3F) << 8) | fd.read(1)[0]
+    if kind == 2:
+        return int.from_bytes(fd.read(4), "big")
+
+    raise DumpPayloadException("Encoded integers are not supported")
+
+
+def read_string(fd) -> str:
+    length = read_length(fd)
+    data = fd.read(length)
+    if len(data) != length:
+        raise DumpPayloadException("Unexpected end of payload")
+    return data.decode("utf-8", "surrogateescape")
+
+
+def dump_value(value) -> bytes:
+    """
+    Serialize a value (string or stream) into a DUMP payload
+    """
+
+    parts = encode_value(value)
+    parts.append(RDB_VERSION.to_bytes(2, "little"))
+    data = b"".join(parts)
+
+    return data + crc64(data).to_bytes(8, "little")
+
+
+def restore_value(payload: bytes):
+    """
+    Deserialize a DUMP payload into a value
+
+    Raises:
+        DumpPayloadException: Payload is corrupt or not supported
+    """
+
+    if len(payload) < 11:
+        raise DumpPayloadException("Payload is too short")
+
+    data, checksum = payload[:-8], payload[-8:]
+    version = int.from_bytes(data[-2:], "little")
+
+    if version > RDB_VERSION or crc64(data) != int.from_bytes(checksum, "little"):
+        raise DumpPayloadException("DUMP payload version or checksum are wrong")
+
+    fd = io.BytesIO(data[:-2])
+    value_type = fd.read(1)[0]
+
+    if value_type == STRING_ENCODING:
+        value = read_string(fd)
+    elif value_type == STREAM_ENCODING:
+        value = Stream()
+        for _ in range(read_length(fd)):
+            stream_id = read_string(fd)
+            value[stream_id] = {
+                read_string(fd): read_string(fd) for _ in range(read_length(fd))
+            }
+    else:
+        raise DumpPayloadException(f"Unsupported value type: {value_type}")
+
+    if fd.read(1):
+        raise DumpPayloadException("Trailing data in payload")
+
+    return value
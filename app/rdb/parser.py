@@ -1,6 +1,9 @@
 from datetime import datetime
+import io
 import os
 
+from app.database import Stream
+
 REDIS_METADATA = 250  # b"\xfa"
 REDIS_HASH_TABLE = 251  # b"\xfb"   ## Resize DB
 REDIS_EXPIRY_MS = 252 # b"\xfc"
@@ -22,6 +25,10 @@ SORTED_SET_IN_ZIPLIST_ENCODING = 12
 HASHMAP_IN_ZIPLIST_ENCODING = 13  # Introduced in RDB version 4
 LIST_IN_QUICKLIST_ENCODING = 14  # Introduced in RDB version 7
 
+# Streams in an encoding of our own (entry count, then ID, field count and fields
+# of every entry), in DUMP payloads and snapshots sent to replicas. Not used by Redis.
+STREAM_ENCODING = 200
+
 
 
 class RDBParser:
@@ -31,17 +38,22 @@ class RDBParser:
     https://rdb.fnordig.de/file_format.html
     """
 
-    def __init__(self, _dir = None, _file= None):
+    def __init__(self, _dir = None, _file= None, data: bytes = None):
+        self.protocol_version = ""
+        self.metadata = {}
+        self.databases = {}
+
+        # RDB payload received over the network, for example during full resync
+        if data is not None:
+            self.read_file(io.BytesIO(data))
+            return
+
         filename = _file or os.getenv("dbfilename", "dump.rdb")
         _dir = _dir or os.getenv("dir")
 
         if _dir:
             filename = os.path.join(_dir, filename)
 
-        self.protocol_version = ""
-        self.metadata = {}
-        self.databases = {}
-
         self.load(filename)
 
     #############  Helper Utiltiies #################################
@@ -93,8 +105,9 @@ class RDBParser:
             # Discard the remaining 6 bits. The next 4 bytes from the stream represent the length
             length = int.from_bytes(fd.read(4), 'big')
 
-        # TODO
-        # handle msb_2 == 1
+        elif msb_2 == 1:
+            # Remaining 6 bits and the next byte are the length
+            length = ((int.from_bytes(byte_arr, 'big') & 0x3F) << 8) | fd.read(1)[0]
 
         return length, is_integer
 
@@ -115,7 +128,7 @@ class RDBParser:
             # Convert integer to string
             data = str(int.from_bytes(data, 'little'))
         else:
-            data = data.decode('utf-8')
+            data = data.decode('utf-8', 'surrogateescape')
 
         return data
 
@@ -208,13 +221,15 @@ class RDBParser:
             value_type = self.read_code(fd)
 
         elif optional_code == REDIS_EXPIRY_MS:
-            expiry_at = int.from_bytes(fd.read(8), "little") // 1000
+            expiry_at = int.from_bytes(fd.read(8), "little") / 1000
             value_type = self.read_code(fd)
 
         key = self.read_string(fd)
 
         if value_type == STRING_ENCODING:
             value = self.read_string(fd)
+        elif value_type == STREAM_ENCODING:
+            value = self.read_stream(fd)
         # elif value_type == LIST_ENCODING:
         #     value = self.read_list(fd)
         # elif value_type == SET_ENCODING:
@@ -240,6 +255,15 @@ class RDBParser:
 
         return key, value, expiry_at
 
+    def read_stream(self, fd) -> Stream:
+        stream = Stream()
+        for _ in range(self.read_length(fd)[0]):
+            stream_id = self.read_string(fd)
+            stream[stream_id] = {
+                self.read_string(fd): self.read_string(fd) for _ in range(self.read_length(fd)[0])
+            }
+        return stream
+
     def read_single_database(self, fd, db_index):
         """
         Databases are stored as key-value pairs
@@ -255,6 +279,11 @@ class RDBParser:
         for _ in range(hash_size):
             key, value, expiry_at = self.read_single_data(fd)
 
+            # Streams are kept as they are, they never expire
+            if isinstance(value, Stream):
+                self.databases[db_index][key] = value
+                continue
+
             # Add data to the database
             self.databases[db_index][key] = {
                 "value": value,
@@ -293,36 +322,44 @@ class RDBParser:
         checksum_size = 8
         fd.read(checksum_size)
 
-    def load(self, _file):
+    def read_file(self, fd):
         """
-        Load data from the file, and read it.
+        Read the complete RDB content from a file-like object.
         Data is arranged in sequential manner:
 
         Headers
         Metadata
         Database
         End of file
-
-        https://rdb.fnordig.de/file_format.html
         """
 
-        try:
-            with open(_file, 'rb') as fd:
+        self.read_header(fd)
+
+        while True:
+
+            code = self.read_code(fd)
+
+            if code == REDIS_METADATA:
+                code = self.read_metadata(fd)
 
-                self.read_header(fd)
+            if code == REDIS_DB_SELECTOR:
+                code = self.read_databases(fd)
 
-                while True:
+            if code == REDIS_EOF:
+                self.read_eof(fd)
+                break
 
-                    code = self.read_code(fd)
+            raise ValueError(f"Unexpected RDB opcode: {code}")
 
-                    if code == REDIS_METADATA:
-                        code = self.read_metadata(fd)
+    def load(self, _file):
+        """
+        Load data from the file, and read it.
 
-                    if code == REDIS_DB_SELECTOR:
-                        code = self.read_databases(fd)
+        https://rdb.fnordig.de/file_format.html
+        """
 
-                    if code == REDIS_EOF:
-                        self.read_eof(fd)
-                        break
+        try:
+            with open(_file, 'rb') as fd:
+                self.read_file(fd)
         except FileNotFoundError:
             pass
@@ -0,0 +1,92 @@
+"""
+RDB snapshot of the whole dataset, sent to replicas on full resync.
+
+The snapshot is built in one go, without giving the event loop a chance to run
+anything else, so it holds exactly the writes up to the replication offset read
+along with it. Nothing is forked: a large dataset holds the loop while it is built.
+
+Strings are in RDB string encoding, streams in an encoding of our own
+(STREAM_ENCODING), which RDBParser reads as well. Keys which already expired are
+left out. The checksum is written as 0, which means "not computed", like Redis
+with rdbchecksum no.
+"""
+
+from datetime import datetime
+
+from app.database import Stream
+from app.rdb.parser import (
+    REDIS_DB_SELECTOR, REDIS_EOF, REDIS_EXPIRY_MS, REDIS_HASH_TABLE, STREAM_ENCODING, STRING_ENCODING
+)
+
+RDB_VERSION = 11
+
+
+def encode_length(length: int) -> bytes:
+    if length < 1 << 6:
+        return bytes([length])
+    if length < 1 << 14:
+        return bytes([0x40 | (length >> 8), length & 0xFF])
+    return b"\x80" + length.to_bytes(4, "big")
+
+
+def encode_string(value: str) -> bytes:
+    data = value.encode("utf-8", "surrogateescape")
+    return encode_length(len(data)) + data
+
+
+def encode_value(value) -> list:
+    """
+    Value (string or stream) in RDB encoding, its type first, as parts to be joined
+    """
+
+    if not isinstance(value, Stream):
+        return [bytes([STRING_ENCODING]), encode_string(value)]
+
+    parts = [bytes([STREAM_ENCODING]), encode_length(len(value))]
+    for stream_id, fields in value.items():
+        parts.append(encode_string(stream_id))
+        parts.append(encode_length(len(fields)))
+        for field, field_value in fields.items():
+            parts.append(encode_string(field))
+            parts.append(encode_string(field_value))
+    return parts
+
+
+def build_snapshot(databases: list) -> bytes:
+    """
+    RDB payload of every non empty database
+    """
+
+    now = datetime.now()
+    parts = [f"REDIS{RDB_VERSION:04d}".encode()]
+
+    for index, db in enumerate(databases):
+        entries = []
+        keys = expiring = 0
+
+        for key, value in db.data.items():
+            if not isinstance(value, Stream):
+                expires_at = value["expires_at"]
+                if expires_at is not None:
+                    if expires_at < now:
+                        continue
+                    milliseconds = int(expires_at.timestamp() * 1000)
+                    entries.append(bytes([REDIS_EXPIRY_MS]) + milliseconds.to_bytes(8, "little"))
+                    expiring += 1
+                value = value["value"]
+
+            value_type, *encoded = encode_value(value)
+            entries.append(value_type + encode_string(key) + b"".join(encoded))
+            keys += 1
+
+        if not keys:
+            continue
+
+        parts.extend([
+            bytes([REDIS_DB_SELECTOR]), encode_length(index),
+            bytes([REDIS_HASH_TABLE]), encode_length(keys), encode_length(expiring),
+        ])
+        parts.extend(entries)
+
+    parts.append(bytes([REDIS_EOF]) + bytes(8))
+    return b"".join(parts)
@@ -1,11 +1,30 @@
 import asyncio
 import logging
+import random
 
-from app.serialiser import RedisEncoder, RedisDecoder
+from app.database import load_databases
+from app.rdb.parser import RDBParser
+from app.serialiser import RedisEncoder, RedisStreamDecoder
 from app.exceptions import RedisException
 
 logger = logging.getLogger(__name__)
 
+# Replication stream can be large (bursts of writes), so read in big chunks
+READ_SIZE = 64 * 1024
+
+# Replica acknowledges its offset on its own every second, like Redis does
+ACK_INTERVAL = 1
+
+# Reconnect backoff in seconds, doubled after every failed attempt
+RECONNECT_MIN_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30
+
+# Replication link states
+STATE_CONNECT = "connect"
+STATE_HANDSHAKE = "handshake"
+STATE_SYNC = "sync"
+STATE_STREAMING = "streaming"
+
 
 class Replica:
 
@@ -14,10 +33,23 @@ class Replica:
         self.master_port = int(master_port)
         self.port = int(self_port)
         self.encoder = RedisEncoder()
-        self.decoder = RedisDecoder()
+        self.decoder = RedisStreamDecoder()
         self.reader = None
         self.writer = None
         self.handler = handler
+        self.handler.is_master_link = True
+
+        self.master_replid = None
+        # Offset of the master when our dataset was synced
+        self.master_offset = 0
+
+        self.state = STATE_CONNECT
+        # Loop time of last data received from master, None if nothing received yet
+        self.last_io = None
+        # Number of reconnect attempts since the link was last up
+        self.attempts = 0
+
+        self.handler.connection_registry.master_link = self
 
     async def connect_to_master(self):
         """
@@ -33,33 +65,64 @@ class Replica:
         except Exception as e:
             raise RedisException(f"Connection failed: {e}") from e
 
-    async def process_command(self, data):
+        self.decoder = RedisStreamDecoder()
+
+    async def read_from_master(self):
         """
-        Process a command received from the master.
+        Read the next chunk of data sent by the master into the decoder.
 
-        Args:
-            command (str): The command received from the master.
+        Raises:
+            RedisException: If master closed the connection
+        """
+        data = await self.reader.read(READ_SIZE)
 
-        Returns:
-            str: The response to the command.
+        if not data:
+            logger.warning("Connection closed by master")
+            raise RedisException("Connection closed by master")
 
-        Raises:
-            RedisException: If the command is invalid or fails to process.
+        self.last_io = asyncio.get_running_loop().time()
+        self.decoder.feed(data)
+
+    async def read_response(self):
+        """
+        Wait till one complete value is sent by the master, and return it
         """
+        while True:
+            item = self.decoder.get_value()
+            if item is not None:
+                return item[0]
 
-        try:
-            decoded_data = data.decode("utf-8")
-        except UnicodeDecodeError:
-            commands = self.complex_decode(data)
-            if commands:
-                return await self.process_command(commands)
-            logger.warning("Unable to decode data: %s", data)
-            return
+            await self.read_from_master()
 
-        # Process the command
-        response = await self.handler.handle(decoded_data, propogated_command=True, writer=self.writer)
+    async def read_rdb(self):
+        """
+        Wait till the complete RDB payload is sent by the master, and return it
+        """
+        while True:
+            item = self.decoder.get_file()
+            if item is not None:
+                return item[0]
+
+            await self.read_from_master()
+
+    async def process_commands(self, commands, raw_data):
+        """
+        Apply a batch of commands received from the master,
+        and proxy them as they are to our own replicas (sub-replicas).
+
+        Args:
+            commands (list): Each element is tuple of decoded command with its length in bytes
+            raw_data (bytes): The commands as received on the wire
+        """
+
+        response = await self.handler.handle_propagated(commands)
 
-        # Send response back if needed
+        # Forwarding the exact bytes keeps sub-replica offsets same as ours and master's
+        registry = self.handler.connection_registry
+        await registry.propagate(raw_data)
+        registry.replication_offset = self.handler.bytes_processed
+
+        # Send response back if needed (only for REPLCONF GETACK)
         if response:
             if isinstance(response, str):
                 response = response.encode("utf-8")
@@ -74,6 +137,9 @@ class Replica:
         """
         Continuously listen for commands sent by the master and
         process them using RedisCommandHandler.
+
+        Commands are applied in batches: everything which is fully received
+        is applied together, partial commands wait for the next read.
         """
 
         if not self.reader or not self.writer:
@@ -81,37 +147,48 @@ class Replica:
 
         logger.info("Starting to listen for commands from master")
 
-        while True:
-            data = await self.reader.read(1024)
+        ack_task = asyncio.create_task(self.send_acks())
+
+        try:
+            while True:
+                # Commands might already be buffered along with the RDB payload
+                commands, raw_data = self.decoder.get_stream()
+                if commands:
+                    await self.process_commands(commands, raw_data)
+
+                await self.read_from_master()
+        finally:
+            ack_task.cancel()
+
+    async def send_acks(self):
+        """
+        Periodically send REPLCONF ACK <offset> to the master,
+        so that WAIT on master resolves without GETACK round trip.
+        """
 
-            if not data:
-                logger.warning("Connection closed by master")
-                raise RedisException("Connection closed by master")
+        while True:
+            await asyncio.sleep(ACK_INTERVAL)
 
-            await self.process_command(data)
+            self.writer.write(self.encoder.encode_array(
+                ["REPLCONF", "ACK", str(self.handler.bytes_processed)]
+            ).encode("utf-8"))
+            await self.writer.drain()
 
     async def send_to_master(self, message):
         """
-        Send data to a TCP socket.
+        Send data to a TCP socket, and return the reply of master.
 
         Args:
             message (str/bytes): Data to be sent
         """
 
-        self.writer.write(message.encode('utf-8'))
-        await self.writer.drain()
+        if isinstance(message, str):
+            message = message.encode('utf-8')
 
-        response = await self.reader.read(1024)
-        if not response:
-            raise RedisException("No response received from master")
+        self.writer.write(message)
+        await self.writer.drain()
 
-        try:
-            return response.decode('utf-8')
-        except UnicodeDecodeError:
-            commands = self.complex_decode(response)
-            if commands:
-                await self.process_command(commands)
-            return response
+        return await self.read_response()
 
     async def handshake(self):
         """
@@ -124,14 +201,77 @@ class Replica:
             The replica sends PSYNC to the master
         """
 
+        self.state = STATE_CONNECT
         await self.connect_to_master()
+
+        self.state = STATE_HANDSHAKE
         await self.ping()
         await self.replconf()
+
+        self.state = STATE_SYNC
         await self.psync()
 
+    async def run(self):
+        """
+        Keep replicating from master for as long as the server runs.
+
+        Replication goes through connect -> handshake -> sync -> streaming.
+        Whenever the link fails, we reconnect with jittered exponential backoff,
+        and try to continue from our replication ID and offset (partial resync).
+        """
+
+        while True:
+            try:
+                await self.handshake()
+
+                self.state = STATE_STREAMING
+                self.attempts = 0
+                await self.listen_for_commands()
+            except (RedisException, OSError, ValueError) as exc:
+                logger.warning("Replication link with master lost during %s: %s", self.state, exc)
+            finally:
+                self.close()
+
+            await asyncio.sleep(self.get_reconnect_delay())
+            self.attempts += 1
+
+    def get_reconnect_delay(self):
+        delay = min(RECONNECT_MAX_DELAY, RECONNECT_MIN_DELAY * 2 ** self.attempts)
+        # Jitter, so that many replicas do not reconnect to a restarted master at once
+        return random.uniform(delay / 2, delay)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = None
+        self.writer = None
+
+    def is_link_up(self):
+        return self.state == STATE_STREAMING and self.writer is not None
+
+    def get_info(self) -> dict:
+        """
+        Replication link details for INFO replication
+        """
+
+        if self.last_io is None:
+            last_io_seconds = -1
+        else:
+            last_io_seconds = int(asyncio.get_event_loop().time() - self.last_io)
+
+        return {
+            "master_host": self.master_host,
+            "master_port": self.master_port,
+            "master_link_status": "up" if self.is_link_up() else "down",
+            "master_last_io_seconds_ago": last_io_seconds,
+            "master_sync_in_progress": int(self.state == STATE_SYNC),
+            "slave_repl_offset": self.handler.bytes_processed,
+            "master_replid": self.master_replid or "",
+        }
+
     async def ping(self):
         response = await self.send_to_master(self.encoder.encode_array(["PING"]))
-        if self.decoder.decode(response) != "PONG":
+        if response != "PONG":
             logger.warning("Failed to receive PONG")
 
     async def replconf(self):
@@ -145,14 +285,14 @@ class Replica:
         resp = await self.send_to_master(
             self.encoder.encode_array(["REPLCONF", "listening-port", str(self.port)])
         )
-        if self.decoder.decode(resp)!= "OK":
+        if resp != "OK":
             logger.warning("Failed to set listening port")
 
         # Send capabilities
         resp = await self.send_to_master(
             self.encoder.encode_array(["REPLCONF", "capa", "psync2"])
         )
-        if self.decoder.decode(resp)!= "OK":
+        if resp != "OK":
             logger.warning("Failed to set replication capabilities")
 
     async def psync(self):
@@ -163,25 +303,71 @@ class Replica:
         The replica will send this command to the master with two arguments:
 
         The first argument is the replication ID of the master
-            Since this is the first time the replica is connecting to the master,
+            If this is the first time the replica is connecting to the master,
             the replication ID will be ? (a question mark)
 
         The second argument is the offset of the master
-            Since this is the first time the replica is connecting to the master, the offset will be -1
+            Offset of the next byte we need, -1 for the first connection
+
+        Master replies either with CONTINUE, and streams what we missed from its backlog,
+        or with FULLRESYNC <replid> <offset>, followed by the RDB payload.
         """
-        await self.send_to_master(self.encoder.encode_array(["PSYNC", "?", "-1"]))
+        if self.master_replid:
+            request = ["PSYNC", self.master_replid, str(self.handler.bytes_processed + 1)]
+        else:
+            request = ["PSYNC", "?", "-1"]
+
+        response = await self.send_to_master(self.encoder.encode_array(request))
+
+        if isinstance(response, str) and response.startswith("CONTINUE"):
+            logger.info("Partial resync with master from offset %s", self.handler.bytes_processed)
+
+            # Master might have changed its replication ID, for example after a failover
+            parts = response.split()
+            if len(parts) > 1:
+                self.master_replid = parts[1]
+                self.handler.connection_registry.replication_id = parts[1]
+            return
+
+        if not isinstance(response, str) or not response.startswith("FULLRESYNC"):
+            raise RedisException(f"Unexpected PSYNC response: {response}")
 
-    def complex_decode(self, response):
+        _, self.master_replid, master_offset = response.split()
+        self.master_offset = int(master_offset)
+
+        rdb_payload = await self.read_rdb()
+        self.load_rdb(rdb_payload)
+
+        # Offset continues from the master offset at which the RDB was taken,
+        # ACKs carry the same absolute offset master tracks
+        self.handler.bytes_processed = self.master_offset
+
+        # Sub-replicas sync against the replication stream of our master.
+        # Our dataset was replaced, so they have to sync again as well, and get
+        # a snapshot of it (not of the old one) along with our new offset.
+        registry = self.handler.connection_registry
+        registry.reset_replication(self.master_replid, self.master_offset)
+        await registry.disconnect_replicas()
+
+    def load_rdb(self, payload: bytes):
         """
-        If the command has RDB file, we need to decode it
+        Replace the dataset with the snapshot sent by the master
+
+        Raises:
+            RedisException: Snapshot could not be parsed or loaded, the link is dropped and synced again
         """
 
-        # Find Command till the RDB
-        rdb_position = response.find(b"REDIS0011")
-        rdb_end_position = response.find(b"\xff") + 8 + 1
+        try:
+            rdb = RDBParser(data=payload)
+        except (ValueError, IndexError) as exc:
+            logger.error("Unable to parse RDB sent by master: %s", exc)
+            raise RedisException(f"Unable to parse RDB sent by master: {exc}") from exc
 
-        response[:rdb_position].decode('utf-8')
-        response[rdb_position: rdb_end_position]    # RDB
-        other_commands = response[rdb_end_position:]
+        try:
+            load_databases(rdb.databases)
+        except ValueError as exc:
+            logger.error("Unable to load RDB sent by master: %s", exc)
+            raise RedisException(f"Unable to load RDB sent by master: {exc}") from exc
 
-        return other_commands
+        # Master selects the database again before its next write
+        self.handler.db_index = 0
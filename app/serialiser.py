@@ -1,4 +1,7 @@
+from app.exceptions import RedisException
+
 TERMINATOR = "\r\n"
+BYTES_TERMINATOR = b"\r\n"
 
 
 class RedisType:
@@ -127,6 +130,216 @@ class RedisDecoder:
         return None, []
 
 
+BULK_STRING_BYTE = ord(RedisType.BULK_STRING)
+
+
+class IncompleteData(Exception):
+    """
+    Raised internally when the buffer does not yet hold a complete value
+    """
+
+
+class RedisStreamDecoder:
+    """
+    Incremental, bytes-level RESP decoder.
+
+    Data is fed as it arrives from the socket. Complete values are returned along
+    with the exact number of bytes they took on the wire, partial values stay
+    buffered until the rest of them arrives.
+    """
+
+    # Compact the buffer once this many bytes have been consumed from its head
+    COMPACT_THRESHOLD = 64 * 1024
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.pos = 0
+
+    def feed(self, data: bytes):
+        self.buffer += data
+
+    def pending(self) -> int:
+        """
+        Number of buffered bytes which are not consumed yet
+        """
+        return len(self.buffer) - self.pos
+
+    def get_value(self):
+        """
+        Decode the next complete value from the buffer.
+
+        Returns:
+            tuple: (value, length in bytes) or None if the buffer has no complete value
+        """
+        if self.pos >= len(self.buffer):
+            return None
+
+        try:
+            value, end = self._decode(self.pos)
+        except IncompleteData:
+            return None
+
+        return value, self._consume(end)
+
+    def get_values(self) -> list:
+        """
+        Decode all complete values from the buffer.
+
+        Returns:
+            list: Each element is tuple of value with its length in bytes
+        """
+        values, end = self._decode_available()
+        self._consume(end)
+        return values
+
+    def get_stream(self):
+        """
+        Decode all complete values from the buffer, and also return the raw bytes
+        they were decoded from, so that the stream can be proxied as it is.
+
+        Returns:
+            list: Each element is tuple of value with its length in bytes
+            bytes: Raw data of all the decoded values
+        """
+        values, end = self._decode_available()
+        raw = bytes(self.buffer[self.pos:end])
+        self._consume(end)
+        return values, raw
+
+    def _decode_available(self):
+        values = []
+        end = self.pos
+
+        while end < len(self.buffer):
+            try:
+                value, value_end = self._decode(end)
+            except IncompleteData:
+                break
+
+            values.append((value, value_end - end))
+            end = value_end
+
+        return values, end
+
+    def get_file(self):
+        """
+        Decode a file transfer (RDB payload): it looks like a bulk string
+        but has no terminator after the data.
+
+        Returns:
+            tuple: (payload bytes, length in bytes) or None if the payload is incomplete
+        """
+        line_end = self.buffer.find(BYTES_TERMINATOR, self.pos)
+        if line_end == -1:
+            return None
+
+        if self.buffer[self.pos] != ord(RedisType.BULK_STRING):
+            raise RedisException("Expected file transfer from master")
+
+        length = int(self.buffer[self.pos + 1:line_end])
+        start = line_end + 2
+        end = start + length
+        if end > len(self.buffer):
+            return None
+
+        payload = bytes(self.buffer[start:end])
+        return payload, self._consume(end)
+
+    def _consume(self, end: int) -> int:
+        length = end - self.pos
+        self.pos = end
+
+        if self.pos >= self.COMPACT_THRESHOLD or self.pos == len(self.buffer):
+            del self.buffer[:self.pos]
+            self.pos = 0
+
+        return length
+
+    def _read_line(self, pos: int):
+        line_end = self.buffer.find(BYTES_TERMINATOR, pos)
+        if line_end == -1:
+            raise IncompleteData()
+        return self.buffer[pos:line_end], line_end + 2
+
+    def _decode_array(self, count: int, pos: int):
+        """
+        Decode array elements. Commands are arrays of bulk strings,
+        so bulk strings are decoded inline here, which is the hot path.
+        """
+        buffer = self.buffer
+        val = []
+
+        for _ in range(count):
+            if pos < len(buffer) and buffer[pos] == BULK_STRING_BYTE:
+                line_end = buffer.find(BYTES_TERMINATOR, pos + 1)
+                if line_end == -1:
+                    raise IncompleteData()
+
+                length = int(buffer[pos + 1:line_end])
+                start = line_end + 2
+                if length == -1:
+                    val.append(None)
+                    pos = start
+                    continue
+
+                data_end = start + length
+                if data_end + 2 > len(buffer):
+                    raise IncompleteData()
+
+                val.append(buffer[start:data_end].decode("utf-8", "surrogateescape"))
+                pos = data_end + 2
+            else:
+                item, pos = self._decode(pos)
+                val.append(item)
+
+        return val, pos
+
+    def _decode(self, pos: int):
+        """
+        Decode the value which starts at pos.
+
+        Returns:
+            Any: The decoded Python object.
+            int: Position right after the value.
+        """
+        if pos >= len(self.buffer):
+            raise IncompleteData()
+
+        resp_type = chr(self.buffer[pos])
+        line, end = self._read_line(pos + 1)
+
+        if resp_type == RedisType.BULK_STRING:
+            length = int(line)
+            if length == -1:
+                return None, end
+            data_end = end + length
+            if data_end + 2 > len(self.buffer):
+                raise IncompleteData()
+            return self.buffer[end:data_end].decode("utf-8", "surrogateescape"), data_end + 2
+
+        if resp_type == RedisType.ARRAY:
+            count = int(line)
+            if count == -1:
+                return None, end
+            return self._decode_array(count, end)
+
+        if resp_type == RedisType.SIMPLE_STRING:
+            return line.decode("utf-8", "surrogateescape"), end
+
+        if resp_type == RedisType.INTEGER:
+            return int(line), end
+
+        if resp_type == RedisType.ERROR:
+            error_code, _, message = line.decode("utf-8", "surrogateescape").partition(" ")
+            error = RedisException(message)
+            error.error_code = error_code
+            return error, end
+
+        # Inline command, for example "PING\r\n" typed into telnet
+        line, end = self._read_line(pos)
+        return line.decode("utf-8", "surrogateescape").split(), end
+
+
 class RedisEncoder:
 
     def encode_simple_string(self, data):
@@ -135,7 +348,9 @@ class RedisEncoder:
     def encode_bulk_string(self, data):
         if data is None:
             return f"{RedisType.BULK_STRING}-1{TERMINATOR}"           # Null bulk string
-        return f"{RedisType.BULK_STRING}{len(data)}{TERMINATOR}{data}{TERMINATOR}"
+        # Length is in bytes, which differs from length of str for non ASCII data
+        length = len(data) if data.isascii() else len(data.encode("utf-8", "surrogateescape"))
+        return f"{RedisType.BULK_STRING}{length}{TERMINATOR}{data}{TERMINATOR}"
 
     def encode_array(self, data):
         """
@@ -152,6 +367,9 @@ class RedisEncoder:
                 ret.append(self.encode_integer(item))
             elif isinstance(item, Exception):
                 ret.append(self.encode_error(item))
+            elif isinstance(item, bytes):
+                # Already encoded reply, for example relayed from another shard
+                ret.append(item.decode("utf-8", "surrogateescape"))
 
         return "".join(ret)
 
@@ -172,6 +390,7 @@ class RedisEncoder:
     def encode_error(self, error, error_code=None):
         """
         Encode error
+        Error code is taken from the exception if it has one, otherwise ERR
         """
-        error_code = error_code or "ERR"
+        error_code = error_code or getattr(error, "error_code", "ERR")
         return f"{RedisType.ERROR}{error_code} {error}{TERMINATOR}"
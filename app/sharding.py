@@ -0,0 +1,118 @@
+import asyncio
+import os
+import tempfile
+
+from app.client import RedisClient
+from app.exceptions import CrossSlotException
+from app.slots import SLOT_COUNT, get_command_keys, key_hash_slot
+
+# Router of this worker process, only set when running with --shards
+_router = None
+
+
+def get_router():
+    return _router
+
+
+def set_router(router):
+    global _router
+    _router = router
+
+
+def shard_socket_path(port, shard_id: int) -> str:
+    """
+    Unix socket on which a shard accepts commands forwarded by the other shards
+    """
+    return os.path.join(tempfile.gettempdir(), f"redis-python-{port}-shard{shard_id}.sock")
+
+
+class ShardRouter:
+    """
+    In sharded mode, N worker processes listen on the same port (SO_REUSEPORT),
+    and the kernel spreads client connections over them. Each worker owns a
+    contiguous range of the hash slots, with its own Database.
+
+    A command for keys owned by another worker is forwarded to that worker over
+    a unix socket, and its reply is relayed to the client as it is.
+    Client can not be redirected with MOVED instead, since all workers share
+    the same address.
+    """
+
+    def __init__(self, shard_id: int, shards: int, port):
+        self.shard_id = shard_id
+        self.shards = shards
+        self.port = port
+
+        # One pipelined connection per other shard, shared by all our clients
+        self.clients = {}
+
+    @property
+    def socket_path(self):
+        return shard_socket_path(self.port, self.shard_id)
+
+    def get_slot_range(self, shard_id: int):
+        """
+        Slots owned by a shard, as (first, last) inclusive
+        """
+        first = -(-shard_id * SLOT_COUNT // self.shards)
+        last = -(-(shard_id + 1) * SLOT_COUNT // self.shards) - 1
+        return first, last
+
+    def get_shard(self, slot: int) -> int:
+        return slot * self.shards // SLOT_COUNT
+
+    def owns_key(self, key: str) -> bool:
+        return self.get_shard(key_hash_slot(key)) == self.shard_id
+
+    def get_owner(self, command: str, args: list):
+        """
+        Return the shard which owns the keys of the command,
+        None if we own them (or the command has no keys).
+
+        Raises:
+            CrossSlotException: Keys belong to different shards
+        """
+
+        keys = get_command_keys(command, args)
+        if not keys:
+            return None
+
+        shards = {self.get_shard(key_hash_slot(key)) for key in keys}
+        if len(shards) > 1:
+            raise CrossSlotException("Keys in request don't hash to the same slot")
+
+        shard = shards.pop()
+        return None if shard == self.shard_id else shard
+
+    def get_client(self, shard_id: int) -> RedisClient:
+        client = self.clients.get(shard_id)
+        if client is None:
+            client = RedisClient(path=shard_socket_path(self.port, shard_id))
+            self.clients[shard_id] = client
+        return client
+
+    async def forward(self, shard_id: int, command: str, args: list) -> bytes:
+        """
+        Execute the command on its owner shard, and return the encoded reply
+        """
+
+        # Owner executes commands of a connection one after another, a blocking
+        # command would hold up everything else we forward, so it gets its own connection
+        if command == "xread" and any(arg.lower() == "block" for arg in args):
+            client = RedisClient(path=shard_socket_path(self.port, shard_id))
+            try:
+                return await client.execute_raw([command, *args])
+            finally:
+                client.close()
+
+        return await self.get_client(shard_id).execute_raw([command, *args])
+
+    async def broadcast(self, command: str, args: list) -> list:
+        """
+        Execute a keyless command (for example KEYS) on all other shards,
+        and return their decoded replies
+        """
+        others = [shard_id for shard_id in range(self.shards) if shard_id != self.shard_id]
+        return await asyncio.gather(
+            *(self.get_client(shard_id).execute(command, *args) for shard_id in others)
+        )
@@ -0,0 +1,93 @@
+"""
+Hash slots, same as Redis Cluster.
+
+The keyspace is split in 16384 slots. Slot of a key is CRC16 of the key modulo 16384.
+If the key has a non empty {hashtag}, only the hashtag is hashed, so that related
+keys (for example {user1}.name and {user1}.email) always land in the same slot.
+"""
+
+SLOT_COUNT = 16384
+
+
+def _make_crc16_table():
+    # CRC16-CCITT (XMODEM), polynomial 0x1021, as used by Redis Cluster
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ 0x1021) & 0xFFFF
+            else:
+                crc = (crc << 1) & 0xFFFF
+        table.append(crc)
+    return table
+
+
+CRC16_TABLE = _make_crc16_table()
+
+
+def crc16(data: bytes) -> int:
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ CRC16_TABLE[((crc >> 8) ^ byte) & 0xFF]
+    return crc
+
+
+def key_hash_slot(key: str) -> int:
+    """
+    Return the hash slot of a key, honouring {hashtag}
+    """
+
+    start = key.find("{")
+    if start != -1:
+        end = key.find("}", start + 1)
+        # Empty hashtag {} means the whole key is hashed
+        if end != -1 and end != start + 1:
+            key = key[start + 1:end]
+
+    return crc16(key.encode("utf-8", "surrogateescape")) % SLOT_COUNT
+
+
+# Position of keys in the arguments of a command (after the command name),
+# as (first key, last key, step). Last key of -1 means till the end.
+KEY_SPECS = {
+    "set": (0, 0, 1),
+    "get": (0, 0, 1),
+    "incr": (0, 0, 1),
+    "type": (0, 0, 1),
+    "xadd": (0, 0, 1),
+    "xrange": (0, 0, 1),
+    "del": (0, -1, 1),
+    "unlink": (0, -1, 1),
+    "dump": (0, 0, 1),
+    "restore": (0, 0, 1),
+    "restore-asking": (0, 0, 1),
+}
+
+
+def get_command_keys(command: str, args: list) -> list:
+    """
+    Return the keys a command operates on, empty list for commands without keys
+    """
+
+    if command == "xread":
+        # XREAD [COUNT count] [BLOCK ms] STREAMS key [key ...] id [id ...]
+        for idx, arg in enumerate(args):
+            if arg.lower() == "streams":
+                stream_args = args[idx + 1:]
+                return stream_args[:len(stream_args) // 2]
+        return []
+
+    if command == "memory":
+        # MEMORY USAGE key, other subcommands have no keys
+        return args[1:2] if args and args[0].lower() == "usage" else []
+
+    spec = KEY_SPECS.get(command)
+    if spec is None or not args:
+        return []
+
+    first, last, step = spec
+    if last < 0:
+        last = len(args) + last
+
+    return args[first:last + 1:step]
@@ -0,0 +1,86 @@
+"""
+Slow log, same as Redis SLOWLOG.
+
+Commands which took longer than slowlog-log-slower-than microseconds to execute
+are kept in a ring buffer of the last slowlog-max-len of them, along with their
+arguments and the client which sent them. Negative threshold disables the log,
+0 logs every command.
+"""
+
+from collections import deque
+import time
+
+from app.config import get_int_config
+
+# Config keys which are read into SlowLog
+SLOWLOG_CONFIG = {"slowlog-log-slower-than", "slowlog-max-len"}
+
+# Arguments (and characters of an argument) kept per entry, like Redis
+MAX_ARGC = 32
+MAX_ARG_LENGTH = 128
+
+
+def trim_args(args: list) -> list:
+    """
+    Keep entries small, big commands (MSET of thousands of keys) are trimmed
+    """
+
+    trimmed = []
+    for arg in args[:MAX_ARGC]:
+        if len(arg) > MAX_ARG_LENGTH:
+            arg = f"{arg[:MAX_ARG_LENGTH]}... ({len(arg) - MAX_ARG_LENGTH} more bytes)"
+        trimmed.append(arg)
+
+    if len(args) > MAX_ARGC:
+        trimmed[-1] = f"... ({len(args) - MAX_ARGC + 1} more arguments)"
+
+    return trimmed
+
+
+class SlowLog:
+
+    def __init__(self):
+        self.entries = deque()
+        # Every entry gets the next ID, also across resets
+        self.next_id = 0
+        self.reload()
+
+    def reload(self):
+        """
+        Read the config again, it is kept rather than read for every command
+        """
+        self.log_slower_than = get_int_config("slowlog-log-slower-than")
+        self.entries = deque(self.entries, maxlen=max(0, get_int_config("slowlog-max-len")))
+
+    def is_slow(self, duration_us: int) -> bool:
+        return 0 <= self.log_slower_than <= duration_us
+
+    def add(self, args: list, duration_us: int, client_address: str = "", client_name: str = ""):
+        self.entries.appendleft([
+            self.next_id, int(time.time()), duration_us, trim_args(args), client_address, client_name,
+        ])
+        self.next_id += 1
+
+    def get(self, count: int = 10) -> list:
+        """
+        Return the latest count entries (all of them for a negative count), newest first
+        """
+        if count < 0:
+            return list(self.entries)
+        return list(self.entries)[:count]
+
+    def reset(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+_slowlog = None
+
+
+def get_slowlog() -> SlowLog:
+    global _slowlog
+    if _slowlog is None:
+        _slowlog = SlowLog()
+    return _slowlog
@@ -0,0 +1,211 @@
+"""
+Server statistics for INFO, kept as plain counters.
+
+Counters are bumped on the hot path (every command, every read and write of
+a connection), so they are nothing more than attribute increments. Everything
+derived from them (rates, averages) is worked out when INFO asks for it.
+
+Instantaneous rates are sampled like Redis does in its cron, every
+STATS_SAMPLE_INTERVAL seconds, and averaged over the last STATS_SAMPLES samples.
+
+With latency-tracking, every command also keeps a histogram of its latencies,
+for LATENCY HISTOGRAM and the percentiles of INFO latencystats.
+"""
+
+import asyncio
+from collections import deque
+import resource
+import time
+
+from app.config import get_bool_config, get_config
+from app.histogram import LatencyHistogram
+from app.utils import gen_random_string
+
+# Config keys which are read into ServerStats
+STATS_CONFIG = {"latency-tracking", "latency-tracking-info-percentiles"}
+
+# Seconds between samples of instantaneous rates, and samples averaged
+STATS_SAMPLE_INTERVAL = 0.1
+STATS_SAMPLES = 16
+
+# Identifies this run of the server, changes on every restart
+RUN_ID = gen_random_string(40)
+
+
+class CommandStats:
+    """
+    Calls of one command, cmdstat_<command> of INFO commandstats
+    """
+
+    __slots__ = ("calls", "usec", "failed_calls", "rejected_calls", "histogram")
+
+    def __init__(self):
+        self.calls = 0
+        self.usec = 0
+        # Executed, and replied with an error
+        self.failed_calls = 0
+        # Not executed at all, for example OOM or MOVED
+        self.rejected_calls = 0
+        # Latencies in microseconds, created on the first one with latency-tracking
+        self.histogram = None
+
+    def format(self) -> str:
+        usec_per_call = self.usec / self.calls if self.calls else 0
+        return (
+            f"calls={self.calls},usec={self.usec},usec_per_call={usec_per_call:.2f},"
+            f"rejected_calls={self.rejected_calls},failed_calls={self.failed_calls}"
+        )
+
+
+class InstantaneousMetric:
+    """
+    Rate of a counter per second, averaged over the last samples
+    """
+
+    def __init__(self):
+        self.samples = deque(maxlen=STATS_SAMPLES)
+        self.last_time = None
+        self.last_value = 0
+
+    def sample(self, now: float, value: int):
+        if self.last_time is not None and now > self.last_time:
+            self.samples.append((value - self.last_value) / (now - self.last_time))
+        self.last_time = now
+        self.last_value = value
+
+    def get(self) -> float:
+        if not self.samples:
+            return 0
+        return sum(self.samples) / len(self.samples)
+
+
+class ServerStats:
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.reload()
+        self.reset()
+
+    def reload(self):
+        """
+        Read the config again, it is kept rather than read for every command
+        """
+        self.latency_tracking = get_bool_config("latency-tracking")
+
+    def reset(self):
+        """
+        CONFIG RESETSTAT, uptime is kept
+        """
+        self.total_connections_received = 0
+        # Refused, over maxclients
+        self.rejected_connections = 0
+        # Closed, over client-output-buffer-limit
+        self.client_output_buffer_limit_disconnections = 0
+        self.total_commands_processed = 0
+        self.total_net_input_bytes = 0
+        self.total_net_output_bytes = 0
+        self.total_error_replies = 0
+        self.keyspace_hits = 0
+        self.keyspace_misses = 0
+        self.expired_keys = 0
+        self.evicted_keys = 0
+        self.commands = {}
+
+        # How much later than scheduled the event loop got to run a timer, in microseconds
+        self.eventloop_lag = LatencyHistogram()
+        self.eventloop_lag_last = 0
+
+        self.ops_per_sec = InstantaneousMetric()
+        self.input_bytes_per_sec = InstantaneousMetric()
+        self.output_bytes_per_sec = InstantaneousMetric()
+
+    def record_call(self, command: str, usec: int, failed: bool):
+        """
+        Command was executed, in usec microseconds
+        """
+        stats = self.commands.get(command)
+        if stats is None:
+            stats = self.commands[command] = CommandStats()
+
+        stats.calls += 1
+        stats.usec += usec
+        self.total_commands_processed += 1
+
+        if self.latency_tracking:
+            if stats.histogram is None:
+                stats.histogram = LatencyHistogram()
+            stats.histogram.record(usec)
+        if failed:
+            stats.failed_calls += 1
+            self.total_error_replies += 1
+
+    def record_rejected(self, command: str):
+        """
+        Command was refused before it was executed
+        """
+        stats = self.commands.get(command)
+        if stats is None:
+            stats = self.commands[command] = CommandStats()
+
+        stats.rejected_calls += 1
+        self.total_error_replies += 1
+
+    def record_loop_lag(self, usec: int):
+        self.eventloop_lag.record(usec)
+        self.eventloop_lag_last = usec
+
+    def sample(self, now: float = None):
+        """
+        Take a sample of the instantaneous rates
+        """
+        if now is None:
+            now = time.monotonic()
+
+        self.ops_per_sec.sample(now, self.total_commands_processed)
+        self.input_bytes_per_sec.sample(now, self.total_net_input_bytes)
+        self.output_bytes_per_sec.sample(now, self.total_net_output_bytes)
+
+    def get_uptime(self) -> int:
+        return int(time.time() - self.start_time)
+
+
+def get_info_percentiles() -> list:
+    """
+    Percentiles INFO latencystats shows, from latency-tracking-info-percentiles
+
+    Raises:
+        ValueError: Not a list of numbers from 0 to 100
+    """
+    percentiles = [float(value) for value in get_config("latency-tracking-info-percentiles").split()]
+    if any(not 0 <= percentile <= 100 for percentile in percentiles):
+        raise ValueError("percentiles must be between 0 and 100")
+    return percentiles
+
+
+def get_cpu_usage():
+    """
+    CPU seconds used by the process, as (system, user)
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_stime, usage.ru_utime
+
+
+_stats = None
+
+
+def get_stats() -> ServerStats:
+    global _stats
+    if _stats is None:
+        _stats = ServerStats()
+    return _stats
+
+
+async def sample_stats(interval: float = STATS_SAMPLE_INTERVAL):
+    """
+    Sample the instantaneous rates every interval, for as long as the server runs
+    """
+
+    stats = get_stats()
+    while True:
+        stats.sample()
+        await asyncio.sleep(interval)
@@ -0,0 +1,31 @@
+"""
+Fakes and helpers shared by the tests
+"""
+
+import time
+
+from app.lazyfree import pending_objects
+
+
+class FakeWriter:
+    """
+    Connection of a replica, everything written to it is kept in data
+    """
+
+    def __init__(self):
+        self.data = b""
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+
+def wait_for_lazyfree():
+    """
+    Wait, 5 seconds at most, till the lazyfree thread freed everything it was given
+    """
+    deadline = time.monotonic() + 5
+    while pending_objects() and time.monotonic() < deadline:
+        time.sleep(0.01)
@@ -0,0 +1,111 @@
+import asyncio
+import json
+
+import pytest
+import pytest_asyncio
+
+from app.database import get_database
+from app.protocol import RedisProtocol
+from app.rdb.parser import RDBParser
+from benchmarks.compare import compare
+from benchmarks.datasets import build_rdb, make_key
+from benchmarks.footprint import DEFAULT_THRESHOLDS, check_thresholds, run
+from benchmarks.load import LoadGenerator, parse_mix
+from benchmarks.results import get_percentiles, measure
+
+
+class TestBenchmarkHelpers:
+
+    def test_build_rdb(self):
+        rdb = RDBParser(data=build_rdb(100, value_size=100, expiring=0.25, databases=2))
+
+        assert sorted(rdb.databases) == [0, 1]
+        data = rdb.databases[1]
+        assert len(data) == 100
+        assert data[make_key(99)]["value"] == "v" * 100
+        assert sum(1 for entry in data.values() if entry["expires_at"] is not None) == 25
+
+    def test_measure(self):
+        result = measure("noop", lambda: None, 100, repeat=2, extra=1)
+        assert result["name"] == "noop"
+        assert result["ns_per_op"] <= result["median_ns_per_op"]
+        assert result["extra"] == 1
+
+    def test_percentiles(self):
+        assert get_percentiles([]) == {}
+        percentiles = get_percentiles(list(range(1000, 0, -1)))
+        assert percentiles == {"p50": 500, "p95": 950, "p99": 990, "p99.9": 999, "max": 1000}
+
+    def test_parse_mix(self):
+        assert parse_mix("set=1,get=9") == {"set": 1, "get": 9}
+        assert parse_mix("ping") == {"ping": 1}
+        with pytest.raises(ValueError):
+            parse_mix("hset=1")
+
+    def test_compare(self):
+        before = {"results": [
+            {"name": "database.get", "ns_per_op": 100},
+            {"name": "load.all", "ops_per_sec": 1000, "latency_ms": {"p99": 1.0}},
+        ]}
+        after = {"results": [
+            {"name": "database.get", "ns_per_op": 105},
+            {"name": "load.all", "ops_per_sec": 800, "latency_ms": {"p99": 1.0}},
+        ]}
+
+        lines, regressed = compare(before, after, threshold=10)
+        assert regressed
+        assert [line.endswith(" !") for line in lines[1:]] == [False, True, False]
+
+        _, regressed = compare(before, after, threshold=25)
+        assert not regressed
+
+    def test_footprint(self):
+        results = run(keys=2000, value_size=16, streams=4, entries=500)
+
+        assert [result["name"] for result in results] == ["string", "string_ttl", "stream"]
+        assert results[2]["count"] == 2000
+        assert all(result.get("overhead_per_key", result.get("overhead_per_entry")) > 0 for result in results)
+        # Keys with an expiry take more
+        assert results[1]["bytes_per_key"] > results[0]["bytes_per_key"]
+
+        with open(DEFAULT_THRESHOLDS, encoding="utf-8") as fd:
+            assert check_thresholds(results, json.load(fd)) == []
+
+    def test_footprint_thresholds(self):
+        results = [{"name": "string", "overhead_per_key": 500, "bytes_per_key": 532}]
+        assert check_thresholds(results, {"string": {"overhead_per_key": 450}}) == [
+            "string overhead_per_key is 500, threshold is 450"
+        ]
+        assert check_thresholds(results, {"string": {"overhead_per_key": 500}, "stream": {"x": 1}}) == []
+
+
+@pytest.mark.asyncio
+class TestLoadGenerator:
+
+    @pytest_asyncio.fixture(autouse=True)
+    async def server(self):
+        server = await asyncio.get_running_loop().create_server(RedisProtocol, "127.0.0.1", 0)
+        self.port = server.sockets[0].getsockname()[1]
+
+        yield
+
+        server.close()
+        await server.wait_closed()
+        get_database().clear()
+
+    async def test_run(self):
+        generator = LoadGenerator(
+            "127.0.0.1", self.port, clients=3, requests=200, pipeline=4, keyspace=50, data_size=8,
+            mix={"set": 1, "get": 1},
+        )
+        await generator.populate()
+        assert len(get_database()) == 50
+
+        elapsed = await generator.run()
+        results = generator.get_results(elapsed)
+
+        assert results[0]["name"] == "load.all"
+        assert results[0]["requests"] == 200
+        assert results[0]["errors"] == 0
+        assert sum(result["requests"] for result in results[1:]) == 200
+        assert results[0]["latency_ms"]["p50"] <= results[0]["latency_ms"]["max"]
@@ -0,0 +1,218 @@
+import asyncio
+import os
+import time
+
+import pytest
+import pytest_asyncio
+
+from app.clients import (
+    CLIENT_CONFIG, DEFAULT_OUTPUT_BUFFER_LIMITS, NORMAL, REPLICA, close_idle_clients,
+    is_over_output_buffer_limit, parse_output_buffer_limits, reload_client_settings
+)
+from app.config import set_config
+from app.connection_registry import ConnectionRegistry
+from app.protocol import RedisProtocol
+from app.serialiser import RedisEncoder
+from app.stats import get_stats
+
+encoder = RedisEncoder()
+
+
+class FakeTransport:
+
+    def __init__(self, port):
+        self.data = b""
+        self.closed = False
+        self.aborted = False
+        self.buffer_size = 0
+        # Peer does not read, everything written stays in the buffer
+        self.stalled = False
+        self.peername = ("127.0.0.1", port)
+
+    def write(self, data):
+        self.data += data
+        if self.stalled:
+            self.buffer_size += len(data)
+
+    def is_closing(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+    def abort(self):
+        self.aborted = self.closed = True
+
+    def get_extra_info(self, name, default=None):
+        if name == "peername":
+            return self.peername
+        if name == "sockname":
+            return ("127.0.0.1", 6379)
+        return default
+
+    def get_write_buffer_size(self):
+        return self.buffer_size
+
+    def pause_reading(self):
+        pass
+
+    def resume_reading(self):
+        pass
+
+
+def configure(**config):
+    for key, value in config.items():
+        set_config(key, value)
+    reload_client_settings()
+
+
+class TestOutputBufferLimits:
+
+    def test_parse(self):
+        limits = parse_output_buffer_limits("normal 10mb 5mb 30 slave 1gb 0 0")
+        assert limits[NORMAL] == (10 * 1024 ** 2, 5 * 1024 ** 2, 30)
+        assert limits[REPLICA] == (1024 ** 3, 0, 0)
+        assert limits["pubsub"] == DEFAULT_OUTPUT_BUFFER_LIMITS["pubsub"]
+
+        for value in ("normal 1 2", "master 1 2 3", "normal -1 0 0", "normal x 0 0"):
+            with pytest.raises(ValueError):
+                parse_output_buffer_limits(value)
+
+
+@pytest.mark.asyncio
+class TestClients:
+
+    @pytest_asyncio.fixture(autouse=True)
+    async def run_around_tests(self):
+        self.connections = []
+        yield
+        for protocol in self.connections:
+            protocol.connection_lost(None)
+        for key in CLIENT_CONFIG:
+            os.environ.pop(key, None)
+        reload_client_settings()
+
+    def connect(self, port=50000):
+        protocol = RedisProtocol()
+        protocol.connection_made(FakeTransport(port))
+        self.connections.append(protocol)
+        return protocol
+
+    async def send(self, protocol, *command):
+        protocol.transport.data = b""
+        protocol.data_received(encoder.encode_array(list(command)).encode())
+        while protocol.task is not None:
+            await asyncio.sleep(0)
+        return protocol.transport.data
+
+    async def test_id_and_name(self):
+        first, second = self.connect(50001), self.connect(50002)
+        assert second.id > first.id
+        assert await self.send(first, "CLIENT", "ID") == f":{first.id}\r\n".encode()
+
+        assert await self.send(first, "CLIENT", "GETNAME") == b"$-1\r\n"
+        assert await self.send(first, "CLIENT", "SETNAME", "worker-1") == b"+OK\r\n"
+        assert await self.send(first, "CLIENT", "GETNAME") == b"$8\r\nworker-1\r\n"
+        assert (await self.send(first, "CLIENT", "SETNAME", "a b")).startswith(b"-")
+
+        info = (await self.send(first, "CLIENT", "INFO")).decode()
+        assert f"id={first.id} addr=127.0.0.1:50001 laddr=127.0.0.1:6379" in info
+        assert " name=worker-1 " in info and " cmd=client " in info
+
+    async def test_list(self):
+        first, second = self.connect(50001), self.connect(50002)
+        await self.send(second, "MULTI")
+        await self.send(second, "SET", "key", "value")
+
+        reply = (await self.send(first, "CLIENT", "LIST", "ID", str(first.id), str(second.id))).decode()
+        lines = reply.split("\r\n", 1)[1].splitlines()
+        assert [line.split()[0] for line in lines[:2]] == [f"id={first.id}", f"id={second.id}"]
+        assert " flags=x " in lines[1] and " multi=1 " in lines[1] and " cmd=set " in lines[1]
+
+        assert (await self.send(first, "CLIENT", "LIST", "TYPE", "bogus")).startswith(b"-")
+        reply = (await self.send(first, "CLIENT", "LIST", "TYPE", "replica")).decode()
+        assert f"id={first.id} " not in reply
+
+    async def test_kill(self):
+        first, second, third = self.connect(50001), self.connect(50002), self.connect(50003)
+
+        assert await self.send(first, "CLIENT", "KILL", "127.0.0.1:50002") == b"+OK\r\n"
+        assert second.transport.closed
+        assert (await self.send(first, "CLIENT", "KILL", "127.0.0.1:59999")).startswith(b"-")
+
+        assert await self.send(first, "CLIENT", "KILL", "ID", str(third.id)) == b":1\r\n"
+        assert third.transport.closed
+
+        # Our own connection is skipped, unless SKIPME no. It gets the reply first.
+        assert await self.send(first, "CLIENT", "KILL", "ID", str(first.id)) == b":0\r\n"
+        assert await self.send(first, "CLIENT", "KILL", "ID", str(first.id), "SKIPME", "no") == b":1\r\n"
+        assert first.transport.closed
+
+    async def test_maxclients(self):
+        rejected = get_stats().rejected_connections
+        configure(maxclients=len(ConnectionRegistry().clients) + 1)
+
+        accepted, refused = self.connect(50001), self.connect(50002)
+        assert not accepted.transport.closed
+        assert refused.transport.closed
+        assert refused.transport.data == b"-ERR max number of clients reached\r\n"
+        assert refused not in ConnectionRegistry().clients
+        assert get_stats().rejected_connections == rejected + 1
+
+    async def test_timeout(self):
+        configure(timeout=10)
+        idle, active = self.connect(50001), self.connect(50002)
+        registry = ConnectionRegistry()
+
+        now = time.monotonic()
+        close_idle_clients(registry, now + 5)
+        assert not idle.transport.closed
+
+        active.last_interaction = now + 8
+        close_idle_clients(registry, now + 11)
+        assert idle.transport.closed
+        assert not active.transport.closed
+        assert active in registry.idle_clients
+
+        close_idle_clients(registry, now + 19)
+        assert active.transport.closed
+
+    async def test_output_buffer_limit(self):
+        configure(**{"client-output-buffer-limit": "normal 1000 100 5"})
+        client = self.connect(50001)
+        disconnections = get_stats().client_output_buffer_limit_disconnections
+
+        # Over the soft limit for longer than soft seconds
+        assert not is_over_output_buffer_limit(client, 200, 100)
+        assert not is_over_output_buffer_limit(client, 200, 104)
+        assert is_over_output_buffer_limit(client, 200, 106)
+        assert not is_over_output_buffer_limit(client, 50, 107)
+        assert client.soft_limit_reached_at is None
+
+        client.transport.buffer_size = 2000
+        await self.send(client, "PING")
+        assert client.transport.aborted
+        assert get_stats().client_output_buffer_limit_disconnections == disconnections + 1
+
+    async def test_output_buffer_limit_in_batch(self):
+        configure(**{"client-output-buffer-limit": "normal 200kb 0 0"})
+        client = self.connect(50001)
+        await self.send(client, "SET", "big", "x" * 50_000)
+
+        client.transport.data = b""
+        client.transport.stalled = True
+        client.data_received(encoder.encode_array(["GET", "big"]).encode() * 100)
+        while client.task is not None:
+            await asyncio.sleep(0)
+
+        # Executing stopped once the replies went over the hard limit
+        assert client.transport.aborted
+        assert len(client.transport.data) < 300 * 1024
+
+    async def test_config_set(self):
+        client = self.connect(50001)
+        reply = await self.send(client, "CONFIG", "SET", "client-output-buffer-limit", "normal 1 2")
+        assert reply.startswith(b"-ERR Invalid argument")
+
+        assert await self.send(client, "CONFIG", "SET", "maxclients", "50") == b"+OK\r\n"
+        assert b"maxclients:50\r\n" in await self.send(client, "INFO", "clients")
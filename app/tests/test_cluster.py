@@ -0,0 +1,312 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+
+from app.client import discard_pooled_client
+from app.cluster import ClusterState, get_slot_ranges, set_cluster
+from app.database import get_database
+from app.exceptions import (
+    AskException, CrossSlotException, MovedException, TryAgainException
+)
+from app.handler import RedisCommandHandler
+from app.serialiser import RedisStreamDecoder
+from app.slots import key_hash_slot
+
+CLUSTER_CONFIG = """\
+# node id, address, slots
+node-a 127.0.0.1:7000 0-8191
+node-b 127.0.0.1:7001 8192-16000 16001 16002-16383
+"""
+
+# "bar" hashes to slot 5061 (node-a), "foo" to slot 12182 (node-b)
+LOCAL_KEY = "bar"
+REMOTE_KEY = "foo"
+
+
+@pytest.fixture
+def cluster(tmp_path):
+    path = tmp_path / "nodes.conf"
+    path.write_text(CLUSTER_CONFIG)
+    return ClusterState.from_file(str(path), 7000)
+
+
+class TestClusterState:
+
+    def test_from_file(self, cluster):
+        assert cluster.myself.node_id == "node-a"
+        assert cluster.slot_owner[0].node_id == "node-a"
+        assert cluster.slot_owner[16001].node_id == "node-b"
+        assert cluster.get_node_slots(cluster.nodes["node-b"]) == [(8192, 16383)]
+
+    def test_get_slot_ranges(self):
+        assert get_slot_ranges([1, 2, 3, 7, 9, 10]) == [(1, 3), (7, 7), (9, 10)]
+
+    def test_check_command(self, cluster):
+        db = get_database()
+        cluster.check_command("get", [LOCAL_KEY], db)
+        cluster.check_command("ping", [], db)
+
+        with pytest.raises(MovedException) as exc:
+            cluster.check_command("set", [REMOTE_KEY, "value"], db)
+        assert str(exc.value) == "12182 127.0.0.1:7001"
+
+    def test_cross_slot(self, cluster):
+        db = get_database()
+
+        # Same node is not enough, keys must be in the same slot
+        with pytest.raises(CrossSlotException):
+            cluster.check_command("xread", ["streams", "a", "b", "0-0", "0-0"], db)
+
+        cluster.check_command("xread", ["streams", "{bar}1", "{bar}2", "0-0", "0-0"], db)
+
+    def test_migrating(self, cluster):
+        db = get_database()
+        db.set("{bar}1", "value")
+        slot = key_hash_slot(LOCAL_KEY)
+        cluster.set_slot(slot, "migrating", "node-b")
+
+        # Keys still here are served, the rest is on the target
+        cluster.check_command("get", ["{bar}1"], db)
+        with pytest.raises(AskException) as exc:
+            cluster.check_command("get", ["{bar}2"], db)
+        assert str(exc.value) == f"{slot} 127.0.0.1:7001"
+
+        with pytest.raises(TryAgainException):
+            cluster.check_command("del", ["{bar}1", "{bar}2"], db)
+
+        cluster.set_slot(slot, "node", "node-b")
+        with pytest.raises(MovedException):
+            cluster.check_command("get", ["{bar}1"], db)
+        db.clear()
+
+    def test_importing(self, cluster):
+        db = get_database()
+        slot = key_hash_slot(REMOTE_KEY)
+        cluster.set_slot(slot, "importing", "node-b")
+
+        with pytest.raises(MovedException):
+            cluster.check_command("get", [REMOTE_KEY], db)
+        cluster.check_command("get", [REMOTE_KEY], db, asking=True)
+
+        cluster.set_slot(slot, "stable")
+        with pytest.raises(MovedException):
+            cluster.check_command("get", [REMOTE_KEY], db, asking=True)
+
+    def test_slots_reply(self, cluster):
+        assert cluster.get_slots_reply() == [
+            [0, 8191, ["127.0.0.1", 7000, "node-a"]],
+            [8192, 16383, ["127.0.0.1", 7001, "node-b"]],
+        ]
+
+
+class TestSlotIndex:
+
+    @pytest.fixture(autouse=True)
+    def db(self):
+        db = get_database()
+        db.clear()
+        db.enable_slot_index()
+        yield db
+        db.slot_index = None
+        db.clear()
+
+    def test_index(self, db):
+        db.set("{user}1", "a")
+        db.set("{user}2", "b")
+        db.add_stream("{user}3", "1-1", "k", "v")
+        slot = key_hash_slot("user")
+
+        assert db.count_keys_in_slot(slot) == 3
+        assert sorted(db.get_keys_in_slot(slot, 10)) == ["{user}1", "{user}2", "{user}3"]
+        assert len(db.get_keys_in_slot(slot, 2)) == 2
+
+        db.del_key("{user}1")
+        db.set("{user}2", "c")
+        assert db.count_keys_in_slot(slot) == 2
+
+    def test_replace_data(self, db):
+        db.data = {"foo": {"value": "1", "expires_at": None}}
+        assert db.count_keys_in_slot(key_hash_slot("foo")) == 1
+
+        db.clear()
+        assert db.count_keys_in_slot(key_hash_slot("foo")) == 0
+
+
+@pytest.mark.asyncio
+class TestClusterCommands:
+
+    @pytest.fixture(autouse=True)
+    def handler(self, cluster):
+        set_cluster(cluster)
+        get_database().enable_slot_index()
+        self.handler = RedisCommandHandler()
+        yield
+        set_cluster(None)
+        get_database().slot_index = None
+        get_database().clear()
+
+    async def test_moved(self):
+        assert await self.handler.execute("set", [LOCAL_KEY, "1"]) == "+OK\r\n"
+        assert await self.handler.execute("get", [REMOTE_KEY]) == "-MOVED 12182 127.0.0.1:7001\r\n"
+
+    async def test_keyslot(self):
+        assert await self.handler.execute("cluster", ["keyslot", "foo"]) == ":12182\r\n"
+
+    async def test_keys_in_slot(self):
+        await self.handler.execute("set", [LOCAL_KEY, "1"])
+        slot = str(key_hash_slot(LOCAL_KEY))
+
+        assert await self.handler.execute("cluster", ["countkeysinslot", slot]) == ":1\r\n"
+        assert await self.handler.execute("cluster", ["getkeysinslot", slot, "5"]) == "*1\r\n$3\r\nbar\r\n"
+        assert (await self.handler.execute("cluster", ["countkeysinslot", "16384"])).startswith("-ERR")
+
+    async def test_keys_hashtag(self):
+        keys = [f"{{{LOCAL_KEY}}}:{idx}" for idx in range(5)]
+        for key in keys:
+            await self.handler.execute("set", [key, "1"])
+        await self.handler.execute("set", [LOCAL_KEY, "1"])
+
+        response, _ = await self.handler._execute("keys", ["{bar}:*"])
+        assert sorted(response) == keys
+
+    async def test_shards(self):
+        response = await self.handler.execute("cluster", ["shards"])
+        assert response.startswith("*2\r\n*4\r\n$5\r\nslots\r\n*2\r\n:0\r\n:8191\r\n")
+
+    async def test_cluster_disabled(self):
+        set_cluster(None)
+        handler = RedisCommandHandler()
+        assert (await handler.execute("cluster", ["slots"])).startswith("-ERR")
+
+    async def test_asking(self):
+        slot = str(key_hash_slot(REMOTE_KEY))
+        await self.handler.execute("cluster", ["setslot", slot, "importing", "node-b"])
+
+        assert (await self.handler.execute("get", [REMOTE_KEY])).startswith("-MOVED")
+
+        # ASKING holds for one command only
+        assert await self.handler.execute("asking", []) == "+OK\r\n"
+        assert await self.handler.execute("set", [REMOTE_KEY, "1"]) == "+OK\r\n"
+        assert (await self.handler.execute("get", [REMOTE_KEY])).startswith("-MOVED")
+
+        assert await self.handler.execute("restore-asking", [REMOTE_KEY, "0", "bad", "REPLACE"]) == (
+            "-ERR DUMP payload version or checksum are wrong\r\n"
+        )
+
+
+class FakeTarget(asyncio.Protocol):
+    """
+    Target of MIGRATE, records the commands it gets and replies OK to them
+    """
+
+    commands = []
+    selected = []
+
+    # While hold is set, replies are kept in held instead of being sent
+    hold = False
+    held = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.decoder = RedisStreamDecoder()
+
+    def data_received(self, data):
+        self.decoder.feed(data)
+        for command, _ in self.decoder.get_values():
+            if command[0] == "select":
+                self.selected.append(command[1])
+            else:
+                self.commands.append(command)
+
+            if self.hold:
+                self.held.append(self.transport)
+            else:
+                self.transport.write(b"+OK\r\n")
+
+
+@pytest.mark.asyncio
+class TestMigrate:
+
+    @pytest_asyncio.fixture(autouse=True)
+    async def target(self):
+        FakeTarget.commands = []
+        FakeTarget.selected = []
+        FakeTarget.hold = False
+        FakeTarget.held = []
+        server = await asyncio.get_running_loop().create_server(FakeTarget, "127.0.0.1", 0)
+        self.port = server.sockets[0].getsockname()[1]
+        self.handler = RedisCommandHandler()
+
+        yield
+
+        discard_pooled_client("127.0.0.1", self.port)
+        server.close()
+        await server.wait_closed()
+        get_database().clear()
+
+    async def test_migrate_keys(self):
+        keys = [f"key{idx}" for idx in range(250)]
+        for key in keys:
+            await self.handler.execute("set", [key, "value"])
+
+        response = await self.handler.execute(
+            "migrate", ["127.0.0.1", str(self.port), "", "0", "1000", "REPLACE", "KEYS", *keys, "missing"]
+        )
+        assert response == "+OK\r\n"
+
+        assert [command[1] for command in FakeTarget.commands] == keys
+        assert all(command[0] == "restore-asking" and command[-1] == "REPLACE" for command in FakeTarget.commands)
+        assert all(get_database().get(key) is None for key in keys)
+
+    async def test_migrate_copy(self):
+        await self.handler.execute("set", ["key", "value", "px", "100000"])
+
+        response = await self.handler.execute("migrate", ["127.0.0.1", str(self.port), "key", "0", "1000", "COPY"])
+        assert response == "+OK\r\n"
+
+        _, key, ttl, _ = FakeTarget.commands[0]
+        assert key == "key"
+        assert 0 < int(ttl) <= 100000
+        assert get_database().get("key") == "value"
+
+    async def test_migrate_write_in_flight(self):
+        await self.handler.execute("set", ["key", "value"])
+        get_database(1).set("key", "other database")
+
+        FakeTarget.hold = True
+        migrate = asyncio.create_task(
+            self.handler.execute("migrate", ["127.0.0.1", str(self.port), "key", "0", "1000"])
+        )
+        while not FakeTarget.commands:
+            await asyncio.sleep(0.01)
+
+        # Target has not replied yet, the write would be lost when the key is deleted
+        client = RedisCommandHandler()
+        assert (await client.execute("set", ["key", "new"])).startswith("-TRYAGAIN")
+
+        # Written without a key of its own: the key is not the one sent anymore
+        await client.execute("flushdb", [])
+        await client.execute("select", ["1"])
+        assert await client.execute("move", ["key", "0"]) == ":1\r\n"
+
+        for transport in FakeTarget.held:
+            transport.write(b"+OK\r\n")
+        assert await migrate == "+OK\r\n"
+
+        assert get_database().get("key") == "other database"
+        assert await self.handler.execute("set", ["key", "new"]) == "+OK\r\n"
+
+    async def test_migrate_nokey(self):
+        response = await self.handler.execute("migrate", ["127.0.0.1", str(self.port), "key", "0", "1000"])
+        assert response == "+NOKEY\r\n"
+
+    async def test_migrate_db(self):
+        await self.handler.execute("set", ["key", "value"])
+
+        response = await self.handler.execute("migrate", ["127.0.0.1", str(self.port), "key", "3", "1000"])
+        assert response == "+OK\r\n"
+        assert FakeTarget.selected == ["3"]
+
+        response = await self.handler.execute("migrate", ["127.0.0.1", str(self.port), "key", "99", "1000"])
+        assert response.startswith("-ERR DB index is out of range")
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from app.connection_registry import ConnectionRegistry
+from app.tests.helpers import FakeWriter
+
+
+@pytest.mark.asyncio
+class TestConnectionRegistry:
+
+    @pytest.fixture(autouse=True)
+    def registry(self):
+        registry = ConnectionRegistry()
+        registry._replicas = []
+        registry.reset_replication(registry.replication_id, 0)
+        yield registry
+        registry._replicas = []
+        registry._waiters = []
+        registry.reset_replication(registry.replication_id, 0)
+
+    async def test_propagate_without_replicas(self, registry):
+        offset = registry.replication_offset
+        assert await registry.propagate("*1\r\n$4\r\nPING\r\n") == offset
+
+    async def test_propagate_advances_offset(self, registry):
+        await registry.add_replica(FakeWriter())
+        offset = registry.replication_offset
+        assert await registry.propagate("*1\r\n$4\r\nPING\r\n") == offset + 14
+
+    async def test_wait_resolved_by_ack(self, registry):
+        first, second = FakeWriter(), FakeWriter()
+        await registry.add_replica(first)
+        await registry.add_replica(second)
+        target = await registry.propagate("*1\r\n$4\r\nPING\r\n")
+
+        wait_task = asyncio.create_task(registry.wait_for_replicas(target, 2, timeout=5))
+        await asyncio.sleep(0)
+
+        # Single GETACK was sent to both replicas
+        assert b"GETACK" in first.data
+
+        await registry.update_replica_offset(first, target)
+        await asyncio.sleep(0)
+        assert not wait_task.done()
+
+        await registry.update_replica_offset(second, target + 37)
+        assert await wait_task == 2
+        assert registry._waiters == []
+
+    async def test_wait_timeout(self, registry):
+        writer = FakeWriter()
+        await registry.add_replica(writer)
+        target = await registry.propagate("*1\r\n$4\r\nPING\r\n")
+
+        assert await registry.wait_for_replicas(target, 1, timeout=0.01) == 0
+        assert registry._waiters == []
+
+    async def test_wait_already_synced(self, registry):
+        writer = FakeWriter()
+        await registry.add_replica(writer)
+        assert await registry.wait_for_replicas(0, 1, timeout=0.01) == 1
+        assert writer.data == b""
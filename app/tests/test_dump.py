@@ -0,0 +1,42 @@
+import pytest
+
+from app.database import Stream
+from app.rdb.dump import DumpPayloadException, crc64, dump_value, restore_value
+
+
+class TestDump:
+
+    def test_crc64(self):
+        assert crc64(b"123456789") == 0xe9c6d914c4b8d9ca
+
+    def test_string(self):
+        # Same payload as DUMP of Redis
+        payload = dump_value("hello")
+        assert payload[:-8] == b"\x00\x05hello\x0b\x00"
+        assert restore_value(payload) == "hello"
+
+    def test_long_string(self):
+        value = "x" * 100 + "\udcff"
+        assert restore_value(dump_value(value)) == value
+
+        value = "y" * 70000
+        assert restore_value(dump_value(value)) == value
+
+    def test_stream(self):
+        stream = Stream()
+        stream["1-1"] = {"temperature": "10", "humidity": "20"}
+        stream["1-2"] = {"temperature": "11"}
+
+        value = restore_value(dump_value(stream))
+        assert isinstance(value, Stream)
+        assert value == stream
+
+    def test_corrupt_payload(self):
+        payload = bytearray(dump_value("hello"))
+        payload[2] ^= 1
+
+        with pytest.raises(DumpPayloadException):
+            restore_value(bytes(payload))
+
+        with pytest.raises(DumpPayloadException):
+            restore_value(b"short")
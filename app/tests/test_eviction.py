@@ -0,0 +1,187 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.database import Database, get_database, get_databases
+from app.eviction import (
+    LFU_INIT_VAL, lfu_decr, lfu_log_incr, parse_memory, perform_evictions, reload_settings
+)
+from app.handler import RedisCommandHandler
+
+
+def set_eviction_config(**config):
+    for key, value in config.items():
+        os.environ[key.replace("_", "-")] = str(value)
+    reload_settings()
+
+
+def recompute_memory(db: Database) -> int:
+    return Database(dict(db.data)).used_memory
+
+
+class TestEvictionHelpers:
+
+    def test_parse_memory(self):
+        assert parse_memory("4096") == 4096
+        assert parse_memory("1k") == 1000
+        assert parse_memory("1kb") == 1024
+        assert parse_memory("100MB") == 100 * 1024 * 1024
+        assert parse_memory("2gb") == 2 * 1024 ** 3
+
+        with pytest.raises(ValueError):
+            parse_memory("lots")
+
+    def test_lfu_counter(self):
+        # Counter always grows at first, then slower and slower
+        assert lfu_log_incr(0, 10) == 1
+        assert lfu_log_incr(LFU_INIT_VAL, 10) == LFU_INIT_VAL + 1
+        assert lfu_log_incr(255, 10) == 255
+
+        counter = LFU_INIT_VAL
+        for _ in range(1000):
+            counter = lfu_log_incr(counter, 10)
+        assert LFU_INIT_VAL < counter < 100
+
+        # One decay period every minute without access
+        access = (1000 << 8) | 10
+        assert lfu_decr(access, 1000 + 59, 1) == 10
+        assert lfu_decr(access, 1000 + 180, 1) == 7
+        assert lfu_decr(access, 1000 + 180, 0) == 10
+
+
+class TestMemoryAccounting:
+
+    def test_used_memory(self):
+        db = Database()
+        assert db.used_memory == 0
+
+        db.set("key", "value")
+        db.set("key", "longer value", datetime.now() + timedelta(seconds=100))
+        db.set("other", "x" * 1000)
+        db.add_stream("stream", "1-1", "field", "value")
+        db.add_stream("stream", "1-2", "field", "value")
+        assert db.used_memory == recompute_memory(db)
+        assert db.get_memory_usage("other") > 1000
+
+        db.del_key("stream")
+        db.set("other", "short")
+        assert db.used_memory == recompute_memory(db)
+
+        db.del_key("key")
+        db.del_key("other")
+        assert db.used_memory == 0
+
+    def test_volatile_index(self):
+        db = Database()
+        db.set("key", "value", datetime.now() + timedelta(seconds=100))
+        db.set("other", "value")
+        assert db.volatile.sample(10) == ["key"]
+
+        db.set("key", "value")
+        assert len(db.volatile) == 0
+
+
+@pytest.mark.asyncio
+class TestEviction:
+
+    @pytest.fixture(autouse=True)
+    def run_around_tests(self):
+        self.handler = RedisCommandHandler()
+        yield
+        for key in ("maxmemory", "maxmemory-policy", "maxmemory-samples"):
+            os.environ.pop(key, None)
+        reload_settings()
+        for database in get_databases():
+            database.clear()
+
+    async def fill(self, count, expires=None):
+        for idx in range(count):
+            get_database().set(f"key{idx}", "x" * 100, expires)
+
+    async def test_noeviction(self):
+        await self.fill(100)
+        set_eviction_config(maxmemory=get_database().used_memory - 1, maxmemory_policy="noeviction")
+
+        response = await self.handler.execute("set", ["new", "value"])
+        assert response.startswith("-OOM command not allowed")
+
+        # Commands which do not use more memory are still served
+        assert await self.handler.execute("get", ["key1"]) == "$100\r\n" + "x" * 100 + "\r\n"
+        assert await self.handler.execute("del", ["key1"]) == ":1\r\n"
+
+    async def test_allkeys_lru(self):
+        await self.fill(1000)
+        db = get_database()
+
+        # Half of the keys were accessed recently, the rest long ago
+        for idx in range(1000):
+            access = db.access[f"key{idx}"]
+            if idx % 2:
+                db.access[f"key{idx}"] = access - (3600 << 8)
+
+        maxmemory = db.used_memory // 2
+        set_eviction_config(maxmemory=maxmemory, maxmemory_policy="allkeys-lru", maxmemory_samples=10)
+        assert await self.handler.execute("set", ["new", "value"]) == "+OK\r\n"
+
+        assert db.used_memory - db.get_memory_usage("new") <= maxmemory
+        remaining = [key for key in db if key != "new"]
+        old = sum(1 for key in remaining if int(key[3:]) % 2)
+        assert old < len(remaining) // 4
+
+    async def test_allkeys_lfu(self):
+        await self.fill(200)
+        db = get_database()
+        set_eviction_config(maxmemory_policy="allkeys-lfu")
+
+        hot = [f"key{idx}" for idx in range(0, 200, 10)]
+        for _ in range(20):
+            for key in hot:
+                db.get(key)
+
+        set_eviction_config(maxmemory=db.used_memory // 2, maxmemory_policy="allkeys-lfu", maxmemory_samples=10)
+        evicted = perform_evictions(get_databases())
+
+        assert evicted
+        assert not {key for _, key in evicted} & set(hot)
+
+    async def test_volatile_ttl(self):
+        await self.fill(50)
+        db = get_database()
+        now = datetime.now()
+        for idx in range(50):
+            db.set(f"ttl{idx}", "value", now + timedelta(seconds=100 + idx))
+
+        set_eviction_config(
+            maxmemory=db.used_memory - 1, maxmemory_policy="volatile-ttl", maxmemory_samples=50
+        )
+        evicted = perform_evictions(get_databases())
+
+        # Keys without TTL are never evicted, soonest to expire go first
+        assert evicted == [(0, "ttl0")]
+
+    async def test_volatile_nothing_to_evict(self):
+        await self.fill(10)
+        set_eviction_config(maxmemory=1, maxmemory_policy="volatile-lru")
+
+        response = await self.handler.execute("set", ["new", "value"])
+        assert response.startswith("-OOM")
+
+    async def test_eviction_propagated(self):
+        await self.fill(10)
+        written = []
+
+        async def record(data, db_index=None):
+            written.append(data)
+
+        self.handler.write_to_replicas = record
+        set_eviction_config(maxmemory=get_database().used_memory - 1, maxmemory_policy="allkeys-random")
+        await self.handler.execute("set", ["new", "value"])
+
+        assert len(get_database()) == 10
+        assert len(written) == 1 and written[0].startswith("*2\r\n$3\r\ndel\r\n")
+
+    async def test_config_set(self):
+        assert await self.handler.execute("config", ["set", "maxmemory-policy", "allkeys-lru"]) == "+OK\r\n"
+        response = await self.handler.execute("config", ["set", "maxmemory-policy", "sometimes"])
+        assert response.startswith("-ERR Invalid argument")
@@ -3,12 +3,22 @@ import time
 
 import pytest
 
+from app.exceptions import RedisException
 from app.handler import RedisCommandHandler
-from app.serialiser import RedisEncoder
-from app.database import Database
+from app.rdb.parser import RDBParser
+from app.rdb.snapshot import build_snapshot
+from app.serialiser import RedisDecoder, RedisEncoder, RedisStreamDecoder
+from app.connection_registry import ConnectionRegistry
+from app.database import Database, get_database, get_databases
+from app.replica import Replica
+from app.tests.helpers import FakeWriter, wait_for_lazyfree
 
 encoder = RedisEncoder()
-db = Database()
+db = get_database()
+
+
+async def _record(written, data):
+    written.append(data)
 
 
 @pytest.mark.asyncio
@@ -298,6 +308,147 @@ class TestHandler:
         assert await handler.handle(encoder.encode_array(["KEYS", "*"])) == "*3\r\n$4\r\nkey1\r\n$4\r\nkey2\r\n$4\r\nkey3\r\n"
         assert await handler.handle(encoder.encode_array(["KEYS", "*1"])) == "*1\r\n$4\r\nkey1\r\n"
 
+    async def test_keys_prefix(self):
+        handler = RedisCommandHandler()
+        for idx in range(2000):
+            await handler.execute("set", [f"user:{idx}:name", "value"])
+        await handler.execute("set", ["user:1:age", "value"])
+        await handler.execute("del", ["user:10:name"])
+
+        keys, _ = await handler._execute("keys", ["user:1*"])
+        assert sorted(keys) == sorted(
+            ["user:1:name", "user:1:age"] + [f"user:{idx}:name" for idx in range(11, 20)]
+            + [f"user:{idx}:name" for idx in range(100, 200)] + [f"user:{idx}:name" for idx in range(1000, 2000)]
+        )
+
+        # Rest of the pattern is matched against the keys with the prefix
+        keys, _ = await handler._execute("keys", ["user:1?:*"])
+        assert sorted(keys) == [f"user:{idx}:name" for idx in range(11, 20)]
+        keys, _ = await handler._execute("keys", ["user:1:*"])
+        assert sorted(keys) == ["user:1:age", "user:1:name"]
+
+    async def test_scan(self):
+        handler = RedisCommandHandler()
+        for idx in range(100):
+            await handler.execute("set", [f"key{idx}", "value"])
+        await handler.execute("xadd", ["stream", "1-1", "key", "value"])
+
+        keys = []
+        cursor = "0"
+        while True:
+            (cursor, batch), _ = await handler._execute("scan", [cursor, "COUNT", "20"])
+            keys.extend(batch)
+            if cursor == "0":
+                break
+
+        assert sorted(keys) == sorted([f"key{idx}" for idx in range(100)] + ["stream"])
+
+        (cursor, batch), _ = await handler._execute("scan", ["0", "MATCH", "key1*", "COUNT", "1000"])
+        assert cursor == "0"
+        assert sorted(batch) == sorted(["key1"] + [f"key1{idx}" for idx in range(10)])
+
+        (_, batch), _ = await handler._execute("scan", ["0", "TYPE", "stream", "COUNT", "1000"])
+        assert batch == ["stream"]
+
+        assert (await handler.execute("scan", ["abc"])).startswith("-ERR")
+        assert (await handler.execute("scan", ["0", "COUNT"])).startswith("-ERR")
+
+    async def test_keys_offloaded(self):
+        handler = RedisCommandHandler()
+        os.environ["offload-min-keys"] = "1"
+
+        try:
+            for idx in range(30):
+                await handler.execute("set", [f"key{idx}", "value"])
+            await handler.execute("set", ["other", "value"])
+
+            response, _ = await handler._execute("keys", ["key*"])
+            assert sorted(response) == sorted(f"key{idx}" for idx in range(30))
+        finally:
+            del os.environ["offload-min-keys"]
+
+    async def test_xrange_offloaded(self):
+        handler = RedisCommandHandler()
+        for idx in range(1, 6):
+            await handler.execute("xadd", ["stream", f"1-{idx}", "key", str(idx)])
+
+        expected = await handler.execute("xrange", ["stream", "1-2", "+"])
+
+        os.environ["offload-min-keys"] = "1"
+        try:
+            assert await handler.execute("xrange", ["stream", "1-2", "+"]) == expected
+        finally:
+            del os.environ["offload-min-keys"]
+
+    async def test_del(self):
+        handler = RedisCommandHandler()
+
+        await handler.handle(encoder.encode_array(["SET", "key1", "value1"]))
+        await handler.handle(encoder.encode_array(["SET", "key2", "value2"]))
+
+        assert await handler.handle(encoder.encode_array(["DEL", "key1", "key2", "key3"])) == ":2\r\n"
+        assert await handler.handle(encoder.encode_array(["KEYS", "*"])) == "*0\r\n"
+
+    async def test_unlink(self):
+        handler = RedisCommandHandler()
+        await handler.execute("set", ["key", "value"])
+        for idx in range(1, 101):
+            await handler.execute("xadd", ["stream", f"{idx}-0", "k", "v"])
+        stream = db.get("stream")
+
+        assert await handler.execute("unlink", ["key", "stream", "missing"]) == ":2\r\n"
+        assert db.get("key") is None and db.get("stream") is None
+
+        # Stream is freed by the lazy free thread
+        wait_for_lazyfree()
+        assert not stream
+
+    async def test_lazy_user_del(self):
+        handler = RedisCommandHandler()
+        for idx in range(1, 101):
+            await handler.execute("xadd", ["stream", f"{idx}-0", "k", "v"])
+        stream = db.get("stream")
+
+        # Settings are cached, CONFIG SET reloads them
+        await handler.execute("config", ["set", "lazyfree-lazy-user-del", "yes"])
+        try:
+            assert await handler.execute("del", ["stream"]) == ":1\r\n"
+        finally:
+            await handler.execute("config", ["set", "lazyfree-lazy-user-del", "no"])
+
+        wait_for_lazyfree()
+        assert not stream
+
+    async def test_lazy_expire(self):
+        handler = RedisCommandHandler()
+        await handler.execute("config", ["set", "lazyfree-lazy-expire", "yes"])
+        try:
+            await handler.execute("set", ["key", "value", "px", "1"])
+            time.sleep(0.01)
+            assert await handler.execute("get", ["key"]) == "$-1\r\n"
+        finally:
+            await handler.execute("config", ["set", "lazyfree-lazy-expire", "no"])
+
+        assert "key" not in db.data
+
+    async def test_dump_restore(self):
+        handler = RedisCommandHandler()
+
+        await handler.execute("xadd", ["stream", "1-1", "key", "value"])
+        payload, _ = await handler._execute("dump", ["stream"])
+
+        assert (await handler.execute("restore", ["stream", "0", payload])).startswith("-BUSYKEY")
+        assert await handler.execute("restore", ["copy", "0", payload]) == "+OK\r\n"
+        assert await handler.execute("type", ["copy"]) == "+stream\r\n"
+
+        await handler.execute("set", ["key", "value"])
+        payload, _ = await handler._execute("dump", ["key"])
+        assert await handler.execute("restore", ["stream", "100000", payload, "REPLACE"]) == "+OK\r\n"
+        assert await handler.execute("get", ["stream"]) == "$5\r\nvalue\r\n"
+        assert db.get_expiry("stream") is not None
+
+        assert await handler.execute("dump", ["missing"]) == "$-1\r\n"
+
     async def test_info_replication(self):
         handler = RedisCommandHandler()
         master_replication = await handler.handle(encoder.encode_array(["INFO", "replication"]))
@@ -305,7 +456,8 @@ class TestHandler:
         resp = master_replication.split("\r\n")
         resp_map = {}
 
-        for item in resp[1:]:
+        assert resp[1] == "# Replication"
+        for item in resp[2:]:
 
             if not item:
                 continue
@@ -320,9 +472,142 @@ class TestHandler:
     async def test_info_replication_slave(self):
         handler = RedisCommandHandler()
         os.environ["replicaof"] = "localhost 6379"
-        assert await handler.handle(encoder.encode_array(["INFO", "replication"])) == "$10\r\nrole:slave\r\n"
+        assert await handler.handle(encoder.encode_array(["INFO", "replication"])) == (
+            "$47\r\n# Replication\r\nrole:slave\r\nconnected_slaves:0\r\n\r\n"
+        )
+        del os.environ["replicaof"]
+
+    async def test_replica_read_only(self):
+        os.environ["replicaof"] = "localhost 6379"
+        handler = RedisCommandHandler()
+        del os.environ["replicaof"]
+
+        assert await handler.handle(encoder.encode_array(["SET", "key", "value"])) == (
+            "-READONLY You can't write against a read only replica.\r\n"
+        )
+        assert await handler.handle(encoder.encode_array(["GET", "key"])) == "$-1\r\n"
+
+        # Writes coming from our master are always applied
+        handler.is_master_link = True
+        await handler.handle_propagated([(["SET", "key", "value"], 31)])
+        assert handler.db.get("key") == "value"
+
+    async def test_replica_read_only_config(self):
+        os.environ["replicaof"] = "localhost 6379"
+        handler = RedisCommandHandler()
         del os.environ["replicaof"]
 
+        # Read once, and again on CONFIG SET
+        await handler.handle(encoder.encode_array(["CONFIG", "SET", "replica-read-only", "no"]))
+        try:
+            assert await handler.handle(encoder.encode_array(["SET", "key", "value"])) == "+OK\r\n"
+        finally:
+            await handler.handle(encoder.encode_array(["CONFIG", "SET", "replica-read-only", "yes"]))
+
+        response = await handler.handle(encoder.encode_array(["CONFIG", "SET", "min-replicas-to-write", "-1"]))
+        assert response.startswith("-ERR Invalid argument")
+        assert await handler.handle(encoder.encode_array(["CONFIG", "GET", "min-replicas-to-write"])) == (
+            encoder.encode_array(["min-replicas-to-write", "0"])
+        )
+
+    async def test_write_propagation(self):
+        handler = RedisCommandHandler()
+        writer = FakeWriter()
+        await handler.connection_registry.add_replica(writer)
+
+        written = []
+        handler.write_to_replicas = lambda data: _record(written, data)
+
+        await handler.handle(encoder.encode_array(["SET", "key", "1"]))
+        await handler.handle(encoder.encode_array(["INCR", "key"]))
+        await handler.handle(encoder.encode_array(["GET", "key"]))
+        await handler.handle(encoder.encode_array(["XADD", "stream", "1-*", "k", "v"]))
+        await handler.handle(encoder.encode_array(["XADD", "stream", "0-1", "k", "v"]))
+
+        assert written == [
+            encoder.encode_array(["set", "key", "1"]),
+            encoder.encode_array(["incr", "key"]),
+            encoder.encode_array(["xadd", "stream", "1-0", "k", "v"]),
+        ]
+        await handler.connection_registry.remove_replica(writer)
+
+    async def test_set_expiry_propagation(self):
+        handler = RedisCommandHandler()
+        writer = FakeWriter()
+        await handler.connection_registry.add_replica(writer)
+
+        written = []
+        handler.write_to_replicas = lambda data: _record(written, data)
+
+        await handler.handle(encoder.encode_array(["SET", "key", "1", "EX", "100"]))
+        expires_at = handler.db.get_expiry("key")
+        await handler.handle(encoder.encode_array(["SET", "other", "1", "px", "5000"]))
+        other_pxat = str(int(handler.db.get_expiry("other").timestamp() * 1000))
+        await handler.connection_registry.remove_replica(writer)
+
+        # Replicas are sent when the key expires, rather than a TTL starting when they apply it
+        pxat = str(int(expires_at.timestamp() * 1000))
+        assert written == [
+            encoder.encode_array(["set", "key", "1", "PXAT", pxat]),
+            encoder.encode_array(["set", "other", "1", "PXAT", other_pxat]),
+        ]
+
+        replica = RedisCommandHandler()
+        replica.is_master_link = True
+        decoded = RedisDecoder().decode(written[0])
+        await replica.handle_propagated([(decoded, len(written[0]))])
+        assert abs(replica.db.get_expiry("key") - expires_at).total_seconds() < 0.001
+
+    async def test_select_propagation(self):
+        handler = RedisCommandHandler()
+        registry = handler.connection_registry
+        writer = FakeWriter()
+        await registry.add_replica(writer)
+
+        await handler.handle(encoder.encode_array(["SET", "key", "0"]))
+        await handler.handle(encoder.encode_array(["SELECT", "2"]))
+        await handler.handle(encoder.encode_array(["SET", "key", "2"]))
+        await handler.handle(encoder.encode_array(["SET", "other", "2"]))
+        await registry.remove_replica(writer)
+        get_database(2).clear()
+
+        # Replica is told to select a database before the first write, and whenever it changes
+        assert writer.data == "".join([
+            encoder.encode_array(["select", "0"]),
+            encoder.encode_array(["set", "key", "0"]),
+            encoder.encode_array(["select", "2"]),
+            encoder.encode_array(["set", "key", "2"]),
+            encoder.encode_array(["set", "other", "2"]),
+        ]).encode()
+
+    async def test_info_replication_replicas(self):
+        handler = RedisCommandHandler()
+        registry = handler.connection_registry
+        writer = FakeWriter()
+
+        await handler.handle(encoder.encode_array(["REPLCONF", "listening-port", "6380"]))
+        await handler.handle(encoder.encode_array(["PSYNC", "?", "-1"]), writer)
+        await registry.update_replica_offset(writer, handler.replication_offset)
+
+        try:
+            response = await handler.handle(encoder.encode_array(["INFO", "replication"]))
+        finally:
+            await registry.remove_replica(writer)
+
+        assert "connected_slaves:1\r\n" in response
+        assert f"slave0:ip=None,port=6380,state=online,offset={handler.replication_offset},lag=0" in response
+
+    async def test_min_replicas_to_write(self):
+        handler = RedisCommandHandler()
+        await handler.handle(encoder.encode_array(["CONFIG", "SET", "min-replicas-to-write", "1"]))
+        try:
+            response = await handler.handle(encoder.encode_array(["SET", "key", "value"]))
+        finally:
+            await handler.handle(encoder.encode_array(["CONFIG", "SET", "min-replicas-to-write", "0"]))
+
+        assert response == "-NOREPLICAS Not enough good replicas to write.\r\n"
+        assert handler.db.get("key") is None
+
     async def test_replconf(self):
         handler = RedisCommandHandler()
         assert await handler.handle(encoder.encode_array(["REPLCONF", "capa", "psycn2"])) == "+OK\r\n"
@@ -332,11 +617,154 @@ class TestHandler:
         response = await handler.handle(encoder.encode_array(["REPLCONF", "getack", "subcommand"]))
         assert response == encoder.encode_array(["REPLCONF", "ACK", "0"])
 
+    async def test_handle_propagated(self):
+        handler = RedisCommandHandler()
+        commands = [
+            (["SET", "mango", "blueberry"], 39),
+            (["REPLCONF", "GETACK", "*"], 37),
+            (["SET", "strawberry", "raspberry"], 45),
+        ]
+
+        # Only GETACK is replied to, with the offset before GETACK itself
+        assert await handler.handle_propagated(commands) == encoder.encode_array(["REPLCONF", "ACK", "39"])
+        assert handler.bytes_processed == 121
+        assert handler.db.get("strawberry") == "raspberry"
+
     async def test_psync(self):
         handler = RedisCommandHandler()
         resp = await handler.handle(encoder.encode_array(["psync", "master_replid", "offset"]), "writer")
         assert resp.startswith(b"+FULLRESYNC")
 
+    async def test_psync_snapshot(self):
+        handler = RedisCommandHandler()
+        writer = FakeWriter()
+        await handler.handle(encoder.encode_array(["SET", "key", "value", "px", "100000"]))
+        await handler.handle(encoder.encode_array(["XADD", "stream", "1-1", "field", "a"]))
+        get_database(1).set("other", "one")
+
+        resp = await handler.handle(encoder.encode_array(["psync", "?", "-1"]), writer)
+        await handler.connection_registry.remove_replica(writer)
+
+        decoder = RedisStreamDecoder()
+        decoder.feed(resp)
+        assert decoder.get_value()[0] == f"FULLRESYNC {handler.replication_id} {handler.replication_offset}"
+
+        # Replica gets the data written before it attached
+        databases = RDBParser(data=decoder.get_file()[0]).databases
+        assert databases[0]["key"]["value"] == "value"
+        # Expiry is sent in milliseconds
+        assert abs(databases[0]["key"]["expires_at"] - db.data["key"]["expires_at"]).total_seconds() < 0.001
+        assert databases[0]["stream"] == {"1-1": {"field": "a"}}
+        assert databases[1]["other"]["value"] == "one"
+        get_database(1).clear()
+
+    async def test_psync_continue(self):
+        handler = RedisCommandHandler()
+        registry = handler.connection_registry
+        first, second = FakeWriter(), FakeWriter()
+
+        await handler.handle(encoder.encode_array(["psync", "?", "-1"]), first)
+        offset = handler.replication_offset
+        await registry.propagate(encoder.encode_array(["SET", "a", "1"]))
+
+        # Replica asks for the next byte after its offset
+        resp = await handler.handle(
+            encoder.encode_array(["psync", handler.replication_id, str(offset + 1)]), second
+        )
+        assert resp == f"+CONTINUE {handler.replication_id}\r\n".encode() + encoder.encode_array(
+            ["SET", "a", "1"]
+        ).encode()
+
+        # Unknown replication ID needs full resync
+        resp = await handler.handle(encoder.encode_array(["psync", "other", str(offset + 1)]), second)
+        assert resp.startswith(b"+FULLRESYNC")
+
+        await registry.remove_replica(first)
+        await registry.remove_replica(second)
+
+    async def test_info_replication_link(self):
+        handler = RedisCommandHandler()
+        replica = Replica("localhost", 6379, 6380, RedisCommandHandler())
+
+        os.environ["replicaof"] = "localhost 6379"
+        try:
+            response = await handler.handle(encoder.encode_array(["INFO", "replication"]))
+        finally:
+            del os.environ["replicaof"]
+            handler.connection_registry.master_link = None
+
+        assert "master_link_status:down" in response
+        assert "master_sync_in_progress:0" in response
+        assert "master_last_io_seconds_ago:-1" in response
+        assert replica.get_reconnect_delay() <= 0.5
+
+    async def test_load_invalid_rdb(self):
+        handler = RedisCommandHandler()
+        replica = Replica("localhost", 6379, 6380, handler)
+        handler.connection_registry.master_link = None
+        await handler.handle(encoder.encode_array(["SET", "key", "stale"]))
+
+        # Link is dropped and synced again, rather than carrying on as if in sync
+        with pytest.raises(RedisException):
+            replica.load_rdb(b"not an rdb")
+        assert get_database().get("key") == "stale"
+
+    async def test_replication_stream_null_values(self):
+        handler = RedisCommandHandler()
+        replica = Replica("localhost", 6379, 6380, handler)
+        registry = handler.connection_registry
+        registry.master_link = None
+        offset = registry.replication_offset
+
+        decoder = RedisStreamDecoder()
+        decoder.feed(b"$-1\r\n" + encoder.encode_array(["SET", "after-null", "1"]).encode() + b"*-1\r\n")
+        commands, raw_data = decoder.get_stream()
+        try:
+            await replica.process_commands(commands, raw_data)
+        finally:
+            registry.replication_offset = offset
+
+        # Skipped, but counted in the offset like every byte of the stream
+        assert handler.bytes_processed == len(raw_data)
+        assert get_database().get("after-null") == "1"
+
+    async def test_chained_replica_snapshot(self):
+        master = Database()
+        master.set("synced", "from-master")
+
+        registry = ConnectionRegistry()
+        replication_id, offset = registry.replication_id, registry.replication_offset
+
+        os.environ["replicaof"] = "localhost 6379"
+        try:
+            # Intermediate replica, synced with its master at offset 100
+            replica = Replica("localhost", 6379, 6380, RedisCommandHandler())
+            registry.master_link = None
+            replica.load_rdb(build_snapshot([master]))
+            replica.handler.bytes_processed = 100
+            registry.reset_replication("master-replid", 100)
+
+            # Written on master after that, streamed to the intermediate replica
+            decoder = RedisStreamDecoder()
+            decoder.feed(encoder.encode_array(["SET", "streamed", "later"]).encode())
+            await replica.process_commands(*decoder.get_stream())
+
+            # Sub-replica attaches only now
+            writer = FakeWriter()
+            resp = await RedisCommandHandler().handle(encoder.encode_array(["psync", "?", "-1"]), writer)
+            await registry.remove_replica(writer)
+        finally:
+            del os.environ["replicaof"]
+            registry.reset_replication(replication_id, offset)
+
+        decoder = RedisStreamDecoder()
+        decoder.feed(resp)
+        assert decoder.get_value()[0] == f"FULLRESYNC master-replid {replica.handler.bytes_processed}"
+
+        data = RDBParser(data=decoder.get_file()[0]).databases[0]
+        assert data["synced"]["value"] == "from-master"
+        assert data["streamed"]["value"] == "later"
+
     async def test_type(self):
 
         handler = RedisCommandHandler()
@@ -371,3 +799,74 @@ class TestHandler:
 
         assert await handler.handle(encoder.encode_array(["MULTI"])) == "+OK\r\n"
         assert handler.transaction_queue == []
+
+
+@pytest.mark.asyncio
+class TestDatabases:
+
+    @pytest.fixture(autouse=True)
+    def run_around_tests(self):
+        self.handler = RedisCommandHandler()
+        yield
+        for database in get_databases():
+            database.clear()
+
+    async def execute(self, *command):
+        return await self.handler.execute(command[0].lower(), list(command[1:]))
+
+    async def test_select(self):
+        await self.execute("SET", "key", "zero")
+        assert await self.execute("SELECT", "1") == "+OK\r\n"
+        assert await self.execute("GET", "key") == "$-1\r\n"
+
+        await self.execute("SET", "key", "one")
+        assert get_database(1).get("key") == "one"
+        assert get_database(0).get("key") == "zero"
+
+        assert await self.execute("SELECT", "16") == "-ERR DB index is out of range\r\n"
+        assert await self.execute("SELECT", "x") == "-ERR value is not an integer or out of range\r\n"
+        assert self.handler.db_index == 1
+
+    async def test_move(self):
+        await self.execute("SET", "key", "value", "px", "100000")
+        await self.execute("SET", "other", "value")
+        get_database(1).set("other", "taken")
+
+        assert await self.execute("MOVE", "key", "1") == ":1\r\n"
+        assert await self.execute("MOVE", "key", "1") == ":0\r\n"
+        assert await self.execute("MOVE", "other", "1") == ":0\r\n"
+        assert await self.execute("MOVE", "other", "0") == "-ERR source and destination objects are the same\r\n"
+
+        assert db.get("key") is None
+        assert get_database(1).get("key") == "value"
+        assert get_database(1).get_expiry("key") is not None
+
+    async def test_swapdb(self):
+        await self.execute("SET", "key", "zero")
+        get_database(1).set("key", "one")
+
+        assert await self.execute("SWAPDB", "0", "1") == "+OK\r\n"
+        assert await self.execute("GET", "key") == "$3\r\none\r\n"
+
+        assert await self.execute("SWAPDB", "0", "1") == "+OK\r\n"
+        assert await self.execute("GET", "key") == "$4\r\nzero\r\n"
+
+    async def test_flushdb(self):
+        for idx in range(100):
+            await self.execute("SET", f"key{idx}", "value")
+        get_database(1).set("key", "value")
+
+        assert await self.execute("DBSIZE") == ":100\r\n"
+        assert await self.execute("FLUSHDB", "ASYNC") == "+OK\r\n"
+        assert await self.execute("DBSIZE") == ":0\r\n"
+        assert await self.execute("SCAN", "0") == encoder.encode_array(["0", []])
+        assert len(get_database(1)) == 1
+
+        assert await self.execute("FLUSHDB", "LATER") == "-ERR syntax error\r\n"
+
+    async def test_flushall(self):
+        await self.execute("SET", "key", "value")
+        get_database(3).set("key", "value")
+
+        assert await self.execute("FLUSHALL") == "+OK\r\n"
+        assert all(len(database) == 0 for database in get_databases())
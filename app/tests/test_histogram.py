@@ -0,0 +1,48 @@
+import random
+
+from app.histogram import (
+    BUCKET_COUNT, HISTOGRAM_MAX_VALUE, LatencyHistogram, get_bucket_index, get_bucket_range
+)
+
+
+class TestLatencyHistogram:
+
+    def test_buckets(self):
+        # Buckets cover every value once, in order
+        previous_high = -1
+        for index in range(BUCKET_COUNT):
+            low, high = get_bucket_range(index)
+            assert low == previous_high + 1
+            assert get_bucket_index(low) == get_bucket_index(high) == index
+            # Never wider than 1/16th of its values
+            assert high - low <= low / 16
+            previous_high = high
+
+        assert previous_high == HISTOGRAM_MAX_VALUE
+
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        assert histogram.get_percentile(99) == 0
+
+        values = [random.randint(0, 100_000) for _ in range(10_000)]
+        for value in values:
+            histogram.record(value)
+        values.sort()
+
+        for percentile in (0, 50, 90, 99, 99.9, 100):
+            exact = values[max(0, -int(-percentile * len(values) // 100) - 1)]
+            assert exact <= histogram.get_percentile(percentile) <= exact * 1.07
+
+        assert histogram.get_percentile(100) == histogram.max == values[-1]
+
+    def test_max_value(self):
+        histogram = LatencyHistogram()
+        histogram.record(HISTOGRAM_MAX_VALUE * 2)
+        assert histogram.max == HISTOGRAM_MAX_VALUE
+
+    def test_cumulative_buckets(self):
+        histogram = LatencyHistogram()
+        for value in (0, 0, 1, 3, 3, 100):
+            histogram.record(value)
+
+        assert histogram.get_cumulative_buckets() == [1, 2, 2, 3, 4, 5, 128, 6]
@@ -0,0 +1,128 @@
+import random
+import sys
+
+from app.keyspace import BucketIndex, MIN_BUCKETS, SORTED_CHUNK_SIZE, SortedKeys, get_prefix_end, next_cursor
+
+
+def scan_all(index, count=10, between=None):
+    """
+    Run a full scan, calling between() after every step
+    """
+    keys = set()
+    cursor = 0
+    while True:
+        cursor, batch = index.scan(cursor, count)
+        keys.update(batch)
+        if cursor == 0:
+            return keys
+        if between is not None:
+            between()
+
+
+class TestBucketIndex:
+
+    def test_next_cursor(self):
+        # With 8 buckets, reverse binary order is 0 4 2 6 1 5 3 7
+        mask = 7
+        order = [0]
+        cursor = next_cursor(0, mask)
+        while cursor != 0:
+            order.append(cursor & mask)
+            cursor = next_cursor(cursor, mask)
+        assert order == [0, 4, 2, 6, 1, 5, 3, 7]
+
+    def test_add_remove(self):
+        index = BucketIndex(f"key{idx}" for idx in range(1000))
+        assert len(index) == 1000
+        assert scan_all(index) == {f"key{idx}" for idx in range(1000)}
+
+        for idx in range(0, 1000, 2):
+            index.remove(f"key{idx}")
+
+        assert len(index) == 500
+        assert scan_all(index) == {f"key{idx}" for idx in range(1, 1000, 2)}
+
+    def test_shrink(self):
+        index = BucketIndex(f"key{idx}" for idx in range(1000))
+        for idx in range(1000):
+            index.remove(f"key{idx}")
+
+        # Shrinking is incremental, finishes with more writes
+        for _ in range(100):
+            index.add("key")
+            index.remove("key")
+
+        assert len(index) == 0
+        assert len(index.table) == MIN_BUCKETS
+
+    def test_scan_while_growing(self):
+        index = BucketIndex(f"key{idx}" for idx in range(100))
+        added = iter(range(100, 10_000))
+
+        def add_keys():
+            for idx in zip(range(200), added):
+                index.add(f"key{idx[1]}")
+
+        # Every key present for the whole scan is returned
+        assert scan_all(index, between=add_keys) >= {f"key{idx}" for idx in range(100)}
+
+    def test_scan_while_shrinking(self):
+        index = BucketIndex(f"key{idx}" for idx in range(5000))
+        kept = {f"key{idx}" for idx in range(0, 5000, 50)}
+        removable = [f"key{idx}" for idx in range(5000) if f"key{idx}" not in kept]
+        random.shuffle(removable)
+
+        def remove_keys():
+            for _ in range(min(300, len(removable))):
+                index.remove(removable.pop())
+
+        assert scan_all(index, count=5, between=remove_keys) >= kept
+
+
+class TestSortedKeys:
+
+    def test_add_remove(self):
+        keys = [f"key{idx}" for idx in range(5000)]
+        random.shuffle(keys)
+        index = SortedKeys(keys[:1000])
+        for key in keys[1000:]:
+            index.add(key)
+
+        assert len(index) == 5000
+        assert [key for chunk in index.chunks for key in chunk] == sorted(keys)
+        # Chunks are split as they fill up
+        assert max(len(chunk) for chunk in index.chunks) <= SORTED_CHUNK_SIZE * 2
+        assert index.maxes == [chunk[-1] for chunk in index.chunks]
+
+        for key in keys[:4990]:
+            index.remove(key)
+        index.remove("missing")
+
+        assert len(index) == 10
+        assert [key for chunk in index.chunks for key in chunk] == sorted(keys[4990:])
+        assert index.maxes == [chunk[-1] for chunk in index.chunks]
+
+    def test_with_prefix(self):
+        index = SortedKeys(f"user:{idx}:name" for idx in range(5000))
+        index.add("user;")
+        index.add("user")
+
+        assert index.with_prefix("user:123") == sorted(
+            ["user:123:name"] + [f"user:{idx}:name" for idx in range(1230, 1240)]
+        )
+        assert index.with_prefix("user:") == sorted(f"user:{idx}:name" for idx in range(5000))
+        assert index.with_prefix("user:4999:name") == ["user:4999:name"]
+        assert index.with_prefix("user:5000") == []
+        assert index.with_prefix("zzz") == []
+        assert SortedKeys().with_prefix("user") == []
+
+        last = chr(sys.maxunicode)
+        index = SortedKeys(["a", f"a{last}", f"a{last}{last}x", "b"])
+        assert index.with_prefix(f"a{last}") == [f"a{last}", f"a{last}{last}x"]
+        assert index.with_prefix(last) == []
+
+    def test_get_prefix_end(self):
+        assert get_prefix_end("user:1") == "user:2"
+        assert get_prefix_end(f"a{chr(sys.maxunicode)}") == "b"
+        assert get_prefix_end(chr(sys.maxunicode)) is None
+        assert get_prefix_end("") is None
@@ -0,0 +1,112 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from app.database import get_database
+from app.handler import RedisCommandHandler
+from app.latency import EVENT_LOOP_EVENT, LatencyEvent, LatencyMonitor, get_latency_monitor, monitor_event_loop
+from app.stats import get_stats
+
+
+def enable_monitor(threshold):
+    os.environ["latency-monitor-threshold"] = str(threshold)
+    get_latency_monitor().reload()
+
+
+class TestLatencyMonitor:
+
+    def test_event_history(self):
+        event = LatencyEvent()
+        event.add(100, 5)
+        event.add(100, 20)
+        event.add(100, 10)
+        event.add(101, 7)
+
+        # One sample per second, the highest of that second
+        assert list(event.history) == [(100, 20), (101, 7)]
+        assert event.max == 20
+
+    def test_threshold(self):
+        monitor = LatencyMonitor()
+        monitor.add_sample("command", 500)
+        assert monitor.latest() == []
+
+        monitor.threshold = 10
+        monitor.add_sample("command", 5)
+        monitor.add_sample("command", 50)
+        [[event, _, latest, highest]] = monitor.latest()
+        assert (event, latest, highest) == ("command", 50, 50)
+
+        assert monitor.reset(["other"]) == 0
+        assert monitor.reset() == 1
+        assert monitor.history("command") == []
+
+
+@pytest.mark.asyncio
+class TestLatencyCommand:
+
+    @pytest.fixture(autouse=True)
+    def run_around_tests(self):
+        self.handler = RedisCommandHandler()
+        yield
+        os.environ.pop("latency-monitor-threshold", None)
+        get_latency_monitor().reload()
+        get_latency_monitor().reset()
+
+    async def execute(self, *command):
+        return (await self.handler._execute(command[0].lower(), list(command[1:])))[0]
+
+    async def test_event_loop_stall(self):
+        enable_monitor(20)
+        task = asyncio.create_task(monitor_event_loop(interval=0.01))
+        await asyncio.sleep(0.02)
+
+        # Blocks the event loop
+        time.sleep(0.1)
+        await asyncio.sleep(0.02)
+        task.cancel()
+
+        history = await self.execute("LATENCY", "HISTORY", EVENT_LOOP_EVENT)
+        assert len(history) == 1
+        assert history[0][1] >= 80
+
+        latest = await self.execute("LATENCY", "LATEST")
+        assert latest[0][0] == EVENT_LOOP_EVENT
+
+        assert await self.execute("LATENCY", "RESET") == 1
+        assert await self.execute("LATENCY", "LATEST") == []
+
+    async def test_command_latency(self):
+        await self.execute("CONFIG", "SET", "latency-monitor-threshold", "10")
+
+        self.handler.record_duration("get", ["key"], 5_000_000, None)
+        assert await self.execute("LATENCY", "HISTORY", "command") == []
+
+        self.handler.record_duration("get", ["key"], 50_000_000, None)
+        [[_, latency]] = await self.execute("LATENCY", "HISTORY", "command")
+        assert latency == 50
+
+        # Blocking commands wait, they are not slow
+        self.handler.record_duration("wait", ["1", "100"], 500_000_000, None)
+        [[_, latency]] = await self.execute("LATENCY", "HISTORY", "command")
+        assert latency == 50
+
+    async def test_histogram(self):
+        get_stats().reset()
+        for _ in range(3):
+            await self.execute("SET", "key", "value")
+        await self.execute("GET", "key")
+
+        histogram = await self.execute("LATENCY", "HISTOGRAM", "set", "missing")
+        assert histogram[0] == "set"
+        calls, buckets = histogram[1][1], histogram[1][3]
+        assert calls == 3
+        # Bounds are powers of two, counts are cumulative
+        assert all(bound & (bound - 1) == 0 for bound in buckets[::2])
+        assert buckets[-1] == 3
+
+        histogram = await self.execute("LATENCY", "HISTOGRAM")
+        assert {"set", "get"} <= set(histogram[::2])
+        get_database().clear()
@@ -0,0 +1,32 @@
+from app.lazyfree import free_async, free_object, free_value, pending_objects
+from app.tests.helpers import wait_for_lazyfree
+
+
+class TestLazyFree:
+
+    def test_free_object(self):
+        data = {idx: {"value": idx} for idx in range(2500)}
+        items = set(range(2500))
+        buckets = [[idx] for idx in range(2500)]
+
+        for obj in (data, items, buckets):
+            free_object(obj)
+            assert len(obj) == 0
+
+    def test_free_async(self):
+        data = {idx: {"value": idx} for idx in range(10_000)}
+        free_async(data, [1, 2, 3])
+        wait_for_lazyfree()
+
+        assert pending_objects() == 0
+        assert not data
+
+    def test_free_value(self):
+        # Small values are not worth a trip to the thread
+        assert not free_value({"value": "x", "expires_at": None})
+        assert not free_value("x" * 1_000_000)
+
+        stream = {f"{idx}-0": {"k": "v"} for idx in range(100)}
+        assert free_value(stream)
+        wait_for_lazyfree()
+        assert not stream
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+
+from app.bigkeys import find_big_keys
+from app.client import RedisClient
+from app.database import Stream, get_database
+from app.handler import RedisCommandHandler
+from app.memory import get_stream_size, sample_stream_size
+from app.protocol import RedisProtocol
+
+
+def make_stream(count, value_size=10):
+    stream = Stream()
+    for idx in range(count):
+        stream[f"{idx}-0"] = {"field": "x" * value_size}
+    return stream
+
+
+class TestMemory:
+
+    def test_sample_stream_size(self):
+        stream = make_stream(1000)
+        exact = get_stream_size(stream)
+
+        assert sample_stream_size(stream, 0) == exact
+        assert abs(sample_stream_size(stream, 5) - exact) < exact * 0.05
+        assert sample_stream_size(make_stream(3), 5) == get_stream_size(make_stream(3))
+
+
+@pytest.mark.asyncio
+class TestMemoryCommand:
+
+    @pytest.fixture(autouse=True)
+    def run_around_tests(self):
+        self.handler = RedisCommandHandler()
+        yield
+        get_database().clear()
+
+    async def execute(self, *command):
+        return (await self.handler._execute(command[0].lower(), list(command[1:])))[0]
+
+    async def test_usage(self):
+        await self.execute("SET", "small", "x")
+        await self.execute("SET", "big", "x" * 10_000)
+        for idx in range(1, 101):
+            await self.execute("XADD", "stream", f"{idx}-0", "field", "value")
+
+        small = await self.execute("MEMORY", "USAGE", "small")
+        assert 0 < small < await self.execute("MEMORY", "USAGE", "big")
+
+        # Entries are all alike, so a sample is as good as all of them
+        sampled = await self.execute("MEMORY", "USAGE", "stream")
+        exact = await self.execute("MEMORY", "USAGE", "stream", "SAMPLES", "0")
+        assert abs(sampled - exact) < exact * 0.05
+        assert exact == get_database().get_memory_usage("stream", 0)
+
+        assert await self.execute("MEMORY", "USAGE", "missing") is None
+        assert str(await self.execute("MEMORY", "USAGE", "small", "SAMPLES")) == "syntax error"
+
+    async def test_stats(self):
+        await self.execute("SET", "key", "value", "px", "100000")
+        await self.execute("XADD", "stream", "1-1", "field", "value")
+
+        reply = await self.execute("MEMORY", "STATS")
+        stats = dict(zip(reply[::2], reply[1::2]))
+
+        assert stats["keys.count"] == 2
+        assert stats["keys.string.count"] == 1
+        assert stats["keys.stream.count"] == 1
+        assert stats["keys.string.bytes"] + stats["keys.stream.bytes"] == get_database().used_memory
+        assert stats["db.0"][1] > 0 and stats["db.0"][3] > 0
+        assert "db.1" not in stats
+        assert stats["total.allocated"] > 0
+
+
+@pytest.mark.asyncio
+class TestBigKeys:
+
+    @pytest_asyncio.fixture(autouse=True)
+    async def server(self):
+        server = await asyncio.get_running_loop().create_server(RedisProtocol, "127.0.0.1", 0)
+        self.client = RedisClient("127.0.0.1", server.sockets[0].getsockname()[1])
+
+        yield
+
+        self.client.close()
+        server.close()
+        await server.wait_closed()
+        get_database().clear()
+
+    async def test_find_big_keys(self):
+        db = get_database()
+        for idx in range(300):
+            db.set(f"key{idx}", "x" * idx)
+        for idx in range(1, 51):
+            db.add_stream("stream", f"{idx}-0", "field", "value")
+        db.add_stream("small", "1-0", "field", "value")
+
+        report = await find_big_keys(self.client, count=20)
+
+        assert report.scanned == 302
+        assert report.counts == {"string": 300, "stream": 2}
+        assert report.biggest["string"][0] == "key299"
+        assert report.biggest["stream"][0] == "stream"
+        assert "Biggest string found 'key299'" in report.format()
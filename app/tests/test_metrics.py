@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from app.connection_registry import ConnectionRegistry
+from app.database import get_database
+from app.handler import RedisCommandHandler
+from app.metrics import LATENCY_BOUNDS, MetricsServer, format_labels, render_metrics
+from app.stats import get_stats
+
+
+def parse_samples(text: str) -> dict:
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith("#"):
+            continue
+        name, value = line.rsplit(" ", 1)
+        samples[name] = float(value)
+    return samples
+
+
+class TestFormat:
+
+    def test_format_labels(self):
+        assert format_labels({}) == ""
+        assert format_labels({"cmd": "get", "le": "0.5"}) == '{cmd="get",le="0.5"}'
+        assert format_labels({"name": 'a"b\\c\n'}) == '{name="a\\"b\\\\c\\n"}'
+
+
+@pytest.mark.asyncio
+class TestMetrics:
+
+    @pytest.fixture(autouse=True)
+    def run_around_tests(self):
+        self.handler = RedisCommandHandler()
+        get_stats().reset()
+        yield
+        get_database().clear()
+
+    async def test_render(self):
+        await self.handler._execute("set", ["key", "value"])
+        await self.handler._execute("get", ["key"])
+        await self.handler._execute("get", ["missing"])
+
+        text = "".join(render_metrics(ConnectionRegistry()))
+        assert text.endswith("# EOF\n")
+        assert "# TYPE redis_commands counter" in text
+        assert "# TYPE redis_command_latency_seconds histogram" in text
+
+        samples = parse_samples(text)
+        assert samples["redis_commands_processed_total"] == 3
+        assert samples['redis_commands_total{cmd="get"}'] == 2
+        assert samples["redis_keyspace_hits_total"] == 1
+        assert samples["redis_keyspace_misses_total"] == 1
+        assert samples['redis_db_keys{db="db0"}'] == 1
+
+        buckets = [
+            samples[f'redis_command_latency_seconds_bucket{{cmd="get",le="{bound / 1_000_000:g}"}}']
+            for bound in LATENCY_BOUNDS
+        ]
+        assert buckets == sorted(buckets)
+        assert samples['redis_command_latency_seconds_bucket{cmd="get",le="+Inf"}'] == 2
+        assert samples['redis_command_latency_seconds_count{cmd="get"}'] == 2
+
+    async def test_http(self):
+        server = await asyncio.start_server(MetricsServer(ConnectionRegistry()).handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+
+        async def request(data: bytes) -> bytes:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(data)
+            response = await reader.read()
+            writer.close()
+            return response
+
+        try:
+            response = await request(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            head, body = response.split(b"\r\n\r\n", 1)
+            assert head.startswith(b"HTTP/1.1 200 OK")
+            assert b"application/openmetrics-text" in head
+            assert body.endswith(b"# EOF\n")
+
+            response = await request(b"GET /other HTTP/1.1\r\n\r\n")
+            assert response.startswith(b"HTTP/1.1 404 Not Found")
+
+            response = await request(b"POST /metrics HTTP/1.1\r\n\r\n")
+            assert response.startswith(b"HTTP/1.1 405 Method Not Allowed")
+        finally:
+            server.close()
+            await server.wait_closed()
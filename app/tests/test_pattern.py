@@ -0,0 +1,72 @@
+import fnmatch
+
+from app.pattern import compile_pattern
+
+
+def matches(pattern, key):
+    return compile_pattern(pattern)(key)
+
+
+class TestPattern:
+
+    def test_literal(self):
+        pattern = compile_pattern("user:1")
+        assert pattern.is_literal
+        assert pattern("user:1")
+        assert not pattern("user:10")
+
+    def test_prefix(self):
+        pattern = compile_pattern("user:123:*")
+        assert pattern.is_prefix
+        assert pattern.prefix == "user:123:"
+        assert pattern("user:123:")
+        assert pattern("user:123:name")
+        assert not pattern("user:12")
+
+        assert compile_pattern("*").match_all
+        assert compile_pattern("**").match_all
+
+    def test_wildcards(self):
+        assert matches("h?llo", "hello")
+        assert not matches("h?llo", "hllo")
+        assert matches("h*llo", "hllo")
+        assert matches("h*llo", "heeeello")
+        assert matches("*:name", "user:1:name")
+        assert not matches("*:name", "user:1:names")
+        assert matches("a*b*c", "aXbYc")
+
+    def test_classes(self):
+        assert matches("h[ae]llo", "hello")
+        assert not matches("h[ae]llo", "hillo")
+        assert matches("h[^e]llo", "hallo")
+        assert not matches("h[^e]llo", "hello")
+        assert matches("h[a-b]llo", "hbllo")
+        assert not matches("h[a-b]llo", "hcllo")
+        # Reversed range, same as Redis
+        assert matches("h[b-a]llo", "hallo")
+        assert matches("[\\]]", "]")
+
+    def test_escapes(self):
+        assert matches("\\*", "*")
+        assert not matches("\\*", "a")
+        assert matches("user\\?", "user?")
+        assert not matches("user\\?", "users")
+
+        # Escaped characters are part of the literal prefix
+        pattern = compile_pattern("a\\*b*")
+        assert pattern.is_prefix
+        assert pattern.prefix == "a*b"
+
+    def test_case_sensitive(self):
+        assert not matches("KEY*", "key1")
+
+    def test_no_fnmatch_semantics(self):
+        # [!a] is a negation in fnmatch only, for Redis ! is just a character
+        assert fnmatch.fnmatch("b", "[!a]")
+        assert not matches("[!a]", "b")
+        assert matches("[!a]", "!")
+
+    def test_regex_characters(self):
+        assert matches("a.b", "a.b")
+        assert not matches("a.b*", "axb")
+        assert matches("(a)+|*", "(a)+|x")
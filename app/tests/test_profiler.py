@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+import pytest
+
+from app.handler import RedisCommandHandler
+from app.latency import monitor_event_loop
+from app.profiler import SamplingProfiler, get_profiler
+from app.stats import get_stats
+
+
+def busy_loop(seconds):
+    end = time.process_time() + seconds
+    while time.process_time() < end:
+        pass
+
+
+class TestSamplingProfiler:
+
+    def test_collapsed_stacks(self):
+        profiler = SamplingProfiler()
+        profiler.start(1000)
+        try:
+            busy_loop(0.2)
+        finally:
+            profiler.stop()
+
+        assert not profiler.running
+        assert profiler.sample_count > 10
+
+        stacks = profiler.dump().splitlines()
+        assert stacks
+        stack, count = stacks[0].rsplit(" ", 1)
+        # Root first, the sampled function last
+        assert "test_profiler.py:busy_loop" in stack.split(";")[-2:]
+        assert int(count) > 0
+
+        # Nothing is sampled once stopped
+        count = profiler.sample_count
+        busy_loop(0.05)
+        assert profiler.sample_count == count
+
+
+@pytest.mark.asyncio
+class TestDebugCommand:
+
+    @pytest.fixture(autouse=True)
+    def run_around_tests(self):
+        self.handler = RedisCommandHandler()
+        yield
+        get_profiler().stop()
+
+    async def execute(self, *command):
+        return (await self.handler._execute(command[0].lower(), list(command[1:])))[0]
+
+    async def test_profile(self):
+        assert await self.execute("DEBUG", "PROFILE", "START", "1000") == "OK"
+        busy_loop(0.1)
+        assert await self.execute("DEBUG", "PROFILE", "STOP") == "OK"
+
+        dump = await self.execute("DEBUG", "PROFILE", "DUMP")
+        assert "test_profiler.py:busy_loop" in dump
+
+        assert str(await self.execute("DEBUG", "PROFILE", "START", "0")) == "hz must be between 1 and 1000"
+        assert str(await self.execute("DEBUG", "PROFILE", "RUN")) == "Invalid debug profile action: run"
+
+    async def test_eventloop_lag(self):
+        get_stats().reset()
+        task = asyncio.create_task(monitor_event_loop(interval=0.01))
+        await asyncio.sleep(0.02)
+
+        await self.execute("DEBUG", "SLEEP", "0.05")
+        await asyncio.sleep(0.02)
+        task.cancel()
+
+        info, _ = await self.handler._execute("info", ["stats"])
+        fields = dict(line.split(":", 1) for line in info.split("\r\n")[1:] if line)
+        assert int(fields["eventloop_lag_max_usec"]) >= 40_000
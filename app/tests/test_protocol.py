@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from app.database import get_database
+from app.protocol import RedisProtocol
+from app.serialiser import RedisEncoder
+from app.stats import get_stats
+
+encoder = RedisEncoder()
+
+
+class FakeTransport:
+
+    def __init__(self):
+        self.data = b""
+        self.closed = False
+        self.reading = True
+
+    def write(self, data):
+        self.data += data
+
+    def is_closing(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+    def get_extra_info(self, name, default=None):
+        return default
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def pause_reading(self):
+        self.reading = False
+
+    def resume_reading(self):
+        self.reading = True
+
+
+async def _wait_idle(protocol):
+    while protocol.task is not None:
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+class TestRedisProtocol:
+
+    @pytest.fixture(autouse=True)
+    def run_around_tests(self):
+        yield
+        get_database().clear()
+
+    @pytest.fixture
+    def protocol(self):
+        protocol = RedisProtocol()
+        protocol.connection_made(FakeTransport())
+        return protocol
+
+    async def test_pipeline(self, protocol):
+        protocol.data_received(
+            (encoder.encode_array(["SET", "key", "value"]) + encoder.encode_array(["GET", "key"])).encode()
+        )
+        await _wait_idle(protocol)
+
+        assert protocol.transport.data == b"+OK\r\n$5\r\nvalue\r\n"
+
+    async def test_command_split_across_packets(self, protocol):
+        data = encoder.encode_array(["ECHO", "hello"]).encode()
+
+        protocol.data_received(data[:7])
+        assert protocol.task is None
+
+        protocol.data_received(data[7:])
+        await _wait_idle(protocol)
+
+        assert protocol.transport.data == b"$5\r\nhello\r\n"
+
+    async def test_inline_command(self, protocol):
+        protocol.data_received(b"PING\r\n\r\n")
+        await _wait_idle(protocol)
+
+        assert protocol.transport.data == b"+PONG\r\n"
+
+    async def test_write_backpressure(self, protocol):
+        protocol.pause_writing()
+        protocol.data_received(encoder.encode_array(["PING"]).encode() * 2)
+        await asyncio.sleep(0)
+
+        # Replies of the first batch are written, next batch waits for transport to drain
+        assert protocol.transport.data == b"+PONG\r\n+PONG\r\n"
+
+        protocol.data_received(encoder.encode_array(["PING"]).encode())
+        await asyncio.sleep(0)
+        assert protocol.transport.data == b"+PONG\r\n+PONG\r\n"
+
+        protocol.resume_writing()
+        await _wait_idle(protocol)
+        assert protocol.transport.data == b"+PONG\r\n" * 3
+
+    async def test_protocol_error(self, protocol):
+        protocol.data_received(b"*x\r\n")
+
+        assert protocol.transport.data == b"-ERR Protocol error\r\n"
+        assert protocol.transport.closed
+
+    async def test_net_bytes(self, protocol):
+        stats = get_stats()
+        received, sent = stats.total_net_input_bytes, stats.total_net_output_bytes
+
+        data = encoder.encode_array(["ECHO", "hello"]).encode()
+        protocol.data_received(data)
+        await _wait_idle(protocol)
+
+        assert stats.total_net_input_bytes - received == len(data)
+        assert stats.total_net_output_bytes - sent == len(b"$5\r\nhello\r\n")
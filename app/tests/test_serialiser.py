@@ -1,4 +1,4 @@
-from app.serialiser import RedisDecoder, RedisEncoder
+from app.serialiser import RedisDecoder, RedisEncoder, RedisStreamDecoder
 
 
 class TestRedisDecoder:
@@ -41,6 +41,70 @@ class TestRedisDecoder:
         ]
 
 
+class TestRedisStreamDecoder:
+
+    def test_single_command(self):
+        decoder = RedisStreamDecoder()
+        decoder.feed(b"*2\r\n$3\r\nfoo\r\n$3\r\nbar\r\n")
+        assert decoder.get_values() == [(["foo", "bar"], 22)]
+        assert decoder.pending() == 0
+
+    def test_command_split_across_reads(self):
+        data = b"*3\r\n$3\r\nSET\r\n$5\r\nmango\r\n$9\r\nblueberry\r\n"
+        decoder = RedisStreamDecoder()
+
+        for idx in range(len(data) - 1):
+            decoder.feed(data[idx:idx + 1])
+            assert decoder.get_value() is None
+
+        decoder.feed(data[-1:])
+        assert decoder.get_value() == (["SET", "mango", "blueberry"], 39)
+
+    def test_multiple_commands_with_partial_tail(self):
+        decoder = RedisStreamDecoder()
+        decoder.feed(b"*1\r\n$4\r\nPING\r\n*2\r\n$3\r\nGET\r\n$1")
+        assert decoder.get_values() == [(["PING"], 14)]
+
+        decoder.feed(b"\r\nk\r\n")
+        assert decoder.get_values() == [(["GET", "k"], 20)]
+
+    def test_bulk_string_with_terminator_in_data(self):
+        decoder = RedisStreamDecoder()
+        decoder.feed(b"$4\r\na\r\nb\r\n")
+        assert decoder.get_value() == ("a\r\nb", 10)
+
+    def test_reply_types(self):
+        decoder = RedisStreamDecoder()
+        decoder.feed(b"+OK\r\n:12\r\n$-1\r\n-ERR bad\r\n")
+
+        assert decoder.get_value() == ("OK", 5)
+        assert decoder.get_value() == (12, 5)
+        assert decoder.get_value() == (None, 5)
+
+        error, length = decoder.get_value()
+        assert error.error_code == "ERR"
+        assert str(error) == "bad"
+        assert length == 10
+
+    def test_inline_command(self):
+        decoder = RedisStreamDecoder()
+        decoder.feed(b"PING\r\n")
+        assert decoder.get_value() == (["PING"], 6)
+
+    def test_file_followed_by_commands(self):
+        rdb = b"REDIS0011\xff\r\n\xfe\x00\xff12345678"
+        decoder = RedisStreamDecoder()
+        decoder.feed(b"+FULLRESYNC abc 0\r\n")
+        decoder.feed(f"${len(rdb)}\r\n".encode() + rdb[:5])
+
+        assert decoder.get_value() == ("FULLRESYNC abc 0", 19)
+        assert decoder.get_file() is None
+
+        decoder.feed(rdb[5:] + b"*1\r\n$4\r\nPING\r\n")
+        assert decoder.get_file() == (rdb, len(rdb) + 5)
+        assert decoder.get_values() == [(["PING"], 14)]
+
+
 class TestRedisEncoder:
 
     def test_simple_string(self):
@@ -0,0 +1,112 @@
+import asyncio
+import os
+
+import pytest
+import pytest_asyncio
+
+from app.database import get_database
+from app.exceptions import CrossSlotException
+from app.handler import RedisCommandHandler
+from app.protocol import RedisProtocol
+from app.serialiser import RedisEncoder
+from app.sharding import ShardRouter, shard_socket_path
+from app.slots import SLOT_COUNT
+
+encoder = RedisEncoder()
+
+# "bar" hashes to slot 5061 (shard 0 of 2), "foo" to slot 12182 (shard 1 of 2)
+LOCAL_KEY = "bar"
+REMOTE_KEY = "foo"
+
+
+class TestShardRouter:
+
+    def test_slot_ranges(self):
+        router = ShardRouter(0, 3, "test")
+
+        ranges = [router.get_slot_range(shard_id) for shard_id in range(3)]
+        assert ranges[0][0] == 0
+        assert ranges[-1][1] == SLOT_COUNT - 1
+
+        for shard_id, (first, last) in enumerate(ranges):
+            assert router.get_shard(first) == shard_id
+            assert router.get_shard(last) == shard_id
+
+    def test_get_owner(self):
+        router = ShardRouter(0, 2, "test")
+
+        assert router.get_owner("get", [LOCAL_KEY]) is None
+        assert router.get_owner("get", [REMOTE_KEY]) == 1
+        assert router.get_owner("ping", []) is None
+
+        with pytest.raises(CrossSlotException):
+            router.get_owner("xread", ["streams", LOCAL_KEY, REMOTE_KEY, "0-0", "0-0"])
+
+
+@pytest.mark.asyncio
+class TestShardForwarding:
+
+    @pytest_asyncio.fixture(autouse=True)
+    async def shard_server(self):
+        # Other shard runs in this process, so it shares our Database
+        port = f"test{os.getpid()}"
+        path = shard_socket_path(port, 1)
+        server = await asyncio.get_running_loop().create_unix_server(
+            lambda: RedisProtocol(forwarded=True), path
+        )
+
+        self.router = ShardRouter(0, 2, port)
+        self.handler = RedisCommandHandler()
+        self.handler.shard_router = self.router
+
+        yield
+
+        for client in self.router.clients.values():
+            client.close()
+        server.close()
+        await server.wait_closed()
+        os.unlink(path)
+        get_database().clear()
+
+    async def test_forward(self):
+        response = await self.handler.execute("set", [REMOTE_KEY, "value"])
+        assert response == b"+OK\r\n"
+        assert get_database().get(REMOTE_KEY) == "value"
+
+        response = await self.handler.execute("get", [REMOTE_KEY])
+        assert response == b"$5\r\nvalue\r\n"
+
+    async def test_local(self):
+        response = await self.handler.execute("set", [LOCAL_KEY, "value"])
+        assert response == "+OK\r\n"
+        assert not self.router.clients
+
+    async def test_cross_slot(self):
+        response = await self.handler.execute("xread", ["streams", LOCAL_KEY, REMOTE_KEY, "0-0", "0-0"])
+        assert response.startswith("-CROSSSLOT")
+
+    async def test_pipelined_forwarding(self):
+        responses = await asyncio.gather(
+            *(self.handler.execute("incr", [REMOTE_KEY]) for _ in range(50))
+        )
+        assert sorted(responses) == sorted(f":{idx}\r\n".encode() for idx in range(1, 51))
+        assert len(self.router.clients) == 1
+
+    async def test_broadcast(self):
+        get_database().set(REMOTE_KEY, "value")
+        assert await self.router.broadcast("keys", ["*"]) == [[REMOTE_KEY]]
+
+    async def test_scan(self):
+        for idx in range(50):
+            get_database().set(f"key{idx}", "value")
+
+        keys = []
+        cursor = "0"
+        while True:
+            (cursor, batch), _ = await self.handler._execute("scan", [cursor, "COUNT", "7"])
+            keys.extend(batch)
+            if cursor == "0":
+                break
+
+        # Other shard runs in this process, so every key is seen once per shard
+        assert sorted(keys) == sorted([f"key{idx}" for idx in range(50)] * 2)
@@ -0,0 +1,31 @@
+from app.slots import crc16, get_command_keys, key_hash_slot
+
+
+class TestSlots:
+
+    def test_crc16(self):
+        assert crc16(b"123456789") == 0x31C3
+
+    def test_key_hash_slot(self):
+        assert key_hash_slot("foo") == 12182
+        assert key_hash_slot("bar") == 5061
+
+    def test_hashtag(self):
+        assert key_hash_slot("{user1000}.following") == key_hash_slot("{user1000}.followers")
+        assert key_hash_slot("{user1000}.following") == key_hash_slot("user1000")
+
+        # Only the first hashtag counts, and an empty one is ignored
+        assert key_hash_slot("foo{}{bar}") == key_hash_slot("foo{}{bar}")
+        assert key_hash_slot("foo{}{bar}") != key_hash_slot("bar")
+        assert key_hash_slot("foo{{bar}}zap") == key_hash_slot("{bar")
+        assert key_hash_slot("foo{bar}{zap}") == key_hash_slot("bar")
+
+    def test_get_command_keys(self):
+        assert get_command_keys("set", ["key", "value", "px", "100"]) == ["key"]
+        assert get_command_keys("get", ["key"]) == ["key"]
+        assert get_command_keys("ping", []) == []
+        assert get_command_keys("get", []) == []
+
+    def test_get_command_keys_xread(self):
+        args = ["block", "100", "STREAMS", "s1", "s2", "0-0", "0-1"]
+        assert get_command_keys("xread", args) == ["s1", "s2"]
@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+from app.handler import RedisCommandHandler
+from app.slowlog import MAX_ARGC, SlowLog, get_slowlog, trim_args
+
+
+class TestSlowLog:
+
+    def test_trim_args(self):
+        assert trim_args(["set", "key", "value"]) == ["set", "key", "value"]
+
+        trimmed = trim_args(["set", "key", "x" * 200])
+        assert trimmed[2] == "x" * 128 + "... (72 more bytes)"
+
+        trimmed = trim_args(["del", *[f"key{idx}" for idx in range(99)]])
+        assert len(trimmed) == MAX_ARGC
+        assert trimmed[-1] == "... (69 more arguments)"
+
+    def test_ring_buffer(self):
+        os.environ["slowlog-max-len"] = "3"
+        try:
+            slowlog = SlowLog()
+        finally:
+            del os.environ["slowlog-max-len"]
+
+        for idx in range(5):
+            slowlog.add(["get", f"key{idx}"], 100 + idx, "127.0.0.1:5000")
+
+        assert len(slowlog) == 3
+        entries = slowlog.get()
+        assert [entry[0] for entry in entries] == [4, 3, 2]
+        assert entries[0][2:] == [104, ["get", "key4"], "127.0.0.1:5000", ""]
+        assert len(slowlog.get(1)) == 1
+
+        slowlog.reset()
+        slowlog.add(["get", "key"], 100)
+        assert slowlog.get()[0][0] == 5
+
+
+@pytest.mark.asyncio
+class TestSlowLogCommand:
+
+    @pytest.fixture(autouse=True)
+    def run_around_tests(self):
+        self.handler = RedisCommandHandler()
+        yield
+        get_slowlog().reset()
+        os.environ.pop("slowlog-log-slower-than", None)
+        get_slowlog().reload()
+
+    async def execute(self, *command):
+        return (await self.handler._execute(command[0].lower(), list(command[1:])))[0]
+
+    async def test_slowlog(self):
+        await self.execute("CONFIG", "SET", "slowlog-log-slower-than", "0")
+        await self.execute("SLOWLOG", "RESET")
+        await self.execute("SET", "key", "value")
+        await self.execute("GET", "key")
+
+        entries = await self.execute("SLOWLOG", "GET")
+        assert [entry[3] for entry in entries][:2] == [["get", "key"], ["set", "key", "value"]]
+        assert all(entry[2] >= 0 for entry in entries)
+
+        # SLOWLOG commands themselves are logged as well
+        assert await self.execute("SLOWLOG", "LEN") >= 3
+
+        await self.execute("CONFIG", "SET", "slowlog-log-slower-than", "-1")
+        await self.execute("SLOWLOG", "RESET")
+        await self.execute("GET", "key")
+        assert await self.execute("SLOWLOG", "LEN") == 0
+
+    async def test_blocking_not_logged(self):
+        await self.execute("CONFIG", "SET", "slowlog-log-slower-than", "0")
+        await self.execute("SLOWLOG", "RESET")
+        await self.execute("XREAD", "BLOCK", "1", "STREAMS", "stream", "0-0")
+
+        entries = await self.execute("SLOWLOG", "GET")
+        assert [entry[3] for entry in entries] == [["slowlog", "RESET"]]
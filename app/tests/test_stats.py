@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta
+import os
+
+import pytest
+
+from app.database import get_database
+from app.handler import RedisCommandHandler
+from app.stats import InstantaneousMetric, ServerStats, get_stats
+
+
+def parse_info(info: str) -> dict:
+    """
+    Fields of INFO, with the sections they are in
+    """
+    sections = {}
+    fields = None
+    for line in info.split("\r\n"):
+        if line.startswith("# "):
+            fields = sections[line[2:]] = {}
+        elif line:
+            key, value = line.split(":", 1)
+            fields[key] = value
+    return sections
+
+
+class TestServerStats:
+
+    def test_instantaneous_metric(self):
+        metric = InstantaneousMetric()
+        assert metric.get() == 0
+
+        metric.sample(10.0, 0)
+        metric.sample(10.1, 100)
+        metric.sample(10.2, 300)
+        assert metric.get() == pytest.approx(1500)
+
+    def test_command_stats(self):
+        stats = ServerStats()
+        stats.record_call("get", 10, False)
+        stats.record_call("get", 20, True)
+        stats.record_rejected("set")
+
+        assert stats.total_commands_processed == 2
+        assert stats.total_error_replies == 2
+        assert stats.commands["get"].format() == (
+            "calls=2,usec=30,usec_per_call=15.00,rejected_calls=0,failed_calls=1"
+        )
+        assert stats.commands["set"].calls == 0
+
+        stats.reset()
+        assert stats.total_commands_processed == 0
+        assert not stats.commands
+
+
+@pytest.mark.asyncio
+class TestInfo:
+
+    @pytest.fixture(autouse=True)
+    def run_around_tests(self):
+        self.handler = RedisCommandHandler()
+        get_stats().reset()
+        yield
+        get_database().clear()
+
+    async def info(self, *sections):
+        data, _ = await self.handler._execute("info", list(sections))
+        return parse_info(data)
+
+    async def test_default_sections(self):
+        sections = await self.info()
+        assert list(sections) == ["Server", "Clients", "Memory", "Stats", "Replication", "CPU", "Keyspace"]
+        assert sections["Server"]["redis_mode"] == "standalone"
+        assert sections["Memory"]["maxmemory_policy"] == "noeviction"
+
+        assert "Commandstats" in await self.info("all")
+        assert list(await self.info("memory", "STATS")) == ["Memory", "Stats"]
+        assert await self.info("unknown") == {}
+
+    async def test_stats(self):
+        await self.handler._execute("set", ["key", "value"])
+        await self.handler._execute("get", ["key"])
+        await self.handler._execute("get", ["missing"])
+        await self.handler._execute("incr", ["key"])
+        await self.handler._execute("unknown", [])
+
+        get_database().set("expired", "value", datetime.now() - timedelta(seconds=1))
+        await self.handler._execute("get", ["expired"])
+
+        stats = (await self.info("stats"))["Stats"]
+        assert stats["total_commands_processed"] == "5"
+        assert stats["keyspace_hits"] == "1"
+        assert stats["keyspace_misses"] == "2"
+        assert stats["expired_keys"] == "1"
+        # INCR of a string which is not a number, and the unknown command
+        assert stats["total_error_replies"] == "2"
+
+        commandstats = (await self.info("commandstats"))["Commandstats"]
+        assert commandstats["cmdstat_get"].startswith("calls=3,")
+        assert commandstats["cmdstat_incr"].endswith("rejected_calls=0,failed_calls=1")
+        assert "cmdstat_unknown" not in commandstats
+
+        assert (await self.info("keyspace"))["Keyspace"] == {"db0": "keys=1,expires=0,avg_ttl=0"}
+
+        await self.handler._execute("config", ["resetstat"])
+        # CONFIG RESETSTAT itself is counted, once it is done
+        assert list((await self.info("commandstats"))["Commandstats"]) == ["cmdstat_config"]
+        assert (await self.info("stats"))["Stats"]["keyspace_hits"] == "0"
+
+    async def test_latencystats(self):
+        await self.handler._execute("set", ["key", "value"])
+
+        latencystats = (await self.info("latencystats"))["Latencystats"]
+        assert set(latencystats["latency_percentiles_usec_set"].split(",")) == {
+            f"p{percentile}={get_stats().commands['set'].histogram.get_percentile(float(percentile)):.3f}"
+            for percentile in ("50", "99", "99.9")
+        }
+
+        response, _ = await self.handler._execute(
+            "config", ["set", "latency-tracking-info-percentiles", "50 101"]
+        )
+        assert str(response) == "Invalid argument: percentiles must be between 0 and 100"
+        # Value which was not valid is not kept
+        assert "latency-tracking-info-percentiles" not in os.environ
+
+        await self.handler._execute("config", ["set", "latency-tracking", "no"])
+        try:
+            await self.handler._execute("get", ["key"])
+            assert get_stats().commands["get"].histogram is None
+        finally:
+            os.environ.pop("latency-tracking")
+            get_stats().reload()
@@ -0,0 +1,44 @@
+from app.timer_wheel import TimerWheel
+
+
+class TestTimerWheel:
+
+    def test_due_items(self):
+        wheel = TimerWheel(now=100, slots=8)
+        wheel.add("a", 101.5)
+        wheel.add("b", 103)
+        wheel.add("c", 103)
+
+        assert wheel.advance(101) == []
+        assert wheel.advance(102) == ["a"]
+        assert sorted(wheel.advance(103)) == ["b", "c"]
+        assert len(wheel) == 0
+
+    def test_remove_and_move(self):
+        wheel = TimerWheel(now=0, slots=8)
+        wheel.add("a", 2)
+        wheel.add("b", 2)
+        wheel.remove("a")
+        # Moved further, it is not due when its old slot comes round
+        wheel.add("b", 5)
+
+        assert wheel.advance(3) == []
+        assert "b" in wheel and "a" not in wheel
+        assert wheel.advance(5) == ["b"]
+
+    def test_deadline_beyond_one_turn(self):
+        wheel = TimerWheel(now=0, slots=4)
+        wheel.add("a", 10)
+
+        for now in range(10):
+            assert wheel.advance(now) == []
+        assert wheel.advance(10) == ["a"]
+
+    def test_advance_more_than_one_turn(self):
+        wheel = TimerWheel(now=0, slots=4)
+        wheel.add("a", 1)
+        wheel.add("b", 100)
+
+        assert wheel.advance(50) == ["a"]
+        assert wheel.advance(99) == []
+        assert wheel.advance(100) == ["b"]
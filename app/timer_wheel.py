@@ -0,0 +1,75 @@
+"""
+Timer wheel, for deadlines of many items which keep moving (idle timeouts of clients).
+
+Time is cut into ticks of resolution seconds, and the wheel has a slot (a set of
+items) for every tick of one turn. Adding or removing an item is O(1), and
+advancing the wheel only looks at the slots of the ticks which passed.
+
+Deadlines are not moved when they change. An item whose slot comes round before
+its deadline is put back into the slot of its deadline, so pushing a deadline
+forward costs nothing until then. Deadlines more than one turn away work the
+same way, the item goes round the wheel till it is due.
+"""
+
+DEFAULT_WHEEL_SLOTS = 64
+
+
+class TimerWheel:
+
+    def __init__(self, now: float, slots: int = DEFAULT_WHEEL_SLOTS, resolution: float = 1.0):
+        self.resolution = resolution
+        self.slots = [set() for _ in range(slots)]
+        # Next tick to be advanced over
+        self.tick = int(now // resolution)
+        # Item -> (deadline, slot index)
+        self.items = {}
+
+    def _place(self, item, deadline: float, min_tick: int):
+        index = max(int(deadline // self.resolution), min_tick) % len(self.slots)
+        self.slots[index].add(item)
+        self.items[item] = (deadline, index)
+
+    def add(self, item, deadline: float):
+        """
+        Add item, or move it to another deadline
+        """
+        self.remove(item)
+        self._place(item, deadline, self.tick)
+
+    def remove(self, item):
+        entry = self.items.pop(item, None)
+        if entry is not None:
+            self.slots[entry[1]].discard(item)
+
+    def advance(self, now: float) -> list:
+        """
+        Move on to now, and remove and return the items which are due
+        """
+
+        target = int(now // self.resolution)
+        count = len(self.slots)
+        due = []
+
+        # Every slot once at most, even if more than a turn passed
+        for tick in range(max(self.tick, target - count + 1), target + 1):
+            index = tick % count
+            slot = self.slots[index]
+            if not slot:
+                continue
+
+            self.slots[index] = set()
+            for item in slot:
+                deadline, _ = self.items.pop(item)
+                if deadline <= now:
+                    due.append(item)
+                else:
+                    self._place(item, deadline, target + 1)
+
+        self.tick = max(self.tick, target + 1)
+        return due
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item in self.items
@@ -0,0 +1,10 @@
+"""
+Benchmarks of the server, kept apart from the tests.
+
+    python -m benchmarks.micro   Microbenchmarks of the parser, encoder, keyspace and RDB parser
+    python -m benchmarks.load    Load generator, like redis-benchmark, against a server
+    python -m benchmarks.compare Compare the JSON results of two runs, for example two commits
+
+Every benchmark writes its results as JSON (--output), along with the commit
+and Python it ran on, so runs of different commits can be compared.
+"""
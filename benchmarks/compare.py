@@ -0,0 +1,86 @@
+"""
+Compare the JSON results of two benchmark runs, for example before and after a change.
+
+    python -m benchmarks.compare before.json after.json [--threshold 10]
+
+Exits with status 1 if any benchmark got slower by more than threshold percent:
+higher ns/op of microbenchmarks, lower throughput or higher p99 of the load generator.
+"""
+
+import argparse
+import json
+import sys
+
+
+def get_figures(result: dict) -> dict:
+    """
+    Figures of a result to compare, name -> (value, True if higher is better)
+    """
+    if "ns_per_op" in result:
+        return {"ns_per_op": (result["ns_per_op"], False)}
+
+    figures = {"ops_per_sec": (result["ops_per_sec"], True)}
+    if "p99" in result.get("latency_ms", {}):
+        figures["p99_ms"] = (result["latency_ms"]["p99"], False)
+    return figures
+
+
+def compare(before: dict, after: dict, threshold: float):
+    """
+    Returns:
+        list: Lines of the report
+        bool: Anything regressed more than threshold percent
+    """
+
+    previous = {result["name"]: result for result in before["results"]}
+    lines = [f"{'benchmark':<40} {'figure':<12} {'before':>14} {'after':>14} {'change':>9}"]
+    regressed = False
+
+    for result in after["results"]:
+        old = previous.get(result["name"])
+        if old is None:
+            continue
+
+        old_figures = get_figures(old)
+        for figure, (value, higher_is_better) in get_figures(result).items():
+            if figure not in old_figures or not old_figures[figure][0]:
+                continue
+
+            old_value = old_figures[figure][0]
+            change = (value - old_value) / old_value * 100
+            worse = -change if higher_is_better else change
+
+            marker = ""
+            if worse > threshold:
+                marker = " !"
+                regressed = True
+
+            lines.append(
+                f"{result['name']:<40} {figure:<12} {old_value:>14} {value:>14} {change:>+8.1f}%{marker}"
+            )
+
+    return lines, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark results")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument(
+        "--threshold", type=float, default=10,
+        help="Percent a benchmark may get slower before it counts as a regression. Default is 10")
+    args = parser.parse_args()
+
+    with open(args.before, encoding="utf-8") as fd:
+        before = json.load(fd)
+    with open(args.after, encoding="utf-8") as fd:
+        after = json.load(fd)
+
+    print(f"before {before.get('commit') or '?'}, after {after.get('commit') or '?'}")
+    lines, regressed = compare(before, after, args.threshold)
+    print("\n".join(lines))
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Synthetic data for the benchmarks: keys, values, streams and RDB files
+"""
+
+import random
+import string
+import time
+
+from app.database import Stream
+from app.rdb.parser import (
+    REDIS_DB_SELECTOR, REDIS_EOF, REDIS_EXPIRY_MS, REDIS_HASH_TABLE, REDIS_METADATA, STRING_ENCODING
+)
+
+
+def random_value(size: int, rng: random.Random = random) -> str:
+    return "".join(rng.choices(string.ascii_letters + string.digits, k=size))
+
+
+def make_key(index: int) -> str:
+    return f"key:{index:012d}"
+
+
+def make_stream(entries: int, fields: int = 2, value_size: int = 8) -> Stream:
+    """
+    Stream of entries with IDs 1-0, 2-0, ..., the way XADD stores them
+    """
+    value = "x" * value_size
+    stream = Stream()
+    for index in range(1, entries + 1):
+        stream[f"{index}-0"] = {f"field{field}": value for field in range(fields)}
+    return stream
+
+
+def encode_rdb_length(length: int) -> bytes:
+    # RDBParser does not read the 14 bit length encoding, so lengths are 6 or 32 bit
+    if length < 1 << 6:
+        return bytes([length])
+    return b"\x80" + length.to_bytes(4, "big")
+
+
+def encode_rdb_string(value: str) -> bytes:
+    data = value.encode("utf-8")
+    return encode_rdb_length(len(data)) + data
+
+
+def build_rdb(keys: int, value_size: int = 16, expiring: float = 0, databases: int = 1) -> bytes:
+    """
+    RDB file with keys string keys in every database, expiring of them (a fraction) with an expiry
+    """
+
+    expiring_keys = int(keys * expiring)
+    expires_at = int((time.time() + 3600) * 1000).to_bytes(8, "little")
+    value = encode_rdb_string("v" * value_size)
+
+    parts = [
+        b"REDIS0011",
+        bytes([REDIS_METADATA]), encode_rdb_string("redis-ver"), encode_rdb_string("7.2.0"),
+    ]
+
+    for db_index in range(databases):
+        parts.extend([
+            bytes([REDIS_DB_SELECTOR]), encode_rdb_length(db_index),
+            bytes([REDIS_HASH_TABLE]), encode_rdb_length(keys), encode_rdb_length(expiring_keys),
+        ])
+        for index in range(keys):
+            if index < expiring_keys:
+                parts.append(bytes([REDIS_EXPIRY_MS]) + expires_at)
+            parts.append(bytes([STRING_ENCODING]) + encode_rdb_string(make_key(index)) + value)
+
+    # Checksum is not verified on load
+    parts.append(bytes([REDIS_EOF]) + bytes(8))
+    return b"".join(parts)
@@ -0,0 +1,167 @@
+"""
+Memory footprint of the keyspace: bytes per key and per stream entry.
+
+    python -m benchmarks.footprint [--keys 100000] [--value-size 16] [--streams 100]
+        [--entries 1000] [--thresholds benchmarks/footprint_thresholds.json] [--output footprint.json]
+
+Every scenario loads a fresh Database the way commands do (Database.set,
+Database.add_stream) and measures what it took, with tracemalloc (exact
+Python allocations) and the resident memory of the process (what the OS
+sees, which allocator arenas make noisy). The estimate the server keeps for
+maxmemory (Database.used_memory) is reported next to them.
+
+Overhead is what a key or entry takes beyond the bytes of its key and value,
+which does not change with their sizes. Thresholds are set on the overhead
+(by tracemalloc), and the run fails if any scenario goes over them. Any change
+to how app/database.py stores keys should be checked with this.
+
+Strings and streams are the only types the server has.
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+from datetime import datetime, timedelta
+
+from app.database import Database
+from app.memory import get_process_memory
+from benchmarks.datasets import make_key
+from benchmarks.results import write_results
+
+DEFAULT_THRESHOLDS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "footprint_thresholds.json")
+
+
+class Footprint:
+    """
+    Memory allocated from start() to stop()
+    """
+
+    def start(self):
+        gc.collect()
+        self.traced_before = tracemalloc.get_traced_memory()[0]
+        self.rss_before = get_process_memory()[0]
+
+    def stop(self):
+        gc.collect()
+        self.traced = tracemalloc.get_traced_memory()[0] - self.traced_before
+        self.rss = get_process_memory()[0] - self.rss_before
+
+
+def make_value(index: int, size: int) -> str:
+    # Every key gets a string of its own, as values read off the network do
+    return f"{index:0{size}d}"[-size:]
+
+
+def load_strings(db: Database, keys: int, value_size: int, ttl: bool) -> int:
+    """
+    Returns:
+        int: Bytes of keys and values
+    """
+    expires = datetime.now() + timedelta(hours=1) if ttl else None
+    payload = 0
+    for index in range(keys):
+        key = make_key(index)
+        db.set(key, make_value(index, value_size), expires)
+        payload += len(key) + value_size
+    return payload
+
+
+def load_streams(db: Database, streams: int, entries: int, value_size: int) -> int:
+    payload = 0
+    for stream in range(streams):
+        key = f"stream:{stream}"
+        for index in range(1, entries + 1):
+            value = make_value(index, value_size)
+            db.add_stream(key, f"{index}-0", "field", value)
+            payload += len(f"{index}-0") + len("field") + value_size
+    return payload
+
+
+def measure_scenario(name: str, unit: str, count: int, load) -> dict:
+    db = Database()
+    footprint = Footprint()
+
+    footprint.start()
+    payload = load(db)
+    footprint.stop()
+
+    result = {
+        "name": name,
+        "count": count,
+        f"bytes_per_{unit}": round(footprint.traced / count, 1),
+        f"overhead_per_{unit}": round((footprint.traced - payload) / count, 1),
+        f"rss_bytes_per_{unit}": round(footprint.rss / count, 1),
+        f"estimated_bytes_per_{unit}": round(db.used_memory / count, 1),
+        "estimate_ratio": round(db.used_memory / footprint.traced, 3) if footprint.traced else 0,
+    }
+
+    # Freed before the next scenario, so it does not count there
+    del db
+    gc.collect()
+    return result
+
+
+def run(keys: int, value_size: int, streams: int, entries: int) -> list:
+    tracemalloc.start()
+    try:
+        return [
+            measure_scenario("string", "key", keys, lambda db: load_strings(db, keys, value_size, False)),
+            measure_scenario("string_ttl", "key", keys, lambda db: load_strings(db, keys, value_size, True)),
+            measure_scenario(
+                "stream", "entry", streams * entries,
+                lambda db: load_streams(db, streams, entries, value_size),
+            ),
+        ]
+    finally:
+        tracemalloc.stop()
+
+
+def check_thresholds(results: list, thresholds: dict) -> list:
+    """
+    Returns:
+        list: Descriptions of the figures which are over their threshold
+    """
+
+    failures = []
+    for result in results:
+        for figure, limit in thresholds.get(result["name"], {}).items():
+            value = result.get(figure)
+            if value is not None and value > limit:
+                failures.append(f"{result['name']} {figure} is {value}, threshold is {limit}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes per key and per stream entry of the keyspace")
+    parser.add_argument("--keys", type=int, default=100_000, help="String keys to load. Default is 100000")
+    parser.add_argument("--value-size", type=int, default=16, help="Bytes of every value. Default is 16")
+    parser.add_argument("--streams", type=int, default=100, help="Streams to load. Default is 100")
+    parser.add_argument("--entries", type=int, default=1000, help="Entries of every stream. Default is 1000")
+    parser.add_argument(
+        "--thresholds", default=DEFAULT_THRESHOLDS,
+        help="JSON of scenario -> figure -> highest allowed value. Default is footprint_thresholds.json")
+    parser.add_argument("--output", help="Write the JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    if min(args.keys, args.value_size, args.streams, args.entries) < 1:
+        parser.error("--keys, --value-size, --streams and --entries must be at least 1")
+
+    results = run(args.keys, args.value_size, args.streams, args.entries)
+    write_results(
+        "footprint", results, args.output,
+        keys=args.keys, value_size=args.value_size, streams=args.streams, entries=args.entries,
+    )
+
+    with open(args.thresholds, encoding="utf-8") as fd:
+        failures = check_thresholds(results, json.load(fd))
+
+    for failure in failures:
+        print(f"Over threshold: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Load generator, like redis-benchmark, reporting throughput and latency percentiles.
+
+    python -m benchmarks.load [--clients 50] [--requests 100000] [--pipeline 1]
+        [--keyspace 10000] [--data-size 3] [--mix set=1,get=1] [--output load.json]
+
+Without --port, a server is started on a free local port for the run, and
+stopped afterwards. Latency of a request is from the moment its pipeline was
+written till its reply was read, same as redis-benchmark measures it.
+
+Client and server share the CPUs of the machine, so compare runs of the same machine only.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+from app.exceptions import RedisException
+from app.serialiser import RedisEncoder, RedisStreamDecoder
+from benchmarks.datasets import make_key, random_value
+from benchmarks.results import get_percentiles, write_results
+
+READ_SIZE = 64 * 1024
+
+# Seconds to wait for a spawned server to accept connections
+SERVER_START_TIMEOUT = 10
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_command(name: str, key: str, value: str) -> list:
+    commands = {
+        "set": ["SET", key, value],
+        "get": ["GET", key],
+        "incr": ["INCR", f"counter:{key}"],
+        "xadd": ["XADD", f"stream:{key[-1]}", "*", "field", value],
+        "ping": ["PING"],
+    }
+    return commands[name]
+
+
+COMMANDS = ("set", "get", "incr", "xadd", "ping")
+
+
+def parse_mix(mix: str) -> dict:
+    """
+    Weights of the commands to send, set=1,get=9 sends 9 GETs for every SET
+    """
+
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip().lower()
+        if name not in COMMANDS:
+            raise ValueError(f"Unknown command {name}, supported are {', '.join(COMMANDS)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+class LoadGenerator:
+
+    def __init__(self, host, port, clients, requests, pipeline, keyspace, data_size, mix):
+        self.host = host
+        self.port = port
+        self.clients = clients
+        self.remaining = requests
+        self.pipeline = pipeline
+        self.keyspace = keyspace
+        self.value = random_value(data_size)
+        self.names = list(mix)
+        self.weights = list(mix.values())
+        self.encoder = RedisEncoder()
+
+        # Command -> latencies in seconds
+        self.latencies = {name: [] for name in mix}
+        self.errors = 0
+
+    def encode(self, name: str, key: str) -> bytes:
+        return self.encoder.encode_array(build_command(name, key, self.value)).encode()
+
+    async def populate(self):
+        """
+        SET every key of the keyspace, so that GETs hit
+        """
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        decoder = RedisStreamDecoder()
+        batch = 1000
+        for start in range(0, self.keyspace, batch):
+            keys = range(start, min(start + batch, self.keyspace))
+            writer.write(b"".join(self.encode("set", make_key(index)) for index in keys))
+            await self.read_replies(reader, decoder, len(keys))
+        writer.close()
+
+    @staticmethod
+    async def read_replies(reader, decoder, count: int) -> list:
+        replies = []
+        while len(replies) < count:
+            data = await reader.read(READ_SIZE)
+            if not data:
+                raise ConnectionError("Server closed the connection")
+            decoder.feed(data)
+            replies.extend(decoder.get_values())
+        return replies
+
+    async def run_client(self, rng: random.Random):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        decoder = RedisStreamDecoder()
+
+        try:
+            while self.remaining > 0:
+                count = min(self.pipeline, self.remaining)
+                self.remaining -= count
+
+                names = rng.choices(self.names, self.weights, k=count)
+                payload = b"".join(
+                    self.encode(name, make_key(rng.randrange(self.keyspace))) for name in names
+                )
+
+                start = time.perf_counter()
+                writer.write(payload)
+
+                received = 0
+                while received < count:
+                    data = await reader.read(READ_SIZE)
+                    if not data:
+                        raise ConnectionError("Server closed the connection")
+                    decoder.feed(data)
+                    replies = decoder.get_values()
+
+                    now = time.perf_counter()
+                    for name, (reply, _) in zip(names[received:], replies):
+                        self.latencies[name].append(now - start)
+                        if isinstance(reply, RedisException):
+                            self.errors += 1
+                    received += len(replies)
+        finally:
+            writer.close()
+
+    async def run(self, seed: int = 0) -> float:
+        """
+        Send all the requests, return how many seconds it took
+        """
+        start = time.perf_counter()
+        await asyncio.gather(*(self.run_client(random.Random(seed + idx)) for idx in range(self.clients)))
+        return time.perf_counter() - start
+
+    def get_results(self, elapsed: float) -> list:
+        def summary(name, latencies):
+            requests = len(latencies)
+            return {
+                "name": name,
+                "requests": requests,
+                "ops_per_sec": round(requests / elapsed) if elapsed else 0,
+                "latency_ms": {
+                    key: round(value * 1000, 3) for key, value in get_percentiles(latencies).items()
+                },
+            }
+
+        results = [summary("load.all", [value for values in self.latencies.values() for value in values])]
+        results[0]["errors"] = self.errors
+        results.extend(summary(f"load.{name}", latencies) for name, latencies in self.latencies.items())
+        return results
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for_server(host: str, port: int):
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+        else:
+            writer.close()
+            return
+
+
+def start_server(port: int, server_args: list) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "app.main", "--port", str(port), *server_args],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def run_benchmark(args) -> list:
+    mix = parse_mix(args.mix)
+    generator = LoadGenerator(
+        args.host, args.port, args.clients, args.requests, args.pipeline, args.keyspace, args.data_size, mix,
+    )
+
+    if not args.no_populate and ("get" in mix):
+        await generator.populate()
+
+    elapsed = await generator.run()
+    return generator.get_results(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator, reports throughput and latency percentiles")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, help="Server to benchmark. Without it, one is started for the run")
+    parser.add_argument("--clients", type=int, default=50, help="Parallel connections. Default is 50")
+    parser.add_argument("--requests", type=int, default=100_000, help="Total requests. Default is 100000")
+    parser.add_argument("--pipeline", type=int, default=1, help="Requests per pipeline. Default is 1")
+    parser.add_argument("--keyspace", type=int, default=10_000, help="Keys used at random. Default is 10000")
+    parser.add_argument("--data-size", type=int, default=3, help="Bytes of SET and XADD values. Default is 3")
+    parser.add_argument("--mix", default="set=1,get=1", help="Commands and their weights. Default is set=1,get=1")
+    parser.add_argument("--no-populate", action="store_true", help="Do not SET the keyspace before GETs")
+    parser.add_argument("--server-args", default="", help="Options of the server started for the run")
+    parser.add_argument("--output", help="Write the JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    try:
+        parse_mix(args.mix)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    server = None
+    if args.port is None:
+        args.port = get_free_port()
+        server = start_server(args.port, args.server_args.split())
+
+    try:
+        if server is not None:
+            asyncio.run(wait_for_server(args.host, args.port))
+        results = asyncio.run(run_benchmark(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    write_results(
+        "load", results, args.output,
+        clients=args.clients, pipeline=args.pipeline, keyspace=args.keyspace,
+        data_size=args.data_size, mix=args.mix, server_args=args.server_args,
+    )
+
+
+if __name__ == "__main__":
+    main()
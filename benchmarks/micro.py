@@ -0,0 +1,171 @@
+"""
+Microbenchmarks of the hot paths which do not need a running server.
+
+    python -m benchmarks.micro [--filter database] [--scale 0.1] [--output micro.json]
+
+Every benchmark reports the best ns/op of a few repeats, see benchmarks.results.
+"""
+
+import argparse
+from itertools import cycle
+
+from app.database import Database
+from app.offload import match_keys
+from app.pattern import compile_pattern
+from app.rdb.parser import RDBParser
+from app.serialiser import RedisDecoder, RedisEncoder, RedisStreamDecoder
+from app.utils import StreamUtils
+from benchmarks.datasets import build_rdb, make_key, make_stream, random_value
+from benchmarks.results import measure, write_results
+
+# Keys of the keyspace Database benchmarks work on
+KEYSPACE_SIZE = 10_000
+
+# Keys of the keyspace KEYS and SCAN MATCH benchmarks work on
+LARGE_KEYSPACE_SIZE = 1_000_000
+
+
+def bench_decoder(scale: float) -> list:
+    encoder = RedisEncoder()
+    command = encoder.encode_array(["SET", "key:000000000001", random_value(32)])
+
+    pipeline = (command * 100).encode()
+    stream_decoder = RedisStreamDecoder()
+
+    def decode_pipeline():
+        stream_decoder.feed(pipeline)
+        stream_decoder.get_values()
+
+    return [
+        measure("decoder.decode_set", lambda: RedisDecoder().decode(command), int(100_000 * scale)),
+        # One op is a pipeline of 100 commands
+        measure("stream_decoder.pipeline_100_set", decode_pipeline, int(2_000 * scale), commands=100),
+    ]
+
+
+def bench_encoder(scale: float) -> list:
+    encoder = RedisEncoder()
+    value = random_value(32)
+    stream = make_stream(10)
+    reply = [[stream_id, [item for pair in fields.items() for item in pair]] for stream_id, fields in stream.items()]
+
+    return [
+        measure("encoder.bulk_string", lambda: encoder.encode_bulk_string(value), int(500_000 * scale)),
+        measure("encoder.integer", lambda: encoder.encode_integer(12345), int(500_000 * scale)),
+        measure("encoder.xrange_10_entries", lambda: encoder.encode_array(reply), int(50_000 * scale)),
+    ]
+
+
+def bench_database(scale: float) -> list:
+    db = Database()
+    keys = [make_key(index) for index in range(KEYSPACE_SIZE)]
+    value = random_value(32)
+    for key in keys:
+        db.set(key, value)
+
+    next_key = cycle(keys).__next__
+    missing = cycle([f"missing:{index}" for index in range(KEYSPACE_SIZE)]).__next__
+
+    new_db = Database()
+    new_keys = iter(make_key(index) for index in range(10 ** 9))
+
+    return [
+        measure("database.get_hit", lambda: db.get(next_key()), int(300_000 * scale)),
+        measure("database.get_miss", lambda: db.get(missing()), int(300_000 * scale)),
+        measure("database.set_existing", lambda: db.set(next_key(), value), int(300_000 * scale)),
+        measure("database.set_new", lambda: new_db.set(next(new_keys), value), int(100_000 * scale)),
+    ]
+
+
+def bench_keys(scale: float) -> list:
+    value = random_value(32)
+    db = Database({make_key(index): {"value": value, "expires_at": None} for index in range(LARGE_KEYSPACE_SIZE)})
+
+    def keys(pattern):
+        # Same lookup as the KEYS command, without the event loop around it
+        compiled = compile_pattern(pattern)
+        if compiled.is_prefix:
+            return db.get_keys_with_prefix(compiled.prefix)
+        return match_keys(db.get_keys_with_prefix(compiled.prefix) if compiled.prefix else list(db), pattern)
+
+    def scan_match(pattern):
+        cursor = 0
+        while True:
+            cursor, keys = db.scan(cursor, 1000)
+            match_keys(keys, pattern)
+            if cursor == 0:
+                return
+
+    # 100 keys of the million: key:000000001200 to key:000000001299
+    prefix = make_key(1200)[:-2]
+
+    return [
+        measure("keys.prefix_100_of_1000000", lambda: keys(f"{prefix}*"), int(10_000 * scale)),
+        measure("keys.prefix_pattern_10_of_1000000", lambda: keys(f"{prefix}?0"), int(10_000 * scale)),
+        measure("keys.all_pattern_1000000", lambda: keys("*12*0"), max(1, int(3 * scale)), repeat=3),
+        # One op is a whole SCAN of the keyspace, COUNT 1000
+        measure("scan.match_prefix_1000000", lambda: scan_match(f"{prefix}*"), max(1, int(3 * scale)), repeat=3),
+    ]
+
+
+def bench_streams(scale: float) -> list:
+    stream = make_stream(10_000)
+
+    return [
+        measure(
+            "stream.range_100_of_10000",
+            lambda: StreamUtils.get_single_stream("5000-0", "5099-0", stream), int(200 * scale),
+        ),
+        measure(
+            "stream.range_all_10000",
+            lambda: StreamUtils.get_single_stream("0-0", "10000-0", stream), int(20 * scale),
+        ),
+    ]
+
+
+def bench_rdb(scale: float) -> list:
+    keys = 10_000
+    plain = build_rdb(keys)
+    expiring = build_rdb(keys, expiring=0.5)
+
+    return [
+        measure("rdb.parse_10000_keys", lambda: RDBParser(data=plain), max(1, int(10 * scale)), keys=keys),
+        measure(
+            "rdb.parse_10000_keys_half_expiring", lambda: RDBParser(data=expiring), max(1, int(10 * scale)),
+            keys=keys,
+        ),
+    ]
+
+
+BENCHMARKS = {
+    "decoder": bench_decoder,
+    "encoder": bench_encoder,
+    "database": bench_database,
+    "keys": bench_keys,
+    "streams": bench_streams,
+    "rdb": bench_rdb,
+}
+
+
+def run(names=None, scale: float = 1.0) -> list:
+    results = []
+    for name, bench in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        results.extend(bench(scale))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the server internals")
+    parser.add_argument("--filter", action="append", choices=sorted(BENCHMARKS), help="Run only these groups")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplies the iterations, 0.1 for a quick run")
+    parser.add_argument("--output", help="Write the JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    results = run(args.filter, max(args.scale, 0.001))
+    write_results("micro", results, args.output, scale=args.scale)
+
+
+if __name__ == "__main__":
+    main()
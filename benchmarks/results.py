@@ -0,0 +1,88 @@
+"""
+Timing and JSON results shared by the benchmarks
+"""
+
+from datetime import datetime, timezone
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+
+def get_commit() -> str:
+    """
+    Commit the benchmarks ran on, empty if it is not known
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def get_metadata() -> dict:
+    return {
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def measure(name: str, func, number: int, repeat: int = 5, **info) -> dict:
+    """
+    Time number calls of func, repeat times. Best of the repeats is the figure
+    to compare, others only add noise of whatever else ran meanwhile.
+    """
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter_ns() - start) / number)
+
+    return {
+        "name": name,
+        "number": number,
+        "repeat": repeat,
+        "ns_per_op": round(min(timings), 1),
+        "median_ns_per_op": round(statistics.median(timings), 1),
+        "ops_per_sec": round(1e9 / min(timings)),
+        **info,
+    }
+
+
+def get_percentiles(latencies: list, percentiles=(50, 95, 99, 99.9)) -> dict:
+    """
+    Exact percentiles of a list of latencies, sorted in place
+    """
+
+    latencies.sort()
+    if not latencies:
+        return {}
+
+    result = {}
+    for percentile in percentiles:
+        index = max(0, -int(-percentile * len(latencies) // 100) - 1)
+        result[f"p{percentile:g}"] = latencies[index]
+    result["max"] = latencies[-1]
+    return result
+
+
+def write_results(kind: str, results: list, output: str = None, **info):
+    """
+    Write the results as JSON to output, stdout without one
+    """
+
+    document = {"kind": kind, **get_metadata(), **info, "results": results}
+    data = json.dumps(document, indent=2)
+
+    if output:
+        with open(output, "w", encoding="utf-8") as fd:
+            fd.write(data + "\n")
+    else:
+        sys.stdout.write(data + "\n")